@@ -57,18 +57,28 @@ from config import (
     # 日志配置
     LOG_LEVEL,
     LOG_FORMAT,
+    LOG_ASYNC,
+    LOG_JSON_EVENTS,
     
     # 音频配置
-    AUDIO_INPUT_DEVICE_INDEX
+    AUDIO_INPUT_DEVICE_INDEX,
+
+    # VAD配置
+    VAD_ENERGY_THRESHOLD_DB,
+    VAD_ENERGY_MARGIN_DB,
+    VAD_FLATNESS_THRESHOLD,
+    VAD_HANGOVER_MS,
+    VAD_PREROLL_MS
 )
 
-# 配置日志
-logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
+# 配置日志（异步队列写出）
+from log_utils import setup_logging
+setup_logging(LOG_LEVEL, LOG_FORMAT, async_io=LOG_ASYNC, json_events=LOG_JSON_EVENTS)
 
 # 导入客户端和分析模块
 from xfyun_spark_client import SparkClient
 from xfyun_tts_client import XfyunTTSClient
-from voice_analyzer import VoiceAnalyzer
+from voice_analyzer import VoiceAnalyzer, VoiceActivityDetector
 from error_handler import ErrorHandler, ComponentHealthMonitor
 from xfyun_asr_client import XfyunASRClient
 
@@ -285,8 +295,17 @@ class InterviewSession:
             FORMAT = pyaudio.paInt16
             CHANNELS = 1
             RATE = 16000
-            SILENCE_THRESHOLD = 300
-            SILENCE_SECONDS = 2
+            SILENCE_SECONDS = 1.5  # VAD拖尾结束后再等待的静音时长
+            
+            # 语音活动检测：只上传有效语音，拖尾结束即认为回答完毕
+            vad = VoiceActivityDetector(
+                sample_rate=RATE,
+                energy_threshold_db=VAD_ENERGY_THRESHOLD_DB,
+                energy_margin_db=VAD_ENERGY_MARGIN_DB,
+                flatness_threshold=VAD_FLATNESS_THRESHOLD,
+                hangover_ms=VAD_HANGOVER_MS,
+                preroll_ms=VAD_PREROLL_MS
+            )
             
             # 初始化音频输入
             audio = pyaudio.PyAudio()
@@ -301,6 +320,7 @@ class InterviewSession:
             
             # 重置ASR客户端状态
             self.asr_client.final_result_received_event.clear()
+            self.asr_client.start_accumulate()
             
             # 发送ASR起始帧
             self.asr_client.send_audio(b'', status=0)
@@ -312,20 +332,21 @@ class InterviewSession:
             # 开始录音并发送到ASR
             for i in range(0, int(RATE / CHUNK * max_seconds)):
                 data = stream.read(CHUNK)
-                audio_data = np.frombuffer(data, dtype=np.int16)
+                vad_result = vad.process(data)
                 
                 # 检测是否有语音
-                if np.abs(audio_data).mean() > SILENCE_THRESHOLD:
+                if vad_result['speech_started']:
                     has_speech = True
                 
-                # 发送音频帧到ASR
-                self.asr_client.send_audio(data, status=1)
+                # 只把有效语音帧发送到ASR，首尾静音不上传
+                if vad_result['audio']:
+                    self.asr_client.send_audio(vad_result['audio'], status=1)
                 
-                # 检测静音
-                if np.abs(audio_data).mean() < SILENCE_THRESHOLD:
-                    silence_count += 1
-                else:
+                # 检测静音（VAD拖尾结束后开始计数）
+                if vad_result['in_speech']:
                     silence_count = 0
+                else:
+                    silence_count += 1
                 
                 # 静音超时或达到最大时间，停止录音
                 if silence_count > (SILENCE_SECONDS * RATE / CHUNK) and has_speech:
@@ -391,7 +412,7 @@ class InterviewSession:
                 {"role": "user", "content": user_input}
             ]
             
-            ai_reply = self.spark_client.send_message(messages)
+            ai_reply = self.spark_client.send_message(messages, endpoint="interview_question")
             if not ai_reply:
                 ai_reply = "AI未能生成回复，请稍后重试。"
             
@@ -1,12 +1,17 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 from flask_socketio import SocketIO, emit
 import threading
 import queue
 import logging
+from log_utils import setup_logging, log_event
+import metrics
+import time
+from tracing import tracer
 from xfyun_spark_client import SparkClient
 from xfyun_tts_client import XfyunTTSClient
 from xfyun_asr_client import XfyunASRClient
-from voice_analyzer import VoiceAnalyzer
+from voice_analyzer import VoiceAnalyzer, VoiceActivityDetector
+from audio_codec import AudioStreamDecoder, negotiate_codec, CODEC_PCM
 from interview_logic import InterviewLogic
 from config import (
     SPARK_HTTP_API_PASSWORD,
@@ -19,27 +24,90 @@ from config import (
     XFYUN_TTS_API_SECRET,
     XFYUN_TTS_VOICE_NAME,
     XFYUN_TTS_AUE_FORMAT,
-    XFYUN_TTS_AUF_RATE
+    XFYUN_TTS_AUF_RATE,
+    XFYUN_ASR_URL,
+    XFYUN_TTS_URL,
+    SPARK_API_URL,
+    VAD_ENERGY_THRESHOLD_DB,
+    VAD_ENERGY_MARGIN_DB,
+    VAD_FLATNESS_THRESHOLD,
+    VAD_HANGOVER_MS,
+    VAD_PREROLL_MS,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_ASYNC,
+    LOG_JSON_EVENTS,
+    EVALUATION_WORKERS,
+    EVALUATION_RESULTS_DIR,
+    TURN_EVALUATION_ENABLED,
+    TURN_EVALUATION_WORKERS,
+    TURN_EVALUATION_WAIT_SECONDS,
+    STORAGE_DB_PATH,
+    STORAGE_BATCH_SIZE,
+    STORAGE_FLUSH_INTERVAL,
+    STORAGE_CACHE_SESSIONS,
+    STORAGE_CACHE_EMOTIONS,
+    AUDIO_ARCHIVE_DIR,
+    AUDIO_ARCHIVE_SEGMENT_MB,
+    AUDIO_ARCHIVE_RETENTION_SECONDS,
+    XFYUN_LFASR_APPID,
+    XFYUN_LFASR_SECRET_KEY,
+    XFYUN_LFASR_UPLOAD_URL,
+    XFYUN_LFASR_RESULT_URL,
+    LFASR_BATCH_ENABLED,
+    LFASR_BATCH_WORKERS,
+    LFASR_PART_SECONDS,
+    LFASR_UPLOAD_RETRIES,
+    LFASR_TIMEOUT_SECONDS,
+    LFASR_WAIT_SECONDS,
+    VISION_WORKERS,
+    VISION_SLOTS,
+    VISION_SLOT_BYTES,
+    VISION_TIMEOUT_SECONDS,
+    VOICE_WORKERS,
+    VOICE_MAX_PENDING,
+    VOICE_SUBMIT_TIMEOUT,
+    VOICE_WAIT_SECONDS,
+    SERVER_HOST,
+    SERVER_PORT,
+    WORKER_ID,
+    SOCKETIO_MESSAGE_QUEUE,
+    SOCKETIO_CHANNEL
 )
 import cv2
 import numpy as np
 import base64
-from deepface import DeepFace
+import os
 import interview_evaluation_api
+from evaluation_jobs import EvaluationJobQueue
+from turn_evaluation import TurnEvaluator
+from interview_store import InterviewStore
+from audio_archive import AudioArchive
+from xfyun_lfasr_client import XfyunFileASRClient
+from batch_transcription import BatchTranscriber
+from vision_worker import VisionPool, analyze_emotion
+from voice_worker import VoiceAnalysisPool
+from prompt_templates import PromptTemplate, Section, register
 from flask import session as flask_session
 from flask import copy_current_request_context
 
+setup_logging(LOG_LEVEL, LOG_FORMAT, async_io=LOG_ASYNC, json_events=LOG_JSON_EVENTS)
+
 app = Flask(__name__)
 
-# 注册面试评测路由
-app.add_url_rule('/api/interview/result', 'interview_evaluation', interview_evaluation_api.interview_evaluation, methods=['POST'])
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', logger=True, engineio_logger=True)
+# Socket.IO 的逐包日志只在 DEBUG 级别开启，避免音频帧刷屏
+# 多 worker 部署时经消息队列转发 emit：后台线程推送给连接在其他 worker 上的客户端也能送达
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', logger=LOG_LEVEL == 'DEBUG', engineio_logger=LOG_LEVEL == 'DEBUG',
+                    message_queue=SOCKETIO_MESSAGE_QUEUE or None, channel=SOCKETIO_CHANNEL)
+if WORKER_ID:
+    logging.info(f"多进程部署: worker {WORKER_ID}，端口 {SERVER_PORT}，消息队列 {SOCKETIO_MESSAGE_QUEUE or '无'}")
 
 # 初始化各组件
 asr_client = XfyunASRClient(
     app_id=XFYUN_ASR_APPID,
     api_key=XFYUN_ASR_API_KEY,
-    api_secret=XFYUN_ASR_API_SECRET
+    api_secret=XFYUN_ASR_API_SECRET,
+    url=XFYUN_ASR_URL
 )
 # 不在启动时连接ASR，而是在需要时连接
 logging.info("ASR客户端初始化完成，将在需要时连接")
@@ -52,29 +120,85 @@ tts_client = XfyunTTSClient(
     voice_name=XFYUN_TTS_VOICE_NAME,
     aue_format=XFYUN_TTS_AUE_FORMAT,
     auf_rate=XFYUN_TTS_AUF_RATE,
+    url=XFYUN_TTS_URL,
     tts_current_playing_lock=tts_current_playing_lock
 )
 tts_client.connect()
 
 spark_client = SparkClient(
     api_password=SPARK_HTTP_API_PASSWORD,
-    model_version=SPARK_MODEL_VERSION
+    model_version=SPARK_MODEL_VERSION,
+    api_url=SPARK_API_URL
 )
 
 voice_analyzer = VoiceAnalyzer()
+# 每场面试的录音归档（按题索引，过期由共享调度器按清单删除）
+# 多 worker 时每个进程使用自己的子目录：归档清单由单个进程维护，会话经粘性路由固定在同一进程
+audio_archive = AudioArchive(
+    os.path.join(AUDIO_ARCHIVE_DIR, f"worker_{WORKER_ID}") if WORKER_ID else AUDIO_ARCHIVE_DIR,
+    sample_rate=voice_analyzer.sample_rate,
+    segment_bytes=AUDIO_ARCHIVE_SEGMENT_MB * 1024 * 1024,
+    retention_seconds=AUDIO_ARCHIVE_RETENTION_SECONDS
+)
+# 每道题回答后的后台评分
+turn_evaluator = TurnEvaluator(spark_client, workers=TURN_EVALUATION_WORKERS, audio_wait=VOICE_WAIT_SECONDS)
+# ASR 转发前的语音活动检测，只上传有效语音
+asr_vad = VoiceActivityDetector(
+    energy_threshold_db=VAD_ENERGY_THRESHOLD_DB,
+    energy_margin_db=VAD_ENERGY_MARGIN_DB,
+    flatness_threshold=VAD_FLATNESS_THRESHOLD,
+    hangover_ms=VAD_HANGOVER_MS,
+    preroll_ms=VAD_PREROLL_MS
+)
 response_audio_q = queue.Queue()
 is_asr_listening = threading.Event()
 stop_event = threading.Event()  # 显式传入stop_event
 audio_stream_should_open_event = threading.Event()
 audio_stream_opened_event = threading.Event()
 
-# 全局存储每个session的音频数据
+# 每个session当前轮次的音频帧和解码器（只保存进行中的数据，分析结果写入 store）
 session_audio_data = {}
-# 全局保存所有轮次的语音分析
-all_audio_analysis = []
-
-# 全局模拟用户信息（实际可用数据库/登录系统）
-user_info = {
+# 会话、问答、语音分析、表情时间线和用户信息的持久化存储
+store = InterviewStore(
+    STORAGE_DB_PATH,
+    batch_size=STORAGE_BATCH_SIZE,
+    flush_interval=STORAGE_FLUSH_INTERVAL,
+    cache_sessions=STORAGE_CACHE_SESSIONS,
+    cache_emotions=STORAGE_CACHE_EMOTIONS,
+    shared=bool(WORKER_ID)  # 多个 worker 共用数据库，其他进程的会话不缓存
+)
+# 面试结束后整场录音的文件转写（高精度文本写回 store）
+batch_transcriber = BatchTranscriber(
+    XfyunFileASRClient(
+        XFYUN_LFASR_APPID,
+        XFYUN_LFASR_SECRET_KEY,
+        upload_url=XFYUN_LFASR_UPLOAD_URL,
+        get_result_url=XFYUN_LFASR_RESULT_URL
+    ),
+    audio_archive,
+    store,
+    workers=LFASR_BATCH_WORKERS,
+    timeout=LFASR_TIMEOUT_SECONDS,
+    part_seconds=LFASR_PART_SECONDS,
+    upload_retries=LFASR_UPLOAD_RETRIES
+) if LFASR_BATCH_ENABLED else None
+
+# 语音分析进程池：每轮回答的特征分析不阻塞 end_answer
+voice_pool = VoiceAnalysisPool(
+    workers=VOICE_WORKERS,
+    max_pending=VOICE_MAX_PENDING,
+    sample_rate=voice_analyzer.sample_rate
+) if VOICE_WORKERS > 0 else None
+
+# 表情识别进程池：DeepFace 推理不占用 Web 进程的 GIL
+vision_pool = VisionPool(
+    workers=VISION_WORKERS,
+    slots=VISION_SLOTS,
+    slot_bytes=VISION_SLOT_BYTES
+) if VISION_WORKERS > 0 else None
+
+# 默认用户信息（实际可用登录系统），修改后保存在 store 中
+DEFAULT_USER_INFO = {
     'nickname': '未命名用户',
     'avatar_url': '',
     'email': '',
@@ -101,6 +225,14 @@ audio_queue = queue.Queue()
 result_queue = queue.Queue()
 asr_result_queue = queue.Queue()
 
+# ========== 指标 ==========
+QUEUE_DEPTH = metrics.gauge("queue_depth", "内部队列当前长度", ["queue"])
+QUEUE_DEPTH.labels(queue="audio_queue").set_function(audio_queue.qsize)
+QUEUE_DEPTH.labels(queue="response_audio_q").set_function(response_audio_q.qsize)
+AUDIO_STREAM_BYTES = metrics.counter("audio_stream_received_bytes", "audio_stream 收到的字节数", ["codec"])
+END_ANSWER_SECONDS = metrics.histogram("end_answer_to_transcript_seconds", "收到 end_answer 到发出最终转写文本的耗时")
+FACE_EMOTION_SECONDS = metrics.histogram("face_emotion_seconds", "/api/face_emotion 各阶段耗时", ["stage"])
+
 # ========== RESTful API ==========
 @app.route('/api/interview/start', methods=['POST'])
 def start_interview():
@@ -120,6 +252,10 @@ def stop_interview():
         socketio.emit('interview_force_stop')
     return jsonify({"msg": "面试已结束"})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.expose(), mimetype=metrics.CONTENT_TYPE_LATEST)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -127,7 +263,7 @@ def index():
 @app.route('/api/test_spark', methods=['GET'])
 def test_spark():
     try:
-        result = spark_client.send_message([{"role": "user", "content": "你好，请自我介绍一下。"}])
+        result = spark_client.send_message([{"role": "user", "content": "你好，请自我介绍一下。"}], endpoint="test_spark")
         return jsonify({"result": result})
     except Exception as e:
         return jsonify({"error": str(e)})
@@ -135,50 +271,51 @@ def test_spark():
 @app.route('/api/face_emotion', methods=['POST'])
 def face_emotion():
     data = request.json
-    img_data = data['image'].split(',')[1]
-    img_bytes = base64.b64decode(img_data)
-    nparr = np.frombuffer(img_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    with FACE_EMOTION_SECONDS.labels(stage="decode").time():
+        img_data = data['image'].split(',')[1]
+        img_bytes = base64.b64decode(img_data)
+        nparr = np.frombuffer(img_bytes, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
     # 表情分析
     try:
-        result = DeepFace.analyze(img, actions=['emotion'], enforce_detection=False)
-        logging.info(f"DeepFace.analyze 返回: {result}")
-        if isinstance(result, list):
-            if len(result) > 0 and isinstance(result[0], dict):
-                emotion = result[0].get('dominant_emotion', 'unknown')
+        with FACE_EMOTION_SECONDS.labels(stage="inference").time():
+            if vision_pool is not None:
+                result = vision_pool.analyze(img, "emotion", timeout=VISION_TIMEOUT_SECONDS)
             else:
-                emotion = 'unknown'
-        elif isinstance(result, dict):
-            emotion = result.get('dominant_emotion', 'unknown')
-        else:
-            emotion = 'unknown'
+                result = analyze_emotion(img)
+        logging.info(f"表情识别结果: {result}")
+        emotion = result.get('emotion', 'unknown')
     except Exception as e:
-        logging.error(f"DeepFace.analyze 异常: {e}", exc_info=True)
+        logging.error(f"表情识别异常: {e}", exc_info=True)
         emotion = "unknown"
 
+    # 前端带上 Socket.IO 会话 ID 时记入该会话的表情时间线
+    if data.get('sid') and emotion != 'unknown':
+        store.add_emotion(data['sid'], emotion)
+
     return jsonify({
         "emotion": emotion
     })
 
+RESUME_TEMPLATE = register(PromptTemplate(
+    "generate_resume",
+    "请根据用户提供的信息帮我生成一份完整的中文简历，内容包括个人信息、教育背景、技能、项目经历和自我评价，要求简洁专业。",
+    [Section("name", "姓名：", budget=50, default=""),
+     Section("school", "学校：", budget=100, default=""),
+     Section("major", "专业：", budget=100, default=""),
+     Section("skills", "技能：", budget=800, default=""),
+     Section("project", "项目经历：", budget=2000, default=""),
+     Section("selfIntro", "自我评价：", budget=800, default="")],
+))
+
 @app.route('/api/generate_resume', methods=['POST'])
 def generate_resume():
     data = request.json
-    prompt = (
-        f"请根据以下信息帮我生成一份完整的中文简历，内容包括个人信息、教育背景、技能、项目经历和自我评价，要求简洁专业：\n"
-        f"姓名：{data.get('name','')}\n"
-        f"学校：{data.get('school','')}\n"
-        f"专业：{data.get('major','')}\n"
-        f"技能：{data.get('skills','')}\n"
-        f"项目经历：{data.get('project','')}\n"
-        f"自我评价：{data.get('selfIntro','')}"
-    )
+    messages = RESUME_TEMPLATE.render(**{s.name: data.get(s.name, '') for s in RESUME_TEMPLATE.sections})
     try:
-        print("【简历生成Prompt】", prompt)
-        messages = [
-            {"role": "user", "content": prompt}
-        ]
-        result = spark_client.send_message(messages)
+        print("【简历生成Prompt】", messages[-1]['content'])
+        result = spark_client.send_message(messages, endpoint="generate_resume")
         print("【简历生成结果】", result)
         return jsonify({'resume': result})
     except Exception as e:
@@ -212,25 +349,29 @@ def get_exam_questions():
     }
     return {'questions': questions}
 
+EXAM_REVIEW_TEMPLATE = register(PromptTemplate(
+    "exam_review",
+    "你是一名面试官，请按用户给出的领域，对笔试题作答进行专业、详细的批改，指出优点、不足，并给出改进建议。"
+    "请用中文输出批改意见。",
+    [Section("field", "领域："),
+     Section("question", "题目：", budget=500),
+     Section("answer", "考生答案：", budget=3000, keep="both")],
+))
+
 @app.route('/api/exam_review', methods=['POST'])
 def exam_review():
     data = request.get_json()
-    field = data.get('field')
-    question = data.get('question')
-    answer = data.get('answer')
     # 构造prompt
-    prompt = f"你是一名{field}领域的面试官，请对下面的笔试题作答进行专业、详细的批改，指出优点、不足，并给出改进建议。\n题目：{question}\n考生答案：{answer}\n请用中文输出批改意见。"
+    messages = EXAM_REVIEW_TEMPLATE.render(field=data.get('field'), question=data.get('question'),
+                                           answer=data.get('answer'))
     from xfyun_spark_client import SparkClient, SPARK_HTTP_API_PASSWORD, SPARK_MODEL_VERSION
-    spark_client = SparkClient(api_password=SPARK_HTTP_API_PASSWORD, model_version=SPARK_MODEL_VERSION)
-    messages = [
-        {"role": "user", "content": prompt}
-    ]
-    review = spark_client.send_message(messages)
+    spark_client = SparkClient(api_password=SPARK_HTTP_API_PASSWORD, model_version=SPARK_MODEL_VERSION, api_url=SPARK_API_URL)
+    review = spark_client.send_message(messages, endpoint="exam_review")
     return {'review': review or '批改失败，请稍后重试。'}
 
 @app.route('/api/user_info', methods=['GET', 'POST'])
 def user_info_api():
-    global user_info
+    user_info = dict(DEFAULT_USER_INFO, **store.get_value('user_info', {}))
     if request.method == 'GET':
         return user_info
     elif request.method == 'POST':
@@ -238,6 +379,7 @@ def user_info_api():
         for k in ['nickname', 'avatar_url', 'email', 'phone']:
             if k in data:
                 user_info[k] = data[k]
+        store.set_value('user_info', user_info)
         return {'success': True, 'user_info': user_info}
 
 # ========== WebSocket 音频流转发 ==========
@@ -247,8 +389,9 @@ def handle_connect():
     # 初始化该session的音频数据
     session_audio_data[request.sid] = {
         'audio_frames': [],
-        'all_round_audio_analysis': []
+        'decoder': AudioStreamDecoder(CODEC_PCM)
     }
+    store.start_session(request.sid)
 
 def delayed_cleanup(sid, delay=300):
     import time
@@ -256,6 +399,11 @@ def delayed_cleanup(sid, delay=300):
     if sid in session_audio_data:
         del session_audio_data[sid]
         print(f"【清理】延迟删除session音频数据: {sid}")
+    tracer.end_turn(sid, abandoned=True)  # 断线时还没结束的一轮回答，避免根 span 一直留在内存中
+    turn_evaluator.clear(sid)
+    store.end_session(sid)
+    if batch_transcriber is not None:
+        batch_transcriber.forget(sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
@@ -263,6 +411,24 @@ def handle_disconnect():
     # 延迟5分钟后清理session数据
     threading.Thread(target=delayed_cleanup, args=(request.sid,), daemon=True).start()
 
+@socketio.on('audio_config')
+def handle_audio_config(data):
+    """前端声明可用的音频编码（按偏好排序），服务端选定本会话使用的编码并回执。"""
+    sid = request.sid
+    requested = (data or {}).get('codecs') or (data or {}).get('codec') or [CODEC_PCM]
+    codec = negotiate_codec(requested)
+    try:
+        decoder = AudioStreamDecoder(codec)
+    except Exception as e:
+        logging.error(f"创建音频解码器失败，回退到PCM: {e}")
+        codec = CODEC_PCM
+        decoder = AudioStreamDecoder(codec)
+    if sid not in session_audio_data:
+        session_audio_data[sid] = {'audio_frames': []}
+    session_audio_data[sid]['decoder'] = decoder
+    logging.info(f"【音频流】会话 {sid} 协商编码: {codec}（前端请求: {requested}）")
+    emit('audio_config_ack', {'codec': codec})
+
 @socketio.on('audio_stream')
 def handle_audio_stream(data):
     if isinstance(data, bytes):
@@ -272,18 +438,27 @@ def handle_audio_stream(data):
             # 限制音频帧数量，避免内存泄漏
             sid = request.sid
             if sid not in session_audio_data:
-                session_audio_data[sid] = {'audio_frames': [], 'all_round_audio_analysis': []}
+                session_audio_data[sid] = {'audio_frames': []}
             audio_frames = session_audio_data[sid]['audio_frames']
+            decoder = session_audio_data[sid].get('decoder')
+            AUDIO_STREAM_BYTES.labels(codec=decoder.codec if decoder is not None else 'pcm').inc(len(data))
             if len(audio_frames) < 1000:  # 最多保存1000帧
-                audio_frames.append(data)  # 收集当前轮次的音频帧
-                audio_queue.put(data)  # 发送到ASR队列
-                print(f"【音频流】✅ 收到音频数据，长度: {len(data)} 字节，当前累积帧数: {len(audio_frames)}")
+                if decoder is not None and decoder.passthrough:
+                    # speex-wb 直通讯飞，不在本地解码（本轮不做本地语音分析）
+                    audio_queue.put((decoder.asr_encoding, decoder.to_asr_frames(data)))
+                    return
+                pcm = decoder.decode(data) if decoder is not None else data
+                if not pcm:
+                    return
+                audio_frames.append(pcm)  # 收集当前轮次的音频帧
+                audio_queue.put(pcm)  # 发送到ASR队列
+                log_event('audio_stream.frame', logging.DEBUG, rate=1, sid=sid, bytes=len(data), frames=len(audio_frames))
             else:
-                print(f"【音频流】⚠️ 音频帧数量过多({len(audio_frames)})，跳过新帧")
+                log_event('audio_stream.frame_dropped', logging.WARNING, rate=0.2, sid=sid, frames=len(audio_frames))
         else:
-            print(f"【音频流】❌ ASR未监听，跳过音频数据，长度: {len(data)} 字节，session.is_asr_listening状态: {session.is_asr_listening.is_set()}")
+            log_event('audio_stream.not_listening', logging.DEBUG, rate=0.2, bytes=len(data))
     else:
-        print(f"❌ 收到无效音频数据，类型为: {type(data)}, 内容: {data}")
+        log_event('audio_stream.invalid', logging.WARNING, rate=1, type=type(data).__name__)
 
 # 添加一个调试路由来检查音频帧状态
 @app.route('/api/debug/audio_frames', methods=['GET'])
@@ -299,25 +474,34 @@ def debug_audio_frames():
             'all_round_audio_analysis': []
         })
     audio_frames = session_audio_data[sid]['audio_frames']
+    round_analysis = [{'features': r['features']} for r in store.audio_features(sid)]
     return jsonify({
         'frame_count': len(audio_frames),
         'total_size': sum(len(frame) for frame in audio_frames) if audio_frames else 0,
         'global_is_asr_listening': is_asr_listening.is_set(),
         'session_is_asr_listening': session.is_asr_listening.is_set(),
-        'all_round_audio_analysis_count': len(session_audio_data[sid]['all_round_audio_analysis']),
-        'all_round_audio_analysis': session_audio_data[sid]['all_round_audio_analysis']
+        'all_round_audio_analysis_count': len(round_analysis),
+        'all_round_audio_analysis': round_analysis
     })
 
 # 新增：开始/结束回答事件
 @socketio.on('start_answer')
 def handle_start_answer():
     asr_client.start_accumulate()
+    asr_vad.reset()
     logging.info('收到start_answer，已重置累积内容')
 
 @socketio.on('end_answer')
 def handle_end_answer():
-    print("【调试】handle_end_answer 被调用")
+    # 每轮回答从 end_answer 开始一条 trace，在 user_answer 处理完时结束
     sid = request.sid
+    turn = tracer.start_turn(sid, sid=sid)
+    with tracer.activate(turn), tracer.span("socketio.end_answer"):
+        _handle_end_answer(sid)
+
+def _handle_end_answer(sid):
+    end_answer_start = time.perf_counter()
+    print("【调试】handle_end_answer 被调用")
     audio_frames = session_audio_data.get(sid, {}).get('audio_frames', [])
     print(f"【调试】audio_frames 长度: {len(audio_frames)}")
     if audio_frames:
@@ -328,29 +512,37 @@ def handle_end_answer():
         except Exception as e:
             print(f"【ASR】发送结束帧失败: {e}")
         
-        # 同步分析当前轮次的音频，确保分析完成
+        # 归档当前轮次的音频后提交分析：有语音分析进程池时在后台进行，结果就绪后再推送，不耽误转写文本
         if audio_frames:
             print(f"【语音分析】开始分析当前轮次音频，帧数: {len(audio_frames)}")
             # 复制音频帧，避免在分析过程中被修改
             frames_copy = audio_frames.copy()
             
             try:
-                audio_path = voice_analyzer.save_audio(frames_copy, filename=f"round_{len(all_audio_analysis)+1}_audio.wav")
+                with tracer.span("audio_archive.append_turn", frames=len(frames_copy)):
+                    turn_no = audio_archive.append_turn(sid, frames_copy)
                 
-                if audio_path:
-                    audio_features = voice_analyzer.analyze_audio_features(audio_path)
-                    if audio_features:
-                        print(f'【调试】audio_features: {audio_features}')
-                        # 记录当前轮次的语音分析结果
-                        session_audio_data[sid]['all_round_audio_analysis'].append({'features': audio_features})
-                        # 新增：将本轮语音分析结果通过answer_result事件返回给前端
-                        audio_analysis_text = f"响度: {audio_features.get('loudness_db', '无'):.2f} dB，时长: {audio_features.get('duration_seconds', '无'):.2f}秒，音高: {audio_features.get('average_pitch_hz', '无'):.2f} Hz，情感: {audio_features.get('estimated_emotional_tone', '无')}"
-                        all_audio_analysis.append(audio_analysis_text) # 新增：将分析文本添加到全局列表
-                        socketio.emit('answer_result', {'audio_analysis': audio_analysis_text}, to=sid)
+                if turn_no:
+                    session_audio_data[sid]['audio_turn'] = turn_no  # 供 user_answer 记录本题对应的录音
+                    if stop_event.is_set() and batch_transcriber is not None:
+                        batch_transcriber.submit(sid)  # 面试已结束，补交这一题的录音转写
+                    if voice_pool is not None:
+                        with tracer.span("voice_pool.submit"):
+                            # 工作进程按归档位置直接映射本题录音，同一会话按题号顺序回调
+                            future = voice_pool.submit(
+                                sid, audio_archive.turn_location(sid, turn_no),
+                                callback=lambda features, error: _publish_audio_features(sid, features),
+                                timeout=VOICE_SUBMIT_TIMEOUT
+                            )
+                        session_audio_data[sid]['audio_features_future'] = future  # 供本题评分等待，None 表示已跳过
+                        if future is None:
+                            print("【语音分析】分析队列已满，跳过当前轮次")
                     else:
-                        print("【语音分析】当前轮次音频分析失败")
+                        with tracer.span("voice.analyze_audio_features"):
+                            # 从归档 mmap 读回本题样本直接分析，不再单独写 WAV 文件
+                            _publish_audio_features(sid, voice_analyzer.analyze_audio_samples(audio_archive.read_turn(sid, turn_no)))
                 else:
-                    print("【语音分析】当前轮次音频保存失败")
+                    print("【语音分析】当前轮次音频归档失败")
             except Exception as e:
                 print(f"【语音分析】分析异常: {e}")
         else:
@@ -363,13 +555,34 @@ def handle_end_answer():
     # 清空当前轮次的音频帧，准备下一轮
     audio_frames.clear()
     
-    result = asr_client.get_accumulated_result()
+    with tracer.span("asr.get_accumulated_result") as span:
+        result = asr_client.get_accumulated_result()
+        span.set_attribute("chars", len(result))
     logging.info(f'收到end_answer，返回累积内容: {result}')
     socketio.emit('answer_result', {'text': result}, to=sid)
+    END_ANSWER_SECONDS.observe(time.perf_counter() - end_answer_start)
+
+def _publish_audio_features(sid, audio_features):
+    """记录本轮语音分析结果，并通过 answer_result 事件推送给前端。"""
+    if not audio_features:
+        print("【语音分析】当前轮次音频分析失败")
+        return
+    print(f'【调试】audio_features: {audio_features}')
+    audio_analysis_text = f"响度: {audio_features.get('loudness_db', '无'):.2f} dB，时长: {audio_features.get('duration_seconds', '无'):.2f}秒，音高: {audio_features.get('average_pitch_hz', '无'):.2f} Hz，情感: {audio_features.get('estimated_emotional_tone', '无')}"
+    # 记录当前轮次的语音分析结果
+    store.add_audio_features(sid, audio_features, audio_analysis_text)
+    socketio.emit('answer_result', {'audio_analysis': audio_analysis_text}, to=sid)
 
 # 处理用户回答事件
 @socketio.on('user_answer')
 def handle_user_answer(data):
+    # 接上 end_answer 开始的本轮 trace；没有时（如直接提交文字）单独成一条 trace
+    sid = request.sid
+    with tracer.activate(tracer.current_turn(sid)), tracer.span("socketio.user_answer"):
+        _handle_user_answer(sid, data)
+    tracer.end_turn(sid)
+
+def _handle_user_answer(sid, data):
     if stop_event.is_set():
         logging.info("面试已终止，忽略用户回答")
         return
@@ -382,16 +595,28 @@ def handle_user_answer(data):
     if not user_text or not user_text.strip():
         logging.warning("用户回答为空，自动重复上一个问题")
         # 1. 反馈“未检测到有效回答”
-        socketio.emit('ai_feedback', {'text': '未检测到有效回答，请再试一次'})
+        socketio.emit('ai_feedback', {'text': '未检测到有效回答，请再试一次'}, to=sid)
         # 2. 重新发送上一个问题
-        socketio.emit('ai_question', {'text': last_question})
+        socketio.emit('ai_question', {'text': last_question}, to=sid)
         # 3. 允许前端再次作答
         session.is_asr_listening.set()
-        socketio.emit('can_answer', {})
+        socketio.emit('can_answer', {}, to=sid)
         return
 
+    if TURN_EVALUATION_ENABLED:
+        # 本题评分在后台进行，与下面的回答整理和追问并行，面试结束时只需汇总
+        if voice_pool is not None:
+            # 本题语音分析可能仍在进行，把 Future 交给评分线程去等，不阻塞这里；
+            # 本题分析被拒绝（排队已满）时没有 Future，不能拿上一题的特征代替
+            audio_features = session_audio_data.get(sid, {}).pop('audio_features_future', None)
+        else:
+            audio_features = store.latest_audio_features(sid)
+        turn_evaluator.submit(sid, last_question, user_text, audio_features)
+
     # 先让AI处理用户的回答，整理成更清晰的内容
     processed_answer = session.process_user_answer(user_text)
+    store.add_turn(sid, last_question, user_text, processed_answer,
+                   audio_turn=session_audio_data.get(sid, {}).pop('audio_turn', None))
 
     # 如果面试已终止（如点击了结束面试），只反馈整理后的内容和结束语，不再AI提问
     if stop_event.is_set():
@@ -399,7 +624,7 @@ def handle_user_answer(data):
         socketio.emit('ai_feedback', {
             'text': '面试已结束，感谢您的参与！',
             'processed_answer': processed_answer
-        })
+        }, to=sid)
         return
 
     # 然后进行正常的AI面试流程
@@ -414,10 +639,10 @@ def handle_user_answer(data):
         socketio.emit('ai_feedback', {
             'text': '回答已记录，请继续',
             'processed_answer': processed_answer
-        })
-        socketio.emit('ai_question', {'text': ai_reply})
+        }, to=sid)
+        socketio.emit('ai_question', {'text': ai_reply}, to=sid)
         session.is_asr_listening.set()
-        socketio.emit('can_answer', {})  # 通知前端可以开始下一轮回答
+        socketio.emit('can_answer', {}, to=sid)  # 通知前端可以开始下一轮回答
     else:
         # 面试结束
         logging.info("面试流程结束。")
@@ -425,7 +650,7 @@ def handle_user_answer(data):
         socketio.emit('ai_feedback', {
             'text': '面试已结束，感谢您的参与！',
             'processed_answer': processed_answer
-        })
+        }, to=sid)
 
 # asr_worker 只做音频帧推送
 
@@ -456,9 +681,7 @@ def asr_interim_callback(result_dict, asr_client_instance):
             'feedback': ''
         })
         logging.debug(f"发送ASR中间结果到前端: {result_dict['text']}")
-        
-        # 启动自动结束监控
-        asr_client_instance._start_auto_finalize_monitor()
+        # 自动结束的截止时间已由 ASR 客户端在共享调度器中顺延，这里无需再启动监控
 
 asr_client.set_callback(asr_final_callback)
 asr_client.set_interim_result_callback(asr_interim_callback)
@@ -471,6 +694,7 @@ def asr_worker():
     last_connection_time = 0  # 上次连接时间
     last_audio_time = 0  # 上次发送音频时间
     audio_buffer = []  # 音频缓冲区
+    audio_encoding = "raw"  # 缓冲区中音频的编码
     buffer_size = 5  # 缓冲区大小（帧数）
     
     while True:
@@ -478,6 +702,29 @@ def asr_worker():
             audio_data = audio_queue.get(timeout=0.1)  # 增加超时，避免无限等待
             if audio_data is None:
                 continue
+
+            # 压缩帧直通时队列里是 (encoding, data)，无法做VAD，直接转发
+            encoding = "raw"
+            if isinstance(audio_data, tuple):
+                encoding, audio_data = audio_data
+                vad_result = {'speech_ended': False}
+            else:
+                # VAD 门控：静音帧不上传，语音段结束时立即冲刷缓冲区
+                vad_result = asr_vad.process(audio_data)
+                if vad_result['speech_started']:
+                    logging.debug("VAD：检测到语音开始")
+                audio_data = vad_result['audio']
+            if not audio_data:
+                if vad_result['speech_ended'] and asr_connected and not is_first_frame and audio_buffer:
+                    asr_client.send_audio(b''.join(audio_buffer), status=1, encoding=audio_encoding)
+                    audio_buffer.clear()
+                continue
+            if encoding != audio_encoding and audio_buffer:
+                # 编码切换时先把旧编码的缓冲数据发完
+                asr_client.send_audio(b''.join(audio_buffer), status=0 if is_first_frame else 1, encoding=audio_encoding)
+                is_first_frame = False
+                audio_buffer.clear()
+            audio_encoding = encoding
             
             current_time = time.time()
             
@@ -513,16 +760,16 @@ def asr_worker():
             # 音频数据缓冲和批量发送
             audio_buffer.append(audio_data)
             
-            # 当缓冲区满了或者距离上次发送超过200ms时发送数据
-            if len(audio_buffer) >= buffer_size or (current_time - last_audio_time > 0.2):
+            # 当缓冲区满了、距离上次发送超过200ms或语音段刚结束时发送数据
+            if len(audio_buffer) >= buffer_size or (current_time - last_audio_time > 0.2) or vad_result['speech_ended']:
                 if is_first_frame:
                     # 第一帧发送开始信号
-                    asr_client.send_audio(b''.join(audio_buffer), status=0)
+                    asr_client.send_audio(b''.join(audio_buffer), status=0, encoding=audio_encoding)
                     print("【ASR】发送开始帧")
                     is_first_frame = False
                 else:
                     # 后续帧发送音频数据
-                    asr_client.send_audio(b''.join(audio_buffer), status=1)
+                    asr_client.send_audio(b''.join(audio_buffer), status=1, encoding=audio_encoding)
                 
                 last_audio_time = current_time
                 audio_buffer.clear()  # 清空缓冲区
@@ -531,7 +778,7 @@ def asr_worker():
             # 队列超时，检查是否需要自动结束
             if asr_connected and not is_first_frame and audio_buffer:
                 # 发送剩余的缓冲数据
-                asr_client.send_audio(b''.join(audio_buffer), status=1)
+                asr_client.send_audio(b''.join(audio_buffer), status=1, encoding=audio_encoding)
                 audio_buffer.clear()
                 
         except Exception as e:
@@ -567,10 +814,44 @@ def handle_interview_end():
     if not stop_event.is_set():
         stop_event.set()
         socketio.emit('interview_force_stop')
+    if batch_transcriber is not None:
+        # 面试一结束就开始整场录音转写，生成报告时通常已经完成；
+        # 之后才归档的题（最后一次 end_answer 晚于 interview_end）在归档时补交
+        batch_transcriber.submit(request.sid)
+
+# ========== 评测报告任务队列 ==========
+def run_interview_evaluation(data, session_sid=None):
+    # 先取回面试过程中各题的后台评分（等待仍在进行中的），有评分时只做汇总
+    sid = session_sid
+    turn_assessments = turn_evaluator.collect(sid, timeout=TURN_EVALUATION_WAIT_SECONDS) if sid else []
+    if sid and batch_transcriber is not None:
+        batch_transcriber.submit(sid)  # 只补交还没提交过的题，已提交的不重复上传
+        transcribed = batch_transcriber.wait(sid, timeout=LFASR_WAIT_SECONDS)
+        if transcribed:
+            # 已转写的题用录音文件转写的高精度文本替换实时识别的回答，其余题保留实时识别文本
+            turns = store.turns(sid)
+            if any(t.get('transcript') for t in turns):
+                data = dict(data, history=[{'question': t['question'], 'answer': t.get('transcript') or t['answer']}
+                                           for t in turns])
+                logging.info(f"会话 {sid} 评测使用录音文件转写文本，覆盖 {len(transcribed)} 题")
+    return interview_evaluation_api.evaluate_interview(data, turn_assessments=turn_assessments)
+
+def push_evaluation_result(job, sids):
+    for sid in sids:
+        socketio.emit('evaluation_result', job, to=sid)
+
+evaluation_jobs = EvaluationJobQueue(
+    run_interview_evaluation,
+    results_dir=EVALUATION_RESULTS_DIR,
+    workers=EVALUATION_WORKERS,
+    on_update=push_evaluation_result
+)
 
 @app.route('/api/interview/result', methods=['POST'])
 def interview_evaluation_route():
-    data = request.get_json()
+    data = request.get_json() or {}
+    notify_sid = data.pop('sid', None)  # 前端的 Socket.IO 会话 ID，用于推送结果
+    force = bool(data.pop('force', False))  # 忽略已保存的结果，重新生成
     print(f'收到 video_analysis: {data.get("video_analysis")}')
     print(f'收到 resume_text: {data.get("resume_text")}')
     # 直接用前端传来的audio_analysis
@@ -580,15 +861,27 @@ def interview_evaluation_route():
     # session_audio_data[sid]['audio_frames'].clear() # 不再需要清空音频帧
     # session_audio_data[sid]['all_round_audio_analysis'].clear() # 不再需要清空分析数据
     # data['audio_analysis'] = audio_analysis # 不再需要将分析结果放入data
-    from interview_evaluation_api import interview_evaluation
-    import flask
-    with app.test_request_context(json=data):
-        result = interview_evaluation()
-    return result
+    # 评测在后台线程池中执行，接口立即返回任务 ID；完成后推送 evaluation_result，也可轮询查询
+    # 会话 ID 只用于取回本会话的逐题评分和录音转写，不参与任务 ID 计算
+    job = evaluation_jobs.submit(data, notify_sid=notify_sid, force=force,
+                                 context={'session_sid': notify_sid} if notify_sid else None)
+    return jsonify(job), 200 if job['status'] == 'done' else 202
+
+@app.route('/api/interview/result/<job_id>', methods=['GET'])
+def interview_evaluation_status(job_id):
+    job = evaluation_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '评测任务不存在'}), 404
+    return jsonify(job)
 
 @app.route('/api/get_audio_analysis', methods=['GET'])
 def get_audio_analysis():
-    return {'audio_analysis': all_audio_analysis}
+    # 按会话返回各轮语音分析摘要；不再有跨用户共享的全局列表
+    sid = request.args.get('sid')
+    if sid and voice_pool is not None:
+        voice_pool.wait(sid, timeout=VOICE_WAIT_SECONDS)  # 最后一题的分析可能还在进行
+    records = store.audio_features(sid) if sid else []
+    return {'audio_analysis': [r['summary'] for r in records if r.get('summary')]}
 
 # 启动ASR后台线程和主流程线程，必须放到主入口下
 if __name__ == '__main__':
@@ -598,30 +891,8 @@ if __name__ == '__main__':
     logging.info("ASR后台线程已启动")
     print("【启动】ASR后台线程已启动")
     
-    # 启动定期清理线程
-    def cleanup_temp_files():
-        import os
-        import time
-        import glob
-        while True:
-            try:
-                # 清理超过1小时的临时音频文件
-                audio_dir = "audio_records"
-                if os.path.exists(audio_dir):
-                    current_time = time.time()
-                    for file_path in glob.glob(os.path.join(audio_dir, "*.wav")):
-                        if os.path.getmtime(file_path) < current_time - 3600:  # 1小时前
-                            os.remove(file_path)
-                            print(f"【清理】删除过期音频文件: {file_path}")
-                time.sleep(300)  # 每5分钟检查一次
-            except Exception as e:
-                print(f"【清理】清理线程异常: {e}")
-                time.sleep(60)
-    
-    cleanup_thread = threading.Thread(target=cleanup_temp_files, daemon=True)
-    cleanup_thread.start()
-    print("【启动】临时文件清理线程已启动")
+    # 过期录音由 audio_archive 按清单定时删除，不再需要扫描目录的清理线程
     
     print("【启动】正在启动Flask-SocketIO服务器...")
     # 只保留一次socketio.run()
-    socketio.run(app, host='0.0.0.0', port=5000, debug=False)
+    socketio.run(app, host=SERVER_HOST, port=SERVER_PORT, debug=False)
@@ -0,0 +1,275 @@
+# audio_archive.py - 整场面试的录音归档：每个会话一个只追加的分段 PCM 文件，附带按题的偏移索引
+#
+# 原先每轮回答单独写一个 WAV（round_N_audio.wav，不同用户会重名覆盖），
+# 另有清理线程每 5 分钟 glob 扫描目录删除过期文件。这里改为：
+#   <sid>.<段号>.pcm  原始 PCM，顺序追加，单个文件超过 segment_bytes 时换下一段
+#   <sid>.idx         每行一条 JSON：题号、段号、偏移、长度、时间，与 PCM 同步追加
+#   manifest.json     各会话最后写入时间，用于按索引过期删除（不扫描目录）
+# 读取时用 mmap 映射分段文件，按索引偏移直接得到 numpy 视图，分析和回放都不需要复制整段音频。
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import wave
+
+import numpy as np
+
+import metrics
+from timer_service import get_scheduler
+
+ARCHIVE_BYTES = metrics.counter("audio_archive_bytes", "写入录音归档的字节数")
+ARCHIVE_SESSIONS = metrics.gauge("audio_archive_sessions", "录音归档中保留的会话数")
+
+_SAFE_SID = re.compile(r'[^A-Za-z0-9_-]')
+
+
+class AudioArchive:
+    """
+    按会话归档录音。append_turn() 把一轮回答的音频帧顺序追加到会话文件并记录偏移，
+    read_turn() / read_session() 通过 mmap 读回 int16 数组。
+    会话最后一次写入 retention_seconds 秒后整体删除，由共享调度器按清单定时触发。
+    """
+
+    def __init__(self, root="audio_records", sample_rate=16000, channels=1, sample_width=2,
+                 segment_bytes=64 * 1024 * 1024, retention_seconds=3600, scheduler=None):
+        self.root = root
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.segment_bytes = segment_bytes
+        self.retention_seconds = retention_seconds
+        self.scheduler = scheduler or get_scheduler()
+        self._lock = threading.Lock()
+        self._index = {}  # sid -> [{"turn", "segment", "offset", "length", "ts"}]
+        self._maps = {}  # (sid, segment) -> mmap
+        os.makedirs(root, exist_ok=True)
+        self._manifest_path = os.path.join(root, "manifest.json")
+        self._manifest = self._load_manifest()  # sid -> 最后写入时间（time.time()）
+        now = time.time()
+        for sid, updated_at in list(self._manifest.items()):
+            self._schedule_expiry(sid, max(0.0, updated_at + retention_seconds - now))
+        ARCHIVE_SESSIONS.set_function(lambda: len(self._manifest))
+        logging.info(f"录音归档目录: {root}，保留 {retention_seconds}s，已有会话 {len(self._manifest)} 个")
+
+    # ---------------- 路径与清单 ----------------
+
+    def _key(self, sid):
+        return _SAFE_SID.sub("_", str(sid))
+
+    def _segment_path(self, sid, segment):
+        return os.path.join(self.root, f"{self._key(sid)}.{segment}.pcm")
+
+    def _index_path(self, sid):
+        return os.path.join(self.root, f"{self._key(sid)}.idx")
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取录音归档清单失败，按空清单处理: {e}")
+            return {}
+
+    def _save_manifest(self):
+        """调用方持有锁。写临时文件后原子替换。"""
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _schedule_expiry(self, sid, delay):
+        self.scheduler.schedule(("audio_archive_expire", sid), delay, lambda: self.expire(sid))
+
+    def _load_index(self, sid):
+        """调用方持有锁。内存中没有时从 .idx 文件读取。"""
+        entries = self._index.get(sid)
+        if entries is None:
+            entries = []
+            try:
+                with open(self._index_path(sid), encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entries.append(json.loads(line))
+            except FileNotFoundError:
+                pass
+            self._index[sid] = entries
+        return entries
+
+    # ---------------- 写入 ----------------
+
+    def append_turn(self, sid, frames):
+        """把一轮回答的音频帧追加到会话归档，返回题号（从 1 开始）；没有音频时返回 None。"""
+        data = b"".join(frames)
+        if not data:
+            return None
+        with self._lock:
+            entries = self._load_index(sid)
+            segment, offset = 0, 0
+            if entries:
+                last = entries[-1]
+                segment, offset = last["segment"], last["offset"] + last["length"]
+                if offset and offset + len(data) > self.segment_bytes:
+                    segment, offset = segment + 1, 0  # 一道题的音频不跨段
+            with open(self._segment_path(sid, segment), "ab") as f:
+                if f.tell() != offset:
+                    # 上次写入中途失败留下的残余数据，以索引为准从文件末尾继续
+                    offset = f.tell()
+                f.write(data)
+            entry = {"turn": len(entries) + 1, "segment": segment, "offset": offset,
+                     "length": len(data), "ts": time.time()}
+            with open(self._index_path(sid), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            entries.append(entry)
+            self._manifest[sid] = entry["ts"]
+            self._save_manifest()
+        ARCHIVE_BYTES.inc(len(data))
+        self._schedule_expiry(sid, self.retention_seconds)
+        logging.info(f"会话 {sid} 第{entry['turn']}题录音已归档: 段 {segment}，偏移 {offset}，{len(data)} 字节")
+        return entry["turn"]
+
+    # ---------------- 读取 ----------------
+
+    def turns(self, sid):
+        """会话各题的索引项列表。"""
+        with self._lock:
+            return [dict(e) for e in self._load_index(sid)]
+
+    def _map(self, sid, segment, end):
+        """调用方持有锁。返回至少覆盖到 end 字节的只读映射；文件追加后重新映射。"""
+        mapped = self._maps.get((sid, segment))
+        if mapped is None or len(mapped) < end:
+            with open(self._segment_path(sid, segment), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # 旧映射可能仍被返回过的数组引用，不主动 close，引用释放后自动回收
+            self._maps[(sid, segment)] = mapped
+        return mapped
+
+    def read_turn(self, sid, turn):
+        """返回第 turn 题录音的 int16 数组（直接引用映射内存，只读）；不存在时返回 None。"""
+        with self._lock:
+            entries = self._load_index(sid)
+            if not 1 <= turn <= len(entries):
+                return None
+            entry = entries[turn - 1]
+            mapped = self._map(sid, entry["segment"], entry["offset"] + entry["length"])
+        return np.frombuffer(mapped, dtype=np.int16, count=entry["length"] // 2, offset=entry["offset"])
+
+    def turn_location(self, sid, turn):
+        """第 turn 题录音在磁盘上的位置 (段文件路径, 字节偏移, 字节长度)，供其他进程直接映射读取；不存在时返回 None。"""
+        with self._lock:
+            entries = self._load_index(sid)
+            if not 1 <= turn <= len(entries):
+                return None
+            entry = entries[turn - 1]
+            return self._segment_path(sid, entry["segment"]), entry["offset"], entry["length"]
+
+    def read_session(self, sid):
+        """整场面试的录音（各题按顺序拼接），没有录音时返回 None。"""
+        arrays = [self.read_turn(sid, e["turn"]) for e in self.turns(sid)]
+        return np.concatenate(arrays) if arrays else None
+
+    def export_wav(self, sid, path, turn=None):
+        """导出为 WAV（用于回放或上传转写），turn 为 None 时导出整场。返回路径，没有录音时返回 None。"""
+        samples = self.read_session(sid) if turn is None else self.read_turn(sid, turn)
+        if samples is None:
+            return None
+        with wave.open(path, "wb") as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(self.sample_width)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(samples.tobytes())
+        return path
+
+    def open_wav(self, sid, turns=None):
+        """
+        以只读文件对象的形式提供 WAV（默认整场，turns 为题号列表时只包含这些题），
+        数据按需从映射内存中读取，用于流式上传，不生成临时文件也不把整场录音读入内存。
+        """
+        with self._lock:
+            entries = self._load_index(sid)
+            wanted = set(turns) if turns is not None else None
+            chunks = []
+            for entry in entries:
+                if wanted is None or entry["turn"] in wanted:
+                    mapped = self._map(sid, entry["segment"], entry["offset"] + entry["length"])
+                    chunks.append(memoryview(mapped)[entry["offset"]:entry["offset"] + entry["length"]])
+        return ArchiveWavStream(chunks, self.sample_rate, self.channels, self.sample_width)
+
+    # ---------------- 过期 ----------------
+
+    def expire(self, sid):
+        """删除会话的全部录音和索引。"""
+        with self._lock:
+            updated_at = self._manifest.get(sid)
+            if updated_at is not None and time.time() - updated_at < self.retention_seconds:
+                # 调度之后又有新写入，等下一次到期
+                delay = updated_at + self.retention_seconds - time.time()
+                self._schedule_expiry(sid, delay)
+                return
+            entries = self._load_index(sid)
+            segments = {e["segment"] for e in entries} or {0}
+            for key in [k for k in self._maps if k[0] == sid]:
+                del self._maps[key]
+            paths = [self._segment_path(sid, s) for s in segments] + [self._index_path(sid)]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"删除过期录音失败 {path}: {e}")
+            self._index.pop(sid, None)
+            if self._manifest.pop(sid, None) is not None:
+                self._save_manifest()
+        logging.info(f"会话 {sid} 的录音已过期删除（{len(entries)} 题）")
+
+
+class ArchiveWavStream:
+    """
+    由 WAV 头和若干段映射内存拼成的只读文件对象。实现 read/seek/tell 和 len()，
+    requests 据此设置 Content-Length 并分块发送；上传重试时 seek(0) 即可从头再读。
+    """
+
+    def __init__(self, chunks, sample_rate, channels, sample_width):
+        data_size = sum(len(c) for c in chunks)
+        header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1,
+                             channels, sample_rate, sample_rate * channels * sample_width,
+                             channels * sample_width, sample_width * 8, b"data", data_size)
+        self._chunks = [memoryview(header)] + list(chunks)
+        self._size = len(header) + data_size
+        self._pos = 0
+
+    def __len__(self):
+        return self._size
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._size}[whence]
+        self._pos = min(max(base + offset, 0), self._size)
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._size - self._pos
+        parts = []
+        start = 0
+        for chunk in self._chunks:
+            end = start + len(chunk)
+            if self._pos < end and size > 0:
+                piece = chunk[self._pos - start:self._pos - start + size]
+                parts.append(piece)
+                self._pos += len(piece)
+                size -= len(piece)
+            start = end
+        return b"".join(parts)
+
+    def close(self):
+        self._chunks = []
@@ -0,0 +1,125 @@
+# audio_codec.py - 前端音频流的编码协商、拆包与解码
+import struct
+import logging
+
+# Opus 解码依赖 libopus，未安装时只支持原始 PCM 和 speex-wb 直通
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+    logging.warning("未安装 opuslib，audio_stream 将不支持 Opus 编码。")
+
+# 前端可协商的编码，按服务端偏好排序
+CODEC_PCM = "pcm"
+CODEC_OPUS = "opus"
+CODEC_SPEEX_WB = "speex-wb"
+
+# 讯飞 IAT 对应的 data.encoding 取值
+ASR_ENCODINGS = {
+    CODEC_PCM: "raw",
+    CODEC_SPEEX_WB: "speex-wb",
+}
+
+
+def available_codecs():
+    """返回当前服务端可以接收的编码列表。"""
+    codecs = [CODEC_PCM, CODEC_SPEEX_WB]
+    if opuslib is not None:
+        codecs.insert(0, CODEC_OPUS)
+    return codecs
+
+
+def negotiate_codec(requested):
+    """
+    根据前端给出的编码偏好列表（或单个编码名）选出本会话使用的编码。
+    没有交集时回退到原始 PCM。
+    """
+    if isinstance(requested, str):
+        requested = [requested]
+    supported = available_codecs()
+    for codec in requested or []:
+        if codec in supported:
+            return codec
+    return CODEC_PCM
+
+
+def split_packets(data):
+    """
+    拆分前端批量发送的压缩帧。
+    格式：每个包前有 2 字节大端长度，前端每 ~200ms 打包一次发送，避免每 20ms 一个 Socket.IO 事件。
+    """
+    packets = []
+    offset = 0
+    total = len(data)
+    while offset + 2 <= total:
+        (length,) = struct.unpack_from(">H", data, offset)
+        offset += 2
+        if offset + length > total:
+            logging.warning(f"压缩音频包不完整，丢弃剩余 {total - offset + 2} 字节")
+            break
+        packets.append(bytes(data[offset:offset + length]))
+        offset += length
+    return packets
+
+
+class AudioStreamDecoder:
+    """
+    单个会话的音频解码器。
+    - pcm：原样返回；
+    - opus：逐包解码为 16kHz int16 PCM，进入现有的 PCM 缓冲和 VAD/ASR 流程；
+    - speex-wb：讯飞 IAT 可直接识别，不在本地解码，只转换成讯飞要求的帧格式直通 ASR。
+    """
+
+    # Opus 单包最长 120ms
+    MAX_OPUS_FRAME_MS = 120
+
+    def __init__(self, codec=CODEC_PCM, sample_rate=16000, channels=1):
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._opus_decoder = None
+        if codec == CODEC_OPUS:
+            if opuslib is None:
+                raise RuntimeError("opuslib 未安装，无法解码 Opus 音频")
+            self._opus_decoder = opuslib.Decoder(sample_rate, channels)
+            self._max_frame_size = sample_rate * self.MAX_OPUS_FRAME_MS // 1000
+            self._last_frame_size = sample_rate // 50  # 默认 20ms，用于丢包补偿
+
+    @property
+    def passthrough(self):
+        """压缩帧是否直接转发给 ASR（不解码为 PCM）。"""
+        return self.codec == CODEC_SPEEX_WB
+
+    @property
+    def asr_encoding(self):
+        return ASR_ENCODINGS.get(self.codec, "raw")
+
+    def decode(self, data):
+        """把一次 audio_stream 收到的数据解码为 PCM 字节。直通编码返回 None。"""
+        if self.codec == CODEC_PCM:
+            return bytes(data)
+        if self.codec == CODEC_OPUS:
+            pcm = []
+            for packet in split_packets(data):
+                try:
+                    frame = self._opus_decoder.decode(packet, self._max_frame_size)
+                    self._last_frame_size = len(frame) // (2 * self.channels)
+                except Exception as e:
+                    # 单包损坏时按上一帧时长做丢包补偿，避免整段音频错位
+                    logging.warning(f"Opus 解码失败，使用丢包补偿: {e}")
+                    frame = self._opus_decoder.decode(b'', self._last_frame_size)
+                pcm.append(frame)
+            return b''.join(pcm)
+        return None
+
+    def to_asr_frames(self, data):
+        """
+        将 speex-wb 包转换为讯飞 IAT 要求的格式：每帧前 1 字节长度。
+        """
+        frames = []
+        for packet in split_packets(data):
+            if len(packet) > 255:
+                logging.warning(f"speex-wb 帧过长 ({len(packet)} 字节)，已丢弃")
+                continue
+            frames.append(bytes([len(packet)]) + packet)
+        return b''.join(frames)
@@ -0,0 +1,181 @@
+# batch_transcription.py - 面试结束后把整场录音提交录音文件转写，高精度文本按题写回存储
+#
+# 实时 ASR 追求低延迟，准确率不如录音文件转写。面试结束后把归档中的整场录音一次上传，
+# 各会话的订单交给同一个 LfasrPoller 轮询（自适应间隔），完成后按各题在录音中的时间范围拆分文本，
+# 写入 turns.transcript，生成评测报告时优先使用。
+#
+# 接口不支持分片上传，长录音在题目边界处切成若干部分（每部分不超过 part_seconds），
+# 各部分作为独立订单并行上传，音频直接从归档映射内存流式读取；
+# 某一部分上传中断只重传这一部分，不必重传整场。
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import metrics
+from xfyun_lfasr_client import LfasrPoller, LfasrTimeout
+
+BATCH_SECONDS = metrics.histogram("batch_transcription_seconds", "整场录音从上传到写回转写结果的耗时", ["outcome"])
+BATCH_PARTS = metrics.histogram("batch_transcription_parts", "每场录音切分的上传部分数", buckets=(1, 2, 3, 4, 6, 8, 12, 16))
+
+
+def split_by_turns(sentences, turn_entries, sample_rate=16000, sample_width=2):
+    """
+    按录音归档中各题的长度把分句分配到题目：整场录音是各题按顺序拼接的，
+    分句的中点落在哪一题的时间范围内就归入哪一题。返回 {录音题号: 文本}。
+    """
+    bounds = []
+    start_ms = 0.0
+    for entry in turn_entries:
+        end_ms = start_ms + entry["length"] / sample_width / sample_rate * 1000
+        bounds.append((entry["turn"], start_ms, end_ms))
+        start_ms = end_ms
+    texts = {turn: [] for turn, _, _ in bounds}
+    for sentence in sentences:
+        mid = (sentence["begin_ms"] + sentence["end_ms"]) / 2
+        for turn, begin, end in bounds:
+            if mid < end or turn == bounds[-1][0]:
+                texts[turn].append(sentence["text"])
+                break
+    return {turn: "".join(parts) for turn, parts in texts.items() if parts}
+
+
+def plan_parts(turn_entries, max_bytes):
+    """按题目边界把各题分组，每组音频总长不超过 max_bytes（单题超长时单独成组）。"""
+    parts, current, size = [], [], 0
+    for entry in turn_entries:
+        if current and size + entry["length"] > max_bytes:
+            parts.append(current)
+            current, size = [], 0
+        current.append(entry)
+        size += entry["length"]
+    if current:
+        parts.append(current)
+    return parts
+
+
+class _Job:
+    """一次提交的转写任务：记录还未完成的部分数，全部结束后完成 future。"""
+
+    def __init__(self, sid, parts, future):
+        self.sid = sid
+        self.future = future
+        self.remaining = len(parts)
+        self.failed = 0
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def part_done(self, ok):
+        """返回 None 表示还有未完成的部分，否则返回是否全部成功。"""
+        with self.lock:
+            self.remaining -= 1
+            self.failed += 0 if ok else 1
+            if self.remaining:
+                return None
+            return self.failed == 0
+
+
+class BatchTranscriber:
+    """
+    submit(sid) 把会话录音切分后在上传线程中并行上传各部分，拿到 orderId 后交给轮询服务，
+    每部分转写完成时在回调中按题写回 store。上传线程不等待转写，workers 只限制同时上传的数量。
+    同一会话可以多次提交，每次只上传还没有提交过的题（如面试结束后才归档的最后一题）；
+    某一部分上传失败或转写超时，这部分的题会从已提交中移除，下次提交时重新上传。
+    wait(sid) 供评测报告等待进行中的转写，返回已写回转写文本的题号。
+    """
+
+    def __init__(self, client, archive, store, workers=4, timeout=1800, language="cn", poller=None,
+                 part_seconds=600, upload_retries=3):
+        self.client = client
+        self.archive = archive
+        self.store = store
+        self.timeout = timeout
+        self.language = language
+        self.part_bytes = int(part_seconds * archive.sample_rate * archive.sample_width * archive.channels)
+        self.upload_retries = upload_retries
+        self.poller = poller or LfasrPoller(client, timeout=timeout)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="BatchTranscriber")
+        self._futures = {}  # sid -> [进行中的 future]
+        self._submitted = {}  # sid -> 进行中或已完成转写的录音题号
+        self._transcribed = {}  # sid -> 已写回转写文本的录音题号
+        self._lock = threading.Lock()
+
+    def submit(self, sid):
+        """提交会话中还没有转写的题，返回本次提交的 future；没有需要提交的题时返回 None。"""
+        with self._lock:
+            submitted = self._submitted.setdefault(sid, set())
+            entries = [e for e in self.archive.turns(sid) if e["turn"] not in submitted]
+            if not entries:
+                return None
+            submitted.update(e["turn"] for e in entries)
+            future = Future()
+            futures = self._futures.setdefault(sid, [])
+            futures[:] = [f for f in futures if not f.done()] + [future]
+        parts = plan_parts(entries, self.part_bytes)
+        BATCH_PARTS.observe(len(parts))
+        job = _Job(sid, parts, future)
+        for index, part in enumerate(parts):
+            self._executor.submit(self._upload, job, index, part)
+        logging.info(f"会话 {sid} 已提交录音文件转写，第{entries[0]['turn']}-{entries[-1]['turn']}题，"
+                     f"分 {len(parts)} 部分上传")
+        return future
+
+    def wait(self, sid, timeout):
+        """
+        最多等待 timeout 秒让会话进行中的转写结束，返回已写回转写文本的录音题号集合。
+        某次提交失败不影响其他题，调用方按题使用转写文本，缺的题回退到实时识别文本。
+        """
+        with self._lock:
+            futures = list(self._futures.get(sid, []))
+        if futures:
+            wait(futures, timeout=timeout)
+        with self._lock:
+            return set(self._transcribed.get(sid, ()))
+
+    def forget(self, sid):
+        with self._lock:
+            self._futures.pop(sid, None)
+            self._submitted.pop(sid, None)
+            self._transcribed.pop(sid, None)
+
+    def _upload(self, job, index, part):
+        stream = self.archive.open_wav(job.sid, turns=[e["turn"] for e in part])
+        duration_ms = sum(e["length"] for e in part) / self.archive.sample_width / self.archive.sample_rate * 1000
+        try:
+            order_id, estimate = self.client.upload_stream(
+                stream, f"{job.sid}_{part[0]['turn']}.wav", len(stream), language=self.language,
+                duration_ms=duration_ms, retries=self.upload_retries)
+        except Exception as e:
+            logging.error(f"会话 {job.sid} 第{index + 1}部分录音上传失败: {e}", exc_info=True)
+            self._part_done(job, part, False)
+            return
+        finally:
+            stream.close()
+        self.poller.watch(order_id, lambda _, sentences, error: self._complete(job, index, part, sentences, error),
+                          estimate=estimate)
+
+    def _complete(self, job, index, part, sentences, error):
+        """轮询线程中调用：只做拆分和入队写库，不做耗时操作。"""
+        if sentences is None:
+            logging.warning(f"会话 {job.sid} 第{index + 1}部分录音转写未完成: {error}")
+            self._part_done(job, part, False, timeout=isinstance(error, LfasrTimeout))
+            return
+        texts = split_by_turns(sentences, part, self.archive.sample_rate, self.archive.sample_width)
+        for audio_turn, text in texts.items():
+            self.store.set_turn_transcript(job.sid, audio_turn, text)
+        logging.info(f"会话 {job.sid} 第{index + 1}部分录音转写完成，{len(sentences)} 句，写回 {len(texts)} 题")
+        self._part_done(job, part, True)
+
+    def _part_done(self, job, part, ok, timeout=False):
+        turns = {e["turn"] for e in part}
+        with self._lock:
+            if ok:
+                self._transcribed.setdefault(job.sid, set()).update(turns)
+            elif job.sid in self._submitted:
+                self._submitted[job.sid] -= turns  # 下次提交时重新上传
+        all_ok = job.part_done(ok)
+        if all_ok is None:
+            return
+        outcome = "ok" if all_ok else ("timeout" if timeout else "error")
+        BATCH_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - job.start)
+        job.future.set_result(all_ok)
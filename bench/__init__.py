@@ -0,0 +1 @@
+# bench - 离线压测工具：讯飞服务本地替身与 Socket.IO 负载驱动
@@ -0,0 +1,247 @@
+# bench/load_driver.py - 通过 Socket.IO 向 app_server.py 回放录好的 WAV 回答，模拟 N 个并发候选人
+#
+# 用法（先启动 bench.mock_xfyun 和指向它的 app_server.py）：
+#   python -m bench.load_driver --sessions 8 --turns 3 --wav answers/a.wav answers/b.wav \
+#       --server-pid $(pgrep -f app_server.py)
+# 每轮记录三段延迟：
+#   transcript：发出 end_answer 到收到 answer_result.text
+#   reply：发出 user_answer 到收到 ai_question（星火 + TTS 播放）
+#   turn：end_answer 到 ai_question，即候选人感知的等待时间
+import argparse
+import json
+import logging
+import threading
+import time
+import wave
+
+import requests
+import socketio
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CHUNK_SAMPLES = 4096  # 与前端 ScriptProcessor 的缓冲大小一致
+
+
+def load_wav(path):
+    """读取 16k 单声道 16bit WAV，返回 PCM 字节。"""
+    with wave.open(path, "rb") as wf:
+        if wf.getframerate() != 16000 or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"{path} 不是 16k 单声道 16bit WAV")
+        return wf.readframes(wf.getnframes())
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class CandidateSession:
+    """一个模拟候选人：独立的 Socket.IO 连接，按轮次回放音频并记录延迟。"""
+
+    def __init__(self, index, server, pcm_list, turns, speed, timeout):
+        self.index = index
+        self.server = server
+        self.pcm_list = pcm_list
+        self.turns = turns
+        self.speed = speed
+        self.timeout = timeout
+        self.records = []
+        self.errors = []
+        self._can_answer = threading.Event()
+        self._transcript = None
+        self._transcript_event = threading.Event()
+        self._question_event = threading.Event()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on("can_answer", self._on_can_answer)
+        self.sio.on("answer_result", self._on_answer_result)
+        self.sio.on("ai_question", self._on_ai_question)
+
+    def _on_can_answer(self, data=None):
+        self._can_answer.set()
+
+    def _on_answer_result(self, data):
+        if data and "text" in data:
+            self._transcript = data["text"]
+            self._transcript_event.set()
+
+    def _on_ai_question(self, data=None):
+        self._question_event.set()
+
+    def _stream(self, pcm):
+        chunk_bytes = CHUNK_SAMPLES * 2
+        interval = CHUNK_SAMPLES / 16000.0 / self.speed if self.speed > 0 else 0
+        next_send = time.perf_counter()
+        for offset in range(0, len(pcm), chunk_bytes):
+            self.sio.emit("audio_stream", pcm[offset:offset + chunk_bytes])
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def run(self):
+        try:
+            self.sio.connect(self.server, transports=["websocket"])
+            self.sio.emit("audio_config", {"codecs": ["pcm"]})
+            for turn in range(self.turns):
+                if not self._can_answer.wait(self.timeout):
+                    self.errors.append(f"turn {turn}: 等待 can_answer 超时")
+                    break
+                self._can_answer.clear()
+                self._transcript_event.clear()
+                self._question_event.clear()
+
+                self.sio.emit("start_answer")
+                self._stream(self.pcm_list[(self.index + turn) % len(self.pcm_list)])
+
+                end_answer_at = time.perf_counter()
+                self.sio.emit("end_answer")
+                if not self._transcript_event.wait(self.timeout):
+                    self.errors.append(f"turn {turn}: 等待转写结果超时")
+                    break
+                transcript_at = time.perf_counter()
+
+                self.sio.emit("user_answer", {"text": self._transcript or ""})
+                if not self._question_event.wait(self.timeout):
+                    self.errors.append(f"turn {turn}: 等待下一题超时")
+                    break
+                question_at = time.perf_counter()
+                self.records.append({
+                    "session": self.index,
+                    "turn": turn,
+                    "transcript_s": transcript_at - end_answer_at,
+                    "reply_s": question_at - transcript_at,
+                    "turn_s": question_at - end_answer_at,
+                    "transcript_chars": len(self._transcript or ""),
+                })
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+        finally:
+            if self.sio.connected:
+                self.sio.disconnect()
+
+
+class ResourceSampler(threading.Thread):
+    """定期采样服务端进程（含子进程）的 CPU 和常驻内存。需要 psutil。"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.cpu = []
+        self.rss_mb = []
+        self._stop_event = threading.Event()
+
+    def _processes(self):
+        try:
+            return [self.process] + self.process.children(recursive=True)
+        except psutil.Error:
+            return [self.process]
+
+    def run(self):
+        for p in self._processes():
+            p.cpu_percent(None)
+        while not self._stop_event.wait(self.interval):
+            cpu = rss = 0.0
+            for p in self._processes():
+                try:
+                    cpu += p.cpu_percent(None)
+                    rss += p.memory_info().rss
+                except psutil.Error:
+                    continue
+            self.cpu.append(cpu)
+            self.rss_mb.append(rss / 1024 / 1024)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def summarize(records, sampler, wall_seconds, errors):
+    summary = {"turns": len(records), "errors": len(errors), "wall_s": wall_seconds}
+    for key in ("transcript_s", "reply_s", "turn_s"):
+        values = [r[key] for r in records]
+        summary[key] = {
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+            "max": max(values) if values else 0.0,
+        }
+    if sampler is not None and sampler.cpu:
+        summary["cpu_percent"] = {"avg": sum(sampler.cpu) / len(sampler.cpu), "max": max(sampler.cpu)}
+        summary["rss_mb"] = {"avg": sum(sampler.rss_mb) / len(sampler.rss_mb), "max": max(sampler.rss_mb)}
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n完成轮次: {summary['turns']}，失败: {summary['errors']}，总耗时: {summary['wall_s']:.1f}s")
+    print(f"{'指标':14s} {'p50(s)':>8s} {'p90(s)':>8s} {'p99(s)':>8s} {'max(s)':>8s}")
+    for key in ("transcript_s", "reply_s", "turn_s"):
+        s = summary[key]
+        print(f"{key:14s} {s['p50']:8.3f} {s['p90']:8.3f} {s['p99']:8.3f} {s['max']:8.3f}")
+    if "cpu_percent" in summary:
+        print(f"CPU: 平均 {summary['cpu_percent']['avg']:.1f}% 峰值 {summary['cpu_percent']['max']:.1f}%  "
+              f"内存: 平均 {summary['rss_mb']['avg']:.1f}MB 峰值 {summary['rss_mb']['max']:.1f}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI 面试服务 Socket.IO 压测驱动")
+    parser.add_argument("--server", default="http://127.0.0.1:5000")
+    parser.add_argument("--sessions", type=int, default=4, help="并发候选人数")
+    parser.add_argument("--turns", type=int, default=3, help="每个候选人回答的轮数")
+    parser.add_argument("--wav", nargs="+", required=True, help="回放的 16k 单声道 WAV，按轮次轮流使用")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，0 表示不限速")
+    parser.add_argument("--timeout", type=float, default=60.0, help="每个等待步骤的超时（秒）")
+    parser.add_argument("--ramp", type=float, default=0.2, help="相邻会话的启动间隔（秒）")
+    parser.add_argument("--server-pid", type=int, help="采样该进程的 CPU/内存（需要 psutil）")
+    parser.add_argument("--no-start", action="store_true", help="不调用 /api/interview/start")
+    parser.add_argument("--output", help="把逐轮记录和汇总写成 JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    pcm_list = [load_wav(p) for p in args.wav]
+
+    sampler = None
+    if args.server_pid:
+        if psutil is None:
+            logging.warning("未安装 psutil，跳过 CPU/内存采样")
+        else:
+            sampler = ResourceSampler(args.server_pid)
+            sampler.start()
+
+    sessions = [CandidateSession(i, args.server, pcm_list, args.turns, args.speed, args.timeout)
+                for i in range(args.sessions)]
+    threads = [threading.Thread(target=s.run, daemon=True) for s in sessions]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+        time.sleep(args.ramp)
+    if not args.no_start:
+        # 主流程线程播完开场白后会广播 can_answer，所有会话开始第一轮
+        requests.post(f"{args.server}/api/interview/start", timeout=10)
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    if sampler is not None:
+        sampler.stop()
+
+    records = [r for s in sessions for r in s.records]
+    errors = [f"session {s.index}: {e}" for s in sessions for e in s.errors]
+    for e in errors:
+        logging.error(e)
+    summary = summarize(records, sampler, wall, errors)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "summary": summary, "records": records, "errors": errors},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
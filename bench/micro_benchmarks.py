@@ -0,0 +1,428 @@
+# bench/micro_benchmarks.py - 单请求热路径的微基准：语音分析、表情识别解码/推理、面试文本去重、评测结果解析
+#
+# 用法：
+#   python -m bench.micro_benchmarks                 # 运行全部用例并追加到历史记录
+#   python -m bench.micro_benchmarks -k voice        # 只运行名称包含 voice 的用例
+#   python -m bench.micro_benchmarks --check 0.2     # 与上一次记录比较，中位数变慢超过 20% 时返回非零
+# 历史记录按行追加在 bench/results/micro.jsonl，每行一次运行（含 git 提交号），便于跟踪趋势。
+import argparse
+import base64
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 4096  # 与前端 ScriptProcessor 每次推送的样本数一致
+AUDIO_SECONDS = (1, 30, 180)
+IMAGE_SIZES = ((320, 240), (640, 480), (1280, 720))
+TRANSCRIPT_LINES = (200, 1000, 5000)
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "micro.jsonl")
+
+_cases = []
+
+
+def case(name, params=(None,)):
+    """注册一个用例。被装饰函数接收参数，返回 (被测函数, 清理函数或 None)。"""
+    def decorator(factory):
+        for param in params:
+            label = name if param is None else f"{name}[{_param_label(param)}]"
+            _cases.append((label, factory, param))
+        return factory
+    return decorator
+
+
+def _param_label(param):
+    if isinstance(param, tuple):
+        return "x".join(str(p) for p in param)
+    return str(param)
+
+
+class Skip(Exception):
+    """用例依赖的可选组件不可用。"""
+
+
+@contextlib.contextmanager
+def _quiet():
+    """被测代码里有大量 print，计时时丢弃输出，避免终端 I/O 干扰结果。"""
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(func, min_time=0.5, min_rounds=5, max_rounds=1000):
+    """重复运行 func，至少 min_rounds 次且累计不少于 min_time 秒，返回每次耗时（秒）。"""
+    with _quiet():
+        func()  # 预热：首次调用的导入、缓存、分配不计入
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < max_rounds:
+            t0 = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t0)
+            if len(timings) >= min_rounds and time.perf_counter() - started >= min_time:
+                break
+    return timings
+
+
+# ---------------------------------------------------------------------------
+# 测试数据
+# ---------------------------------------------------------------------------
+
+def synthetic_speech(seconds, seed=0):
+    """类语音的 16k int16 信号：150Hz 基频加谐波，按音节做幅度调制，叠加少量噪声。"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voiced = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+    signal = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(t.size)
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+def pcm_chunks(pcm):
+    size = CHUNK_SAMPLES * 2
+    return [pcm[i:i + size] for i in range(0, len(pcm), size)]
+
+
+def synthetic_transcript(lines, seed=0):
+    """模拟前端拼出的面试记录：问答交替，夹杂 ASR 中间结果带来的前缀重复行。"""
+    rng = np.random.default_rng(seed)
+    vocabulary = list("我在项目中负责后端开发主要使用数据库缓存消息队列进行性能优化并且与团队协作完成上线")
+    out = []
+    while len(out) < lines:
+        sentence = "".join(rng.choice(vocabulary, size=int(rng.integers(20, 60))))
+        speaker = "面试官：" if len(out) % 4 == 0 else "候选人："
+        # 中间结果：同一句话的若干前缀先后出现
+        for cut in sorted(rng.integers(5, len(sentence), size=int(rng.integers(0, 3)))):
+            out.append(speaker + sentence[:cut])
+        out.append(speaker + sentence)
+    return "\n".join(out[:lines])
+
+
+def image_data_url(width, height, seed=0):
+    import cv2
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    cv2.ellipse(img, (width // 2, height // 2), (width // 6, height // 4), 0, 0, 360, (180, 160, 150), -1)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+def decode_data_url(data_url):
+    """与 app_server.face_emotion 中的解码步骤一致。"""
+    import cv2
+    img_bytes = base64.b64decode(data_url.split(",")[1])
+    return cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+# ---------------------------------------------------------------------------
+# 用例
+# ---------------------------------------------------------------------------
+
+def _voice_analyzer():
+    from voice_analyzer import VoiceAnalyzer
+    with _quiet():
+        return VoiceAnalyzer()
+
+
+@case("voice.save_audio", AUDIO_SECONDS)
+def bench_save_audio(seconds):
+    analyzer = _voice_analyzer()
+    frames = pcm_chunks(synthetic_speech(seconds))
+    workdir = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(workdir.name)  # save_audio 写入相对路径 audio_records/
+
+    def cleanup():
+        os.chdir(cwd)
+        workdir.cleanup()
+    return (lambda: analyzer.save_audio(frames, filename="bench.wav")), cleanup
+
+
+@case("voice.analyze_audio_features", AUDIO_SECONDS)
+def bench_analyze_audio_features(seconds):
+    analyzer = _voice_analyzer()
+    workdir = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(workdir.name)
+    with _quiet():
+        path = analyzer.save_audio(pcm_chunks(synthetic_speech(seconds)), filename="bench.wav")
+
+    def cleanup():
+        os.chdir(cwd)
+        workdir.cleanup()
+    return (lambda: analyzer.analyze_audio_features(path)), cleanup
+
+
+@case("voice.analyze_audio_samples", AUDIO_SECONDS)
+def bench_analyze_audio_samples(seconds):
+    analyzer = _voice_analyzer()
+    samples = np.frombuffer(synthetic_speech(seconds), dtype=np.int16)
+    return (lambda: analyzer.analyze_audio_samples(samples)), None
+
+
+@case("audio_archive.append_and_read", AUDIO_SECONDS)
+def bench_audio_archive(seconds):
+    from audio_archive import AudioArchive
+    from timer_service import DeadlineScheduler
+    workdir = tempfile.TemporaryDirectory()
+    scheduler = DeadlineScheduler()
+    archive = AudioArchive(workdir.name, scheduler=scheduler)
+    frames = pcm_chunks(synthetic_speech(seconds))
+
+    def run():
+        turn = archive.append_turn("bench", frames)
+        archive.read_turn("bench", turn).sum()
+
+    def cleanup():
+        scheduler.shutdown()
+        workdir.cleanup()
+    return run, cleanup
+
+
+@case("voice.calculate_audio_features", AUDIO_SECONDS)
+def bench_calculate_audio_features(seconds):
+    analyzer = _voice_analyzer()
+    chunks = pcm_chunks(synthetic_speech(seconds))
+
+    def run():
+        for chunk in chunks:
+            analyzer.calculate_audio_features(chunk)
+    return run, None
+
+
+@case("voice.is_speaking", AUDIO_SECONDS)
+def bench_is_speaking(seconds):
+    analyzer = _voice_analyzer()
+    chunks = pcm_chunks(synthetic_speech(seconds))
+
+    def run():
+        for chunk in chunks:
+            analyzer.is_speaking(chunk)
+    return run, None
+
+
+@case("face_emotion.decode", IMAGE_SIZES)
+def bench_face_decode(size):
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        raise Skip("未安装 opencv-python")
+    data_url = image_data_url(*size)
+    return (lambda: decode_data_url(data_url)), None
+
+
+@case("face_emotion.decode_and_inference", IMAGE_SIZES)
+def bench_face_inference(size):
+    try:
+        from deepface import DeepFace
+    except ImportError:
+        raise Skip("未安装 deepface")
+    data_url = image_data_url(*size)
+
+    def run():
+        img = decode_data_url(data_url)
+        DeepFace.analyze(img, actions=["emotion"], enforce_detection=False)
+    return run, None
+
+
+@case("video.record", ("opencv", "ffmpeg-h264", "ffmpeg-vp9", "pyav-h264"))
+def bench_video_record(kind):
+    try:
+        import video_processor
+    except ImportError:
+        raise Skip("未安装 opencv-python")
+    encoder, _, codec = kind.partition("-")
+    recorder_cls = video_processor.RECORDERS[encoder]
+    if hasattr(recorder_cls, "available") and not recorder_cls.available():
+        raise Skip(f"{encoder} 不可用")
+    # 2 秒 640x480@30fps：静态背景上移动的色块，接近摄像头画面的可压缩性
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    frames = []
+    for i in range(60):
+        frame = background.copy()
+        frame[100:200, 10 * i:10 * i + 100] = (0, 200, 255)
+        frames.append(frame)
+    workdir = tempfile.TemporaryDirectory()
+    path = os.path.join(workdir.name, "out.mp4")
+
+    def run():
+        recorder = video_processor.create_recorder(encoder, codec or "h264")
+        recorder.open(path, 30.0, (640, 480))
+        for frame in frames:
+            recorder.write(frame)
+        recorder.close()
+
+    return run, workdir.cleanup
+
+
+@case("frame_bus.fanout", (1, 3, 6))
+def bench_frame_bus(subscribers):
+    try:
+        from frame_bus import FrameBus
+    except ImportError:
+        raise Skip("未安装 opencv-python")
+    # 一路 640x480 画面分发给 N 个要 320x240 的分析订阅者：缩放只做一次，缓冲来自池
+    bus = FrameBus()
+    subs = [bus.subscribe(f"bench{i}", resolution=(320, 240)) for i in range(subscribers)]
+    image = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+
+    def run():
+        buffer = bus.acquire_buffer(image.shape)
+        buffer[:] = image
+        bus.publish(buffer)
+        for sub in subs:
+            view = sub.get(timeout=0)
+            view.image.mean()
+            view.release()
+    return run, bus.close
+
+
+@case("vision_worker.emotion", IMAGE_SIZES)
+def bench_vision_worker(size):
+    try:
+        import deepface  # noqa: F401
+        import cv2  # noqa: F401
+    except ImportError:
+        raise Skip("未安装 deepface")
+    from vision_worker import VisionPool
+    # 与 face_emotion.decode_and_inference 对比：多出的是共享内存拷贝和进程间往返
+    pool = VisionPool(workers=1, slots=2)
+    img = decode_data_url(image_data_url(*size))
+    pool.analyze(img, timeout=120)  # 等待工作进程加载模型
+    return (lambda: pool.analyze(img, timeout=30)), pool.close
+
+
+@case("interview_evaluation.remove_duplicates", TRANSCRIPT_LINES)
+def bench_remove_duplicates(lines):
+    from interview_evaluation_api import remove_duplicates
+    text = synthetic_transcript(lines)
+    return (lambda: remove_duplicates(text)), None
+
+
+@case("llm_json.extract_json", ("strict", "repair"))
+def bench_extract_json(kind):
+    from llm_json import extract_json
+    report = json.dumps({
+        "scores": {"专业知识水平": 85, "技能匹配度": 80, "语言表达能力": 90},
+        "key_issues": [{"question": "请介绍你的项目经验", "reason": "缺乏量化成果", "suggestion": "补充数据"}] * 5,
+        "suggestions": ["多用数据和案例支撑观点"] * 5,
+        "summary": "总体表现良好" * 20,
+    }, ensure_ascii=False, indent=2)
+    if kind == "repair":
+        # 代码块包裹、中文冒号、多余逗号、输出被截断
+        report = "```json\n" + report.replace('"summary":', '"summary"：').replace("]", ",]")[:-40]
+    return (lambda: extract_json(report)), None
+
+
+# ---------------------------------------------------------------------------
+# 运行与历史记录
+# ---------------------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_cases(pattern=None, min_time=0.5):
+    results = {}
+    for label, factory, param in _cases:
+        if pattern and pattern not in label:
+            continue
+        try:
+            func, cleanup = factory(param) if param is not None else factory()
+        except Skip as e:
+            print(f"{label:52s} 跳过：{e}")
+            continue
+        try:
+            timings = measure(func, min_time=min_time)
+        finally:
+            if cleanup:
+                cleanup()
+        results[label] = {
+            "rounds": len(timings),
+            "min_ms": min(timings) * 1e3,
+            "median_ms": statistics.median(timings) * 1e3,
+            "mean_ms": statistics.fmean(timings) * 1e3,
+            "stdev_ms": statistics.stdev(timings) * 1e3 if len(timings) > 1 else 0.0,
+        }
+        r = results[label]
+        print(f"{label:52s} median {r['median_ms']:10.3f} ms  min {r['min_ms']:10.3f} ms  "
+              f"({r['rounds']} 次)")
+    return results
+
+
+def load_history(path=RESULTS_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(results, path=RESULTS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "results": results,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def compare(results, previous, threshold):
+    """返回中位数相对上一次记录变慢超过 threshold 的用例列表。"""
+    regressions = []
+    for label, r in results.items():
+        old = previous.get("results", {}).get(label)
+        if not old:
+            continue
+        ratio = r["median_ms"] / old["median_ms"] if old["median_ms"] else 1.0
+        marker = "  <-- 变慢" if ratio > 1 + threshold else ""
+        print(f"{label:52s} {old['median_ms']:10.3f} -> {r['median_ms']:10.3f} ms ({ratio:5.2f}x){marker}")
+        if marker:
+            regressions.append(label)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="语音分析 / 表情识别 / 文本去重微基准")
+    parser.add_argument("-k", dest="pattern", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每个用例最少运行时间（秒）")
+    parser.add_argument("--check", type=float, metavar="RATIO",
+                        help="与上一次记录比较，中位数变慢超过该比例时返回非零（如 0.2）")
+    parser.add_argument("--no-save", action="store_true", help="不写入历史记录")
+    parser.add_argument("--results", default=RESULTS_PATH, help="历史记录文件")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    history = load_history(args.results)
+    results = run_cases(args.pattern, args.min_time)
+
+    regressions = []
+    if args.check is not None and history:
+        print("\n与上一次记录比较：")
+        regressions = compare(results, history[-1], args.check)
+    if not args.no_save:
+        append_history(results, args.results)
+    if regressions:
+        print(f"\n{len(regressions)} 个用例变慢超过 {args.check:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
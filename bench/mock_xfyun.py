@@ -0,0 +1,258 @@
+# bench/mock_xfyun.py - 讯飞 ASR / TTS / 星火的本地替身，用于离线压测
+#
+# 启动：python -m bench.mock_xfyun --port 9100
+# 然后让 app_server.py 指向它：
+#   XFYUN_ASR_URL=ws://127.0.0.1:9100/v2/iat
+#   XFYUN_TTS_URL=ws://127.0.0.1:9100/v2/tts
+#   SPARK_API_URL=http://127.0.0.1:9100/v2/chat/completions
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import math
+import random
+import struct
+import uuid
+import wave
+
+from aiohttp import web, WSMsgType
+
+DEFAULT_TRANSCRIPT = (
+    "我毕业于计算机专业，之前在一家互联网公司做后端开发，"
+    "主要负责订单系统的设计和性能优化，熟悉Python和分布式系统。"
+)
+DEFAULT_REPLY = "好的，请具体介绍一下你在订单系统性能优化中遇到的最大挑战，以及你是如何解决的？"
+DEFAULT_EVALUATION = {
+    "scores": {"专业知识水平": 80, "技能匹配度": 78, "语言表达能力": 82,
+               "逻辑思维能力": 85, "创新能力": 70, "应变抗压能力": 76},
+    "radar": [80, 78, 82, 85, 70, 76],
+    "key_issues": [{"question": "请介绍你的项目经验", "reason": "缺乏量化成果", "suggestion": "补充具体数据"}],
+    "suggestions": ["多用数据和案例支撑观点"],
+    "multimodal_analysis": {"text": "表达清晰", "audio": "语速适中", "video": "神态自然", "resume": "经历匹配"},
+    "summary": "整体表现良好（本地替身生成）。",
+}
+
+
+def _sid(prefix):
+    return f"{prefix}{uuid.uuid4().hex[:16]}"
+
+
+# ---------------------------------------------------------------------------
+# ASR：iat v2 协议，开启 wpgs 时按 sn 递增下发 apd 结果，并按比例插入 rpl 修正
+# ---------------------------------------------------------------------------
+
+class AsrStub:
+    def __init__(self, transcript, chars_per_second=4.0, result_interval=0.4,
+                 rpl_ratio=0.2, final_delay=0.15):
+        self.transcript = transcript
+        self.chars_per_second = chars_per_second
+        self.result_interval = result_interval  # 每收到多少秒的音频下发一次中间结果
+        self.rpl_ratio = rpl_ratio
+        self.final_delay = final_delay  # 收到结束帧到下发最终结果的延迟
+
+    @staticmethod
+    def _result(sn, text, pgs="apd", rg=None, last=False):
+        result = {"sn": sn, "ls": last, "bg": 0, "ed": 0,
+                  "ws": [{"bg": 0, "cw": [{"sc": 0, "w": ch}]} for ch in text],
+                  "pgs": pgs}
+        if rg is not None:
+            result["rg"] = rg
+        return result
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        sid = _sid("iat")
+        audio_seconds = 0.0
+        emitted_seconds = 0.0
+        cursor = 0  # 已下发的字数
+        sn = 0
+        started = False
+        last_text = ""
+
+        async def send(status, result=None):
+            data = {"status": status}
+            if result is not None:
+                data["result"] = result
+            await ws.send_str(json.dumps({"code": 0, "message": "success", "sid": sid, "data": data},
+                                         ensure_ascii=False))
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                frame = json.loads(msg.data)
+            except ValueError:
+                await ws.send_str(json.dumps({"code": 10160, "message": "parse request json error", "sid": sid}))
+                continue
+            data = frame.get("data", {})
+            status = data.get("status", 1)
+            audio = base64.b64decode(data.get("audio") or "")
+            if data.get("encoding", "raw") == "raw":
+                audio_seconds += len(audio) / 32000.0
+            else:
+                audio_seconds += len(audio) / 2000.0  # speex-wb 粗略按 16kbps 估算
+
+            if status == 0 and not started:
+                started = True
+                sn = 0
+                await send(0)
+
+            while audio_seconds - emitted_seconds >= self.result_interval and cursor < len(self.transcript):
+                emitted_seconds += self.result_interval
+                step = max(1, int(self.chars_per_second * self.result_interval))
+                chunk = self.transcript[cursor:cursor + step]
+                cursor += len(chunk)
+                sn += 1
+                if sn > 1 and random.random() < self.rpl_ratio:
+                    # 动态修正：把上一句和本句合并后替换
+                    await send(1, self._result(sn, last_text + chunk, pgs="rpl", rg=[sn - 1, sn - 1]))
+                    last_text = last_text + chunk
+                else:
+                    await send(1, self._result(sn, chunk))
+                    last_text = chunk
+
+            if status == 2:
+                await asyncio.sleep(self.final_delay)
+                rest = self.transcript[cursor:]
+                sn += 1
+                await send(2, self._result(sn, rest, last=True))
+                started = False
+                cursor = 0
+                audio_seconds = emitted_seconds = 0.0
+                # 与讯飞一致：一次识别会话结束后由服务端关闭连接
+                await ws.close()
+                break
+        return ws
+
+
+# ---------------------------------------------------------------------------
+# TTS：按文本长度生成对应时长的 PCM，分块流式下发
+# ---------------------------------------------------------------------------
+
+class TtsStub:
+    def __init__(self, first_byte_delay=0.15, ms_per_char=60, max_seconds=3.0,
+                 chunk_bytes=8192, realtime_factor=0.2, wav_path=None):
+        self.first_byte_delay = first_byte_delay
+        self.ms_per_char = ms_per_char
+        self.max_seconds = max_seconds
+        self.chunk_bytes = chunk_bytes
+        self.realtime_factor = realtime_factor  # 下发速度相对实时播放的比例，0.2 表示 5 倍速
+        self.canned = None
+        if wav_path:
+            with wave.open(wav_path, "rb") as wf:
+                self.canned = wf.readframes(wf.getnframes())
+
+    def _pcm_for(self, text, rate=16000):
+        if self.canned is not None:
+            return self.canned
+        seconds = min(self.max_seconds, max(0.2, len(text) * self.ms_per_char / 1000.0))
+        n = int(seconds * rate)
+        # 低音量 440Hz 正弦波，便于在真实设备上确认播放链路
+        return b"".join(struct.pack("<h", int(2000 * math.sin(2 * math.pi * 440 * i / rate)))
+                        for i in range(n))
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            frame = json.loads(msg.data)
+            text = base64.b64decode(frame.get("data", {}).get("text", "")).decode("utf-8", "ignore")
+            sid = _sid("tts")
+            pcm = self._pcm_for(text)
+            await asyncio.sleep(self.first_byte_delay)
+            chunk_seconds = self.chunk_bytes / 32000.0
+            chunks = [pcm[i:i + self.chunk_bytes] for i in range(0, len(pcm), self.chunk_bytes)] or [b""]
+            for idx, chunk in enumerate(chunks):
+                status = 2 if idx == len(chunks) - 1 else 1
+                await ws.send_str(json.dumps({
+                    "code": 0, "message": "success", "sid": sid,
+                    "data": {"audio": base64.b64encode(chunk).decode("ascii"), "status": status,
+                             "ced": str(idx)},
+                }))
+                if status == 1:
+                    await asyncio.sleep(chunk_seconds * self.realtime_factor)
+        return ws
+
+
+# ---------------------------------------------------------------------------
+# 星火：OpenAI 兼容的 chat/completions，可配置首包延迟和生成速度
+# ---------------------------------------------------------------------------
+
+class SparkStub:
+    def __init__(self, latency=0.5, tokens_per_second=40.0, error_rate=0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+
+    @staticmethod
+    def _reply_for(prompt):
+        if "严格输出如下JSON格式" in prompt or "只输出JSON" in prompt:
+            return json.dumps(DEFAULT_EVALUATION, ensure_ascii=False)
+        if "整理后的面试回答" in prompt:
+            return "整理后的面试回答：" + prompt.rsplit("用户原始回答：", 1)[-1].strip()
+        return DEFAULT_REPLY
+
+    async def handle(self, request):
+        body = await request.json()
+        if self.error_rate and random.random() < self.error_rate:
+            return web.json_response({"error": {"message": "mock overload"}}, status=503)
+        messages = body.get("messages") or []
+        # 固定说明在 system 消息里，动态内容在最后一条消息里
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        reply = self._reply_for(prompt)
+        # 中文大致按 1 字 1 token 估算
+        await asyncio.sleep(self.latency + len(reply) / self.tokens_per_second)
+        return web.json_response({
+            "code": 0, "message": "Success", "sid": _sid("cha"),
+            "choices": [{"message": {"role": "assistant", "content": reply}, "index": 0}],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(reply),
+                      "total_tokens": len(prompt) + len(reply)},
+        })
+
+
+def build_app(args):
+    transcript = DEFAULT_TRANSCRIPT
+    if args.transcript:
+        with open(args.transcript, encoding="utf-8") as f:
+            transcript = f.read().strip()
+    asr = AsrStub(transcript, chars_per_second=args.asr_cps, rpl_ratio=args.asr_rpl_ratio,
+                  final_delay=args.asr_final_delay)
+    tts = TtsStub(first_byte_delay=args.tts_first_byte, realtime_factor=args.tts_realtime_factor,
+                  wav_path=args.tts_wav)
+    spark = SparkStub(latency=args.spark_latency, tokens_per_second=args.spark_tps,
+                      error_rate=args.spark_error_rate)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/v2/iat", asr.handle)
+    app.router.add_get("/v2/tts", tts.handle)
+    app.router.add_post("/v2/chat/completions", spark.handle)
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="讯飞 ASR/TTS/星火本地替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--transcript", help="ASR 返回的文本文件，默认使用内置文本")
+    parser.add_argument("--asr-cps", type=float, default=4.0, help="ASR 每秒音频对应的字数")
+    parser.add_argument("--asr-rpl-ratio", type=float, default=0.2, help="wpgs rpl 修正的比例")
+    parser.add_argument("--asr-final-delay", type=float, default=0.15, help="结束帧到最终结果的延迟（秒）")
+    parser.add_argument("--tts-first-byte", type=float, default=0.15, help="TTS 首包延迟（秒）")
+    parser.add_argument("--tts-realtime-factor", type=float, default=0.2, help="TTS 下发速度/实时速度")
+    parser.add_argument("--tts-wav", help="固定返回的 16k 单声道 PCM WAV")
+    parser.add_argument("--spark-latency", type=float, default=0.5, help="星火首包延迟（秒）")
+    parser.add_argument("--spark-tps", type=float, default=40.0, help="星火生成速度（token/秒）")
+    parser.add_argument("--spark-error-rate", type=float, default=0.0, help="星火返回 503 的比例")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    cli_args = parse_args()
+    logging.info(f"本地替身启动: http://{cli_args.host}:{cli_args.port} "
+                 f"(ASR /v2/iat, TTS /v2/tts, 星火 /v2/chat/completions)")
+    web.run_app(build_app(cli_args), host=cli_args.host, port=cli_args.port, print=None)
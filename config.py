@@ -1,4 +1,5 @@
 # config.py - 重构后的配置文件（仅流式ASR版本）
+import os
 
 # --- 讯飞星火大模型 HTTP API 凭证 ---
 # 请将 YOUR_SPARK_HTTP_API_PASSWORD 替换为你从讯飞控制台获取的实际 APIPassword
@@ -41,15 +42,38 @@ XFYUN_TTS_AUE_FORMAT = "raw"
 # 例如： "16000" (16k), "8000" (8k)
 XFYUN_TTS_AUF_RATE = "16000"
 
+# --- 服务地址 ---
+# 默认为讯飞官方地址；压测时用环境变量指向 bench/mock_xfyun.py 启动的本地替身
+XFYUN_ASR_URL = os.environ.get("XFYUN_ASR_URL", "wss://iat-api.xfyun.cn/v2/iat")
+XFYUN_TTS_URL = os.environ.get("XFYUN_TTS_URL", "wss://tts-api.xfyun.cn/v2/tts")
+SPARK_API_URL = os.environ.get("SPARK_API_URL", "https://spark-api-open.xf-yun.com/v2/chat/completions")
+
 # --- 流式ASR配置 ---
 # 音频输入设备索引
 AUDIO_INPUT_DEVICE_INDEX = 1
 
+# --- 语音活动检测（VAD）配置 ---
+# 放在 ASR 转发之前，只上传有效语音，裁剪首尾静音
+VAD_ENERGY_THRESHOLD_DB = -50.0  # 绝对能量下限 (dBFS)
+VAD_ENERGY_MARGIN_DB = 10.0  # 高于噪声底多少 dB 才认为可能是语音
+VAD_FLATNESS_THRESHOLD = 0.5  # 频谱平坦度低于此值视为浊音
+VAD_HANGOVER_MS = 600  # 语音结束后的拖尾保持时长（毫秒）
+VAD_PREROLL_MS = 200  # 语音开始前保留的预录时长（毫秒）
+
 # --- 视频处理配置 ---
 CAMERA_INDEX = 0  # 摄像头索引，0 通常是默认摄像头
 VIDEO_RESOLUTION = (640, 480)  # 视频分辨率 (宽度, 高度)
 VIDEO_FPS = 30  # 视频帧率
 VIDEO_OUTPUT_DIR = "video_records" # 视频录制文件保存目录
+VIDEO_CAPTURE_BACKEND = "auto"  # 采集后端：auto / dshow / v4l2 / avfoundation / any
+VIDEO_ENCODER = "auto"  # 录制后端：auto（ffmpeg > PyAV > OpenCV）/ ffmpeg / pyav / opencv
+VIDEO_CODEC = "h264"  # h264 / vp9
+VIDEO_QUEUE_SIZE = 60  # 待编码帧队列上限，满时丢弃最旧帧
+# 表情识别放到独立进程（帧经共享内存传递）；0 表示在 Web 进程内推理
+VISION_WORKERS = int(os.environ.get("VISION_WORKERS", "2"))
+VISION_SLOTS = 8  # 共享内存槽位数，即同时在途的帧数上限
+VISION_SLOT_BYTES = 1280 * 720 * 3  # 单个槽位大小，容纳 720p BGR 帧
+VISION_TIMEOUT_SECONDS = 5.0  # 单帧推理（含等待槽位）的最长时间
 
 # --- 面试配置 ---
 # 面试问题总数
@@ -67,6 +91,72 @@ TTS_WAIT_TIMEOUT = 10.0
 # --- 日志配置 ---
 LOG_LEVEL = "INFO"  # DEBUG, INFO, WARNING, ERROR, CRITICAL
 LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_ASYNC = True  # 日志经队列由后台线程写出，避免 I/O 阻塞音频线程
+LOG_JSON_EVENTS = False  # 结构化事件是否输出为 JSON（便于日志采集）
+
+# --- 评测报告配置 ---
+# 评测报告在后台线程池中生成，结果按面试数据的哈希保存，相同数据再次生成时直接返回
+EVALUATION_WORKERS = 2
+EVALUATION_RESULTS_DIR = "evaluation_results"
+# 每道题回答后在后台单独评分，最终报告只做汇总
+TURN_EVALUATION_ENABLED = True
+TURN_EVALUATION_WORKERS = 2
+# 生成报告时最多等待仍在进行中的逐题评分的时间（秒），超时的题目按原文参与评测
+TURN_EVALUATION_WAIT_SECONDS = 20
+
+# --- Prompt 模板配置 ---
+# 覆盖模板动态段的 token 预算，键为 "模板名.段名"，如 {"evaluation_full.interview_text": 4000}
+PROMPT_SECTION_BUDGETS = {}
+
+# --- 数据存储配置 ---
+# 会话、问答、语音特征和表情时间线保存在 SQLite（WAL 模式）中，重启后仍可查询
+STORAGE_DB_PATH = "data/interview.db"
+STORAGE_BATCH_SIZE = 100  # 每个写事务最多包含的写操作数
+STORAGE_FLUSH_INTERVAL = 0.5  # 写操作最多攒多久（秒）再提交
+STORAGE_CACHE_SESSIONS = 200  # 内存中缓存的最近活跃会话数
+STORAGE_CACHE_EMOTIONS = 500  # 每个会话在内存中保留的最近表情条数
+
+# --- 录音归档配置 ---
+# 每场面试一个只追加的分段 PCM 文件，按题记录偏移；会话最后写入后保留一段时间再删除
+AUDIO_ARCHIVE_DIR = "audio_records"
+AUDIO_ARCHIVE_SEGMENT_MB = 64  # 单个分段文件上限（16k 单声道约 35 分钟）
+AUDIO_ARCHIVE_RETENTION_SECONDS = 3600
+
+# --- 语音分析配置 ---
+# 每轮回答的语音特征在独立进程中分析，转写文本先发出，分析结果就绪后再推送；0 表示在 Web 进程内同步分析
+VOICE_WORKERS = int(os.environ.get("VOICE_WORKERS", "2"))
+VOICE_MAX_PENDING = 32  # 排队加执行中的分析请求上限
+VOICE_SUBMIT_TIMEOUT = 1.0  # 排队已满时 end_answer 最多等待的时间（秒），超时跳过本轮分析
+VOICE_WAIT_SECONDS = 10  # 查询语音分析结果或逐题评分时最多等待进行中分析的时间（秒）
+
+# --- 录音文件转写（LFASR）配置 ---
+# 开启后面试结束时把整场录音上传做高精度转写，评测报告优先使用转写文本
+XFYUN_LFASR_APPID = "dde81f6b"
+XFYUN_LFASR_SECRET_KEY = "ab25515bb7692a0790ef5a566342d5d7"
+XFYUN_LFASR_UPLOAD_URL = os.environ.get("XFYUN_LFASR_UPLOAD_URL", "https://raasr.xfyun.cn/v2/api/upload")
+XFYUN_LFASR_RESULT_URL = os.environ.get("XFYUN_LFASR_RESULT_URL", "https://raasr.xfyun.cn/v2/api/getResult")
+LFASR_BATCH_ENABLED = False
+LFASR_BATCH_WORKERS = 4  # 同时上传的录音部分数
+LFASR_PART_SECONDS = 600  # 长录音按题切分上传，每部分不超过该时长
+LFASR_UPLOAD_RETRIES = 3  # 单个部分上传中断后的重传次数
+LFASR_TIMEOUT_SECONDS = 1800  # 单个订单最长等待时间
+LFASR_WAIT_SECONDS = 30  # 生成评测报告时最多等待转写结果的时间，超时使用实时识别文本
+
+# --- 链路追踪配置 ---
+# 每轮回答（end_answer → 转写 → 大模型 → TTS）记录为一条 trace，追加写入文件
+TRACE_ENABLED = True
+TRACE_EXPORT_PATH = "traces/turns.jsonl"
+TRACE_EXPORT_FORMAT = "otlp"  # otlp: OTLP/JSON，可导入 Jaeger/otel-collector；json: 简化格式
+
+# --- 多进程部署配置 ---
+# 由 multi_worker.py 为每个 worker 设置；单进程运行时保持默认
+SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "5000"))
+WORKER_ID = os.environ.get("WORKER_ID", "")  # 非空表示多 worker 部署中的一个进程
+# Socket.IO 跨进程消息队列：redis://127.0.0.1:6379/0（需安装 redis），
+# memory:// 为进程内替身（需安装 kombu，仅用于测试）；为空时不使用消息队列
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE", "")
+SOCKETIO_CHANNEL = os.environ.get("SOCKETIO_CHANNEL", "interview-socketio")
 
 # --- 性能配置 ---
 # 线程健康检查间隔（秒）
@@ -0,0 +1,174 @@
+# evaluation_jobs.py - 面试评测报告的后台任务队列：任务 ID、工作线程池、结果持久化
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+EVALUATION_JOB_SECONDS = metrics.histogram("evaluation_job_seconds", "评测任务从开始执行到完成的耗时", ["outcome"])
+EVALUATION_JOBS = metrics.counter("evaluation_jobs", "提交的评测任务数", ["source"])
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+
+def job_key(data):
+    """同样的面试数据得到同样的任务 ID，重复提交直接复用已有任务或已保存的结果。"""
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+class EvaluationJobQueue:
+    """
+    评测报告任务队列。
+    submit() 立即返回任务信息；工作线程调用 evaluate_fn(data, **context) -> (报告, 状态码, 是否可缓存)，
+    可缓存的结果写入 results_dir/<job_id>.json，进程重启后同样的数据仍可直接取到报告。
+    on_update(job) 在任务完成或失败时于工作线程中调用，用于 Socket.IO 推送。
+    """
+
+    def __init__(self, evaluate_fn, results_dir="evaluation_results", workers=2,
+                 on_update=None, max_jobs=500):
+        self.evaluate_fn = evaluate_fn
+        self.results_dir = results_dir
+        self.on_update = on_update
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        os.makedirs(results_dir, exist_ok=True)
+        self._workers = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"EvaluationWorker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+        metrics.gauge("evaluation_queue_depth", "等待执行的评测任务数").set_function(self._queue.qsize)
+        logging.info(f"评测任务队列已启动，工作线程数: {workers}，结果目录: {results_dir}")
+
+    def _result_path(self, job_id):
+        return os.path.join(self.results_dir, f"{job_id}.json")
+
+    def _load_result(self, job_id):
+        path = self._result_path(job_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取已保存的评测结果失败 {path}: {e}")
+            return None
+
+    def _save_result(self, job_id, report):
+        path = self._result_path(job_id)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False)
+            os.replace(tmp_path, path)  # 原子替换，读取方不会看到写了一半的文件
+        except OSError as e:
+            logging.error(f"保存评测结果失败 {path}: {e}")
+
+    def submit(self, data, notify_sid=None, force=False, context=None):
+        """
+        提交评测任务，返回任务信息（dict 副本）。任务 ID 只由 data 决定。
+        force=True 时忽略已保存的结果重新生成，但同样的任务正在排队或执行时直接返回该任务。
+        notify_sid 为完成后要推送的 Socket.IO 会话；context 是传给 evaluate_fn 的附加参数，
+        不参与任务 ID 计算（如用于取回逐题评分的会话 ID）。
+        """
+        job_id = job_key(data)
+        with self._lock:
+            # 查重、读取已保存的结果和登记新任务在同一把锁内完成，并发的相同提交只会入队一次
+            job = self._jobs.get(job_id)
+            if job is not None and (job["status"] in (STATUS_QUEUED, STATUS_RUNNING)
+                                    or (not force and job["status"] == STATUS_DONE)):
+                if notify_sid:
+                    job["notify"].add(notify_sid)
+                EVALUATION_JOBS.labels(source="dedup").inc()
+                return self._public(job)
+
+            cached = None if force else self._load_result(job_id)
+            now = time.time()
+            job = {
+                "job_id": job_id,
+                "status": STATUS_DONE if cached is not None else STATUS_QUEUED,
+                "result": cached,
+                "http_status": 200 if cached is not None else None,
+                "created_at": now,
+                "finished_at": now if cached is not None else None,
+                "notify": {notify_sid} if notify_sid else set(),
+                "data": None if cached is not None else data,
+                "context": None if cached is not None else dict(context or {}),
+            }
+            self._jobs[job_id] = job
+            self._trim()
+            public = self._public(job)
+        if cached is not None:
+            EVALUATION_JOBS.labels(source="cache").inc()
+            logging.info(f"评测任务 {job_id} 命中已保存的结果")
+        else:
+            EVALUATION_JOBS.labels(source="new").inc()
+            self._queue.put(job_id)
+            logging.info(f"评测任务 {job_id} 已入队，当前排队: {self._queue.qsize()}")
+        return public
+
+    def get(self, job_id):
+        """查询任务；内存中没有时再查磁盘上保存的结果。"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._public(job)
+        cached = self._load_result(job_id)
+        if cached is not None:
+            return {"job_id": job_id, "status": STATUS_DONE, "result": cached, "http_status": 200}
+        return None
+
+    def _trim(self):
+        """内存中只保留最近 max_jobs 个已结束的任务（结果仍在磁盘上）。调用方持有锁。"""
+        if len(self._jobs) <= self.max_jobs:
+            return
+        finished = sorted((j for j in self._jobs.values() if j["status"] in (STATUS_DONE, STATUS_ERROR)),
+                          key=lambda j: j["created_at"])
+        for job in finished[:len(self._jobs) - self.max_jobs]:
+            del self._jobs[job["job_id"]]
+
+    @staticmethod
+    def _public(job):
+        return {k: job[k] for k in ("job_id", "status", "result", "http_status", "created_at", "finished_at")}
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != STATUS_QUEUED:
+                    continue
+                job["status"] = STATUS_RUNNING
+                data, context = job["data"], job["context"]
+            start = time.perf_counter()
+            try:
+                report, http_status, cacheable = self.evaluate_fn(data, **context)
+                status = STATUS_DONE if http_status < 400 else STATUS_ERROR
+            except Exception as e:
+                logging.error(f"评测任务 {job_id} 执行异常: {e}", exc_info=True)
+                report, http_status, cacheable = {"error": f"评测任务执行失败: {e}"}, 500, False
+                status = STATUS_ERROR
+            EVALUATION_JOB_SECONDS.labels(outcome=status).observe(time.perf_counter() - start)
+            if cacheable:
+                self._save_result(job_id, report)
+            with self._lock:
+                job.update(status=status, result=report, http_status=http_status,
+                           finished_at=time.time(), data=None, context=None)
+                notify = list(job["notify"])
+                public = self._public(job)
+            logging.info(f"评测任务 {job_id} 结束，状态: {status}，耗时: {time.perf_counter() - start:.1f}s")
+            if self.on_update:
+                try:
+                    self.on_update(public, notify)
+                except Exception as e:
+                    logging.error(f"评测任务 {job_id} 结果推送失败: {e}")
@@ -0,0 +1,283 @@
+# frame_bus.py - 摄像头帧的发布/订阅总线：共享缓冲池 + 按订阅者的帧率、分辨率分发
+#
+# 录制、表情分析以及之后的视线/姿态分析都需要同一路摄像头画面。这里每帧只存一份：
+#   - 帧数据放在按形状复用的 numpy 缓冲池里，引用计数归零后回收，采集时直接读入池中的数组；
+#   - 每个订阅者声明最大帧率和分辨率，超出帧率的帧不投递，邮箱满时丢弃最旧的帧；
+#   - 缩放后的版本在帧上按尺寸缓存，N 个要 320x240 的分析只缩放一次，共用同一个数组。
+# 订阅者拿到的 FrameView 用完必须 release()（或用 with），否则缓冲不会回到池里。
+import logging
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class FramePool:
+    """按数组形状复用缓冲区。每种形状最多保留 max_free 个空闲数组，超出的交给垃圾回收。"""
+
+    def __init__(self, max_free=16):
+        self.max_free = max_free
+        self._free = {}  # (shape, dtype) -> [ndarray]
+        self._lock = threading.Lock()
+        self.allocated = 0  # 新分配的数组数，稳定后不再增长
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                return free.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype=dtype)
+
+    def give_back(self, array):
+        key = (array.shape, array.dtype.str)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) < self.max_free:
+                free.append(array)
+
+
+class Frame:
+    """一帧画面及其缩放版本，由所有订阅者共享，引用计数归零后缓冲回到池中。"""
+
+    def __init__(self, seq, timestamp, image, pool):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+        self._pool = pool
+        self._refs = 1  # 发布者持有的引用
+        self._variants = {}  # (宽, 高) -> ndarray
+        self._lock = threading.Lock()
+
+    def retain(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            if self._refs:
+                return
+            buffers = [self.image] + list(self._variants.values())
+            self._variants = {}
+        for buffer in buffers:
+            self._pool.give_back(buffer)
+
+    def variant(self, size):
+        """返回 size=(宽, 高) 的版本；None 或与原图同尺寸时返回原图。同一尺寸只缩放一次。"""
+        height, width = self.image.shape[:2]
+        if size is None or tuple(size) == (width, height):
+            return self.image
+        size = tuple(size)
+        with self._lock:
+            scaled = self._variants.get(size)
+            if scaled is None:
+                buffer = self._pool.acquire((size[1], size[0]) + self.image.shape[2:], self.image.dtype)
+                scaled = cv2.resize(self.image, size, dst=buffer, interpolation=cv2.INTER_AREA)
+                self._variants[size] = scaled
+        return scaled
+
+
+class FrameView:
+    """投递给某个订阅者的帧：image 是该订阅者要求的分辨率。只读，用完 release()。"""
+    __slots__ = ("frame", "image")
+
+    def __init__(self, frame, image):
+        self.frame = frame
+        self.image = image
+
+    @property
+    def seq(self):
+        return self.frame.seq
+
+    @property
+    def timestamp(self):
+        return self.frame.timestamp
+
+    def release(self):
+        if self.frame is not None:
+            self.frame.release()
+            self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Subscription:
+    """
+    一个订阅者的邮箱。queue_size=1 时只保留最新帧（分析类消费者），
+    录制等需要连续帧的订阅者可以设大一些，满时丢弃最旧的帧。
+    """
+
+    def __init__(self, bus, name, max_fps=None, resolution=None, queue_size=1):
+        self.bus = bus
+        self.name = name
+        self.max_fps = max_fps
+        self.resolution = tuple(resolution) if resolution else None
+        self._interval = 1.0 / max_fps if max_fps else 0.0
+        self._next_due = 0.0
+        self._mailbox = deque()
+        self._queue_size = max(1, queue_size)
+        self._cond = threading.Condition()
+        self.closed = False
+        self.delivered = 0  # 放入邮箱的帧数
+        self.skipped = 0  # 因帧率限制未投递的帧数
+        self.dropped = 0  # 邮箱满被挤掉、没有被取走的帧数
+
+    def _offer(self, frame, now):
+        """发布线程中调用。返回是否投递。"""
+        if self._interval:
+            if now < self._next_due:
+                self.skipped += 1
+                return False
+            # 按节拍推进，偶尔晚到不累积欠账
+            self._next_due = max(self._next_due + self._interval, now)
+        stale = None
+        with self._cond:
+            if self.closed:
+                return False
+            frame.retain()
+            self._mailbox.append(frame)
+            if len(self._mailbox) > self._queue_size:
+                stale = self._mailbox.popleft()
+                self.dropped += 1
+            self.delivered += 1
+            self._cond.notify()
+        if stale is not None:
+            stale.release()
+        return True
+
+    def get(self, timeout=None):
+        """取最早的一帧，返回 FrameView；超时或订阅已关闭时返回 None。"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._mailbox or self.closed, timeout):
+                return None
+            if not self._mailbox:
+                return None
+            frame = self._mailbox.popleft()
+        # 缩放放在消费者线程里做，结果缓存在帧上，同分辨率的其他订阅者直接复用
+        return FrameView(frame, frame.variant(self.resolution))
+
+    def pending(self):
+        with self._cond:
+            return len(self._mailbox)
+
+    def close(self):
+        """取消订阅，释放邮箱里的帧并唤醒等待中的 get()。"""
+        self.bus.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            frames = list(self._mailbox)
+            self._mailbox.clear()
+            self._cond.notify_all()
+        for frame in frames:
+            frame.release()
+
+    def __iter__(self):
+        """依次产出 FrameView，上一帧在取下一帧时自动释放；订阅关闭后结束。"""
+        view = None
+        try:
+            while not self.closed:
+                next_view = self.get(timeout=0.5)
+                if view is not None:
+                    view.release()
+                view = next_view
+                if view is not None:
+                    yield view
+        finally:
+            if view is not None:
+                view.release()
+
+
+class FrameBus:
+    """
+    帧总线。发布者用 acquire_buffer() 取池中数组、直接把画面读进去，再 publish()；
+    subscribe() 返回 Subscription，按各自的帧率、分辨率收帧；
+    latest() 取最新一帧（单槽，不排队），供偶尔取一帧的调用方使用。
+    """
+
+    def __init__(self, max_free=16):
+        self.pool = FramePool(max_free)
+        self._subs = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._seq = 0
+        self._latest = None
+        self.published = 0
+
+    @property
+    def seq(self):
+        """最近发布的帧序号，还没有帧时为 0。"""
+        return self._seq
+
+    def subscribe(self, name, max_fps=None, resolution=None, queue_size=1):
+        sub = Subscription(self, name, max_fps, resolution, queue_size)
+        with self._lock:
+            self._subs.append(sub)
+        logging.info(f"帧订阅者 {name} 已加入: 帧率上限 {max_fps or '不限'}，分辨率 {resolution or '原始'}")
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def subscriptions(self):
+        with self._lock:
+            return list(self._subs)
+
+    def acquire_buffer(self, shape, dtype=np.uint8):
+        return self.pool.acquire(shape, dtype)
+
+    def publish(self, image, timestamp=None):
+        """
+        发布一帧，返回序号。image 的所有权交给总线（引用释放后回到缓冲池），发布者之后不要再修改它。
+        """
+        now = time.monotonic()
+        with self._lock:
+            seq = self._seq + 1
+            subs = list(self._subs)
+        frame = Frame(seq, timestamp if timestamp is not None else time.time(), image, self.pool)
+        for sub in subs:
+            sub._offer(frame, now)
+        # 发布者的引用转给最新帧槽位，被替换下来的上一帧释放
+        with self._cond:
+            previous, self._latest = self._latest, frame
+            self._seq = seq
+            self._cond.notify_all()
+        if previous is not None:
+            previous.release()
+        self.published += 1
+        return seq
+
+    def latest(self, after_seq=0, timeout=0.0, resolution=None):
+        """
+        返回序号大于 after_seq 的最新帧（FrameView，用完 release），
+        timeout 秒内没有新帧时返回 None。
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest is not None and self._seq > after_seq, timeout):
+                return None
+            frame = self._latest
+            frame.retain()
+        return FrameView(frame, frame.variant(resolution))
+
+    def clear_latest(self):
+        """释放最新帧槽位（采集停止时调用），缓冲回到池中。"""
+        with self._cond:
+            previous, self._latest = self._latest, None
+            self._cond.notify_all()
+        if previous is not None:
+            previous.release()
+
+    def close(self):
+        """关闭全部订阅（等待中的 get() 返回 None）并释放最新帧。"""
+        for sub in self.subscriptions():
+            sub.close()
+        self.clear_latest()
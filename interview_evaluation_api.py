@@ -1,13 +1,262 @@
 from flask import Flask, request, jsonify, current_app
 from xfyun_spark_client import SparkClient
 import json
+import re
 
 # 讯飞API密码和模型版本（确保 config.py 里配置正确）
-from config import SPARK_HTTP_API_PASSWORD, SPARK_MODEL_VERSION
+from config import SPARK_HTTP_API_PASSWORD, SPARK_MODEL_VERSION, SPARK_API_URL
+
+# 对面试内容进行去重处理（被其他行包含的片段丢弃，保留最长的完整版本）
+from transcript_dedup import remove_duplicates
+from turn_evaluation import DIMENSIONS
+# 容错解析大模型返回的 JSON（代码块、多余逗号、中文标点、截断等），避免因格式问题重新调用
+from llm_json import extract_json
+from prompt_templates import PromptTemplate, Section, register
+
+# 评测报告的 JSON 格式说明，整场评测和逐题汇总共用
+REPORT_JSON_FORMAT = (
+    "请严格输出如下JSON格式：\n"
+    "{\n"
+    "\"scores\": {\"专业知识水平\": 85, \"技能匹配度\": 80, \"语言表达能力\": 90, \"逻辑思维能力\": 88, \"创新能力\": 75, \"应变抗压能力\": 82},\n"
+    "\"radar\": [85, 80, 90, 88, 75, 82],\n"
+    "\"key_issues\": [\n"
+    "  {\"question\": \"请介绍你的项目经验\", \"reason\": \"缺乏具体量化成果\", \"suggestion\": \"建议补充项目中的具体数据和成果\"},\n"
+    "  {\"question\": \"请描述一次压力下的决策\", \"reason\": \"应变能力表现一般\", \"suggestion\": \"建议举例说明如何在压力下做出有效决策\"}\n"
+    "],\n"
+    "\"suggestions\": [\n"
+    "  \"多用数据和案例支撑观点\",\n"
+    "  \"提升创新思维表达\",\n"
+    "  \"注意眼神交流和肢体语言\"\n"
+    "],\n"
+    "\"multimodal_analysis\": {\n"
+    "  \"text\": \"请详细分析上方问答内容，评价文本表达和内容质量。\",\n"
+    "  \"audio\": \"请详细分析下方 audio_analysis 字段内容，评价语音表现。\",\n"
+    "  \"video\": \"请详细分析下方 video_analysis 字段内容，评价视频表现。\",\n"
+    "  \"resume\": \"请详细分析下方 resume_text 字段内容，评价简历表现。\"\n"
+    "},\n"
+    "\"summary\": \"总体评价和建议\"\n"
+    "}\n"
+    "请严格只输出JSON，不要有多余解释。\n"
+)
+
+
+MULTIMODAL_KEYS = ("text", "audio", "video", "resume")
+
+
+def _to_score(value):
+    """把 85 / 85.5 / "85分" 之类的值转成 0-100 的整数，无法识别时返回 None。"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return max(0, min(100, int(round(value))))
+    if isinstance(value, str):
+        match = re.search(r'-?\d+(\.\d+)?', value)
+        if match:
+            return max(0, min(100, int(round(float(match.group(0))))))
+    return None
+
+
+def _to_text_list(value):
+    if isinstance(value, str):
+        return [s.strip() for s in re.split(r'[\n；;]', value) if s.strip()]
+    if isinstance(value, list):
+        items = []
+        for item in value:
+            if isinstance(item, dict):
+                item = "；".join(str(v) for v in item.values() if v)
+            if item not in (None, ""):
+                items.append(str(item))
+        return items
+    return None
+
+
+def normalize_report(result):
+    """
+    按评测报告格式校验并规整大模型返回的结果：
+    分数转为 0-100 整数（缺失时用 radar 补齐），radar 按维度顺序由分数生成，
+    key_issues / suggestions 统一为列表，multimodal_analysis 补齐四个字段，summary 为字符串。
+    返回 (报告, 缺失字段列表)；六个维度都没有可用分数时返回 (None, 缺失字段列表)。
+    """
+    if not isinstance(result, dict):
+        return None, ["scores"]
+    missing = []
+    raw_scores = result.get("scores") if isinstance(result.get("scores"), dict) else {}
+    raw_radar = result.get("radar") if isinstance(result.get("radar"), list) else []
+    scores = {}
+    for idx, dim in enumerate(DIMENSIONS):
+        score = _to_score(raw_scores.get(dim))
+        if score is None and len(raw_radar) == len(DIMENSIONS):
+            score = _to_score(raw_radar[idx])
+        if score is None:
+            missing.append(f"scores.{dim}")
+        scores[dim] = score
+    if all(v is None for v in scores.values()):
+        return None, missing
+    known = [v for v in scores.values() if v is not None]
+    for dim, value in scores.items():
+        if value is None:
+            scores[dim] = int(round(sum(known) / len(known)))
+
+    key_issues = []
+    raw_issues = result.get("key_issues")
+    if isinstance(raw_issues, dict):
+        raw_issues = [raw_issues]
+    if isinstance(raw_issues, list):
+        for item in raw_issues:
+            if isinstance(item, dict):
+                key_issues.append({k: str(v) if v is not None else "" for k, v in item.items()})
+            elif item:
+                key_issues.append({"question": "", "reason": str(item), "suggestion": ""})
+    else:
+        missing.append("key_issues")
+
+    suggestions = _to_text_list(result.get("suggestions"))
+    if suggestions is None:
+        missing.append("suggestions")
+        suggestions = []
+
+    raw_multimodal = result.get("multimodal_analysis")
+    if isinstance(raw_multimodal, str):
+        raw_multimodal = {"text": raw_multimodal}
+    if not isinstance(raw_multimodal, dict):
+        missing.append("multimodal_analysis")
+        raw_multimodal = {}
+    multimodal = {k: str(raw_multimodal.get(k) or "无") for k in MULTIMODAL_KEYS}
+
+    summary = result.get("summary")
+    if not isinstance(summary, str) or not summary.strip():
+        missing.append("summary")
+        summary = summary if isinstance(summary, str) else ""
+
+    return {
+        "scores": scores,
+        "radar": [scores[dim] for dim in DIMENSIONS],
+        "key_issues": key_issues,
+        "suggestions": suggestions,
+        "multimodal_analysis": multimodal,
+        "summary": summary,
+    }, missing
+
+
+def summarize_turn_assessments(turn_assessments):
+    """
+    本地汇总逐题评分：各维度取有评分题目的平均分，问题和建议按题目顺序去重。
+    返回 (scores, key_issues, suggestions)。
+    """
+    totals = {dim: [] for dim in DIMENSIONS}
+    key_issues = []
+    suggestions = []
+    for turn in turn_assessments:
+        assessment = turn.get("assessment")
+        if not assessment:
+            continue
+        for dim, value in assessment.get("scores", {}).items():
+            if dim in totals:
+                totals[dim].append(value)
+        if assessment.get("issue"):
+            key_issues.append({"question": turn.get("question", ""), "reason": assessment["issue"],
+                               "suggestion": assessment.get("suggestion", "")})
+        suggestion = assessment.get("suggestion")
+        if suggestion and suggestion not in suggestions:
+            suggestions.append(suggestion)
+    scores = {dim: int(round(sum(v) / len(v))) if v else 50 for dim, v in totals.items()}
+    return scores, key_issues, suggestions
+
+
+def merge_turn_assessments(turn_assessments, audio_analysis, video_analysis, resume_text):
+    """大模型汇总失败时，直接用逐题评分在本地拼出完整报告。"""
+    scores, key_issues, suggestions = summarize_turn_assessments(turn_assessments)
+    comments = [f"第{t['index']}题：{t['assessment'].get('comment', '')}"
+                for t in turn_assessments if t.get("assessment") and t["assessment"].get("comment")]
+    return {
+        "scores": scores,
+        "radar": [scores[dim] for dim in DIMENSIONS],
+        "key_issues": key_issues[:5],
+        "suggestions": suggestions[:5],
+        "multimodal_analysis": {
+            "text": "；".join(comments) or "无逐题点评",
+            "audio": audio_analysis,
+            "video": video_analysis,
+            "resume": resume_text
+        },
+        "summary": "本报告由逐题评分汇总生成（汇总服务暂时不可用）。"
+    }
+
+
+# 整场评测和逐题汇总两个模板的 system 消息以相同的角色说明和 JSON 格式开头，共享前缀缓存
+EVALUATION_PREFIX = "你是一个多模态智能面试评测专家。" + REPORT_JSON_FORMAT
+
+_EVALUATION_SECTIONS = [
+    Section("audio_analysis", "【语音分析】：", budget=600),
+    Section("video_analysis", "【视频分析】：", budget=400),
+    Section("resume_text", "【简历内容】：", budget=1500),
+]
+
+AGGREGATION_TEMPLATE = register(PromptTemplate(
+    "evaluation_aggregate",
+    EVALUATION_PREFIX +
+    "面试过程中已经对每道题单独评分，请汇总用户给出的逐题评分，"
+    "并结合语音分析、视频分析和简历，生成整场面试的评测反馈报告。",
+    [Section("average_scores", "各维度逐题平均分供参考："),
+     Section("turns", "【逐题评分】：\n", budget=3000, keep="both")] + _EVALUATION_SECTIONS,
+    preamble="面试数据如下：",
+))
+
+FULL_TEMPLATE = register(PromptTemplate(
+    "evaluation_full",
+    EVALUATION_PREFIX +
+    "请根据用户给出的四类面试数据，生成结构化、可视化友好的评测反馈报告，内容包括：\n"
+    "1. 能力雷达图数据（六大维度0-100分，JSON数组）；\n"
+    "2. 关键问题定位（每个问题包含：问题内容、定位原因、改进建议）；\n"
+    "3. 针对每个能力维度的具体改进建议；\n"
+    "4. 多模态分析（请分别引用和分析问答内容、语音分析、视频分析、简历内容）；\n"
+    "5. 总结（简明扼要的整体评价和建议）。",
+    # 面试记录过长时保留开头和结尾，中间截断
+    [Section("interview_text", "【问答内容】：\n", budget=4000, keep="both")] + _EVALUATION_SECTIONS,
+    preamble="面试数据如下：",
+))
+
+
+def build_aggregation_messages(turn_assessments, audio_analysis, video_analysis, resume_text):
+    """
+    汇总请求：每道题只带已完成的评分摘要（评分失败的题目才带原始问答），
+    比整场面试原文短得多，面试结束时只需一次较短的大模型调用。
+    """
+    scores, _, _ = summarize_turn_assessments(turn_assessments)
+    lines = []
+    for turn in turn_assessments:
+        assessment = turn.get("assessment")
+        if assessment:
+            digest = {k: assessment.get(k) for k in ("scores", "strength", "issue", "suggestion", "comment")}
+            lines.append(f"第{turn['index']}题 {turn.get('question', '')}\n评分：" +
+                         json.dumps(digest, ensure_ascii=False))
+        else:
+            lines.append(f"第{turn['index']}题\n面试官：{turn.get('question', '')}\n"
+                         f"候选人：{turn.get('answer') or '未回答'}")
+    return AGGREGATION_TEMPLATE.render(
+        average_scores=json.dumps(scores, ensure_ascii=False), turns="\n".join(lines),
+        audio_analysis=audio_analysis, video_analysis=video_analysis, resume_text=resume_text)
+
+
+def build_full_messages(cleaned_interview_text, audio_analysis, video_analysis, resume_text):
+    """整场面试原文评测请求（没有逐题评分时使用）。"""
+    return FULL_TEMPLATE.render(
+        interview_text=cleaned_interview_text, audio_analysis=audio_analysis,
+        video_analysis=video_analysis, resume_text=resume_text)
+
 
 def interview_evaluation():
-    # 前端传来的面试对话内容
-    data = request.get_json()
+    """Flask 视图：同步生成评测报告。"""
+    report, status, _ = evaluate_interview(request.get_json())
+    return jsonify(report), status
+
+def evaluate_interview(data, turn_assessments=None):
+    """
+    根据前端提交的面试数据生成评测报告，不依赖 Flask 请求上下文，可在后台线程中调用。
+    turn_assessments 为面试过程中逐题后台评分的结果（TurnEvaluator.collect），
+    有可用评分时只做一次汇总调用，否则按整场面试原文评测。
+    返回 (报告 dict, HTTP 状态码, 是否可缓存)。AI 调用失败时的兜底报告不缓存，下次重新生成。
+    """
     print('收到 video_analysis:', data.get('video_analysis'))
     print('收到 resume_text:', data.get('resume_text'))
     # 新增：支持直接读取 history 字段
@@ -58,110 +307,47 @@ def interview_evaluation():
             },
             "summary": "候选人未参与面试，无法进行有效评测。建议重新安排面试或检查系统设置。"
         }
-        return jsonify(default_report)
-
-    # 对面试内容进行去重处理
-    def remove_duplicates(text):
-        """去除重复内容，保留最长的完整版本"""
-        lines = text.split('\n')
-        cleaned_lines = []
-        seen_content = set()
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # 检查是否是重复内容
-            is_duplicate = False
-            for seen in seen_content:
-                if line in seen or seen in line:
-                    is_duplicate = True
-                    # 如果当前行更长，替换已存在的内容
-                    if len(line) > len(seen):
-                        seen_content.remove(seen)
-                        seen_content.add(line)
-                    break
-            
-            if not is_duplicate:
-                seen_content.add(line)
-                cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
-    
+        return default_report, 200, True
+
     # 对面试文本进行去重
     cleaned_interview_text = remove_duplicates(interview_text)
     print('cleaned_interview_text:', cleaned_interview_text)
 
-    # 构造多模态评测prompt
-    prompt = (
-        "你是一个多模态智能面试评测专家。请根据以下四类面试数据，"
-        "生成结构化、可视化友好的评测反馈报告，内容包括：\n"
-        "1. 能力雷达图数据（六大维度0-100分，JSON数组）；\n"
-        "2. 关键问题定位（每个问题包含：问题内容、定位原因、改进建议）；\n"
-        "3. 针对每个能力维度的具体改进建议；\n"
-        "4. 多模态分析（请分别引用和分析下方的问答内容、语音分析、视频分析、简历内容）；\n"
-        "5. 总结（简明扼要的整体评价和建议）。\n"
-        "请严格输出如下JSON格式：\n"
-        "{\n"
-        "\"scores\": {\"专业知识水平\": 85, \"技能匹配度\": 80, \"语言表达能力\": 90, \"逻辑思维能力\": 88, \"创新能力\": 75, \"应变抗压能力\": 82},\n"
-        "\"radar\": [85, 80, 90, 88, 75, 82],\n"
-        "\"key_issues\": [\n"
-        "  {\"question\": \"请介绍你的项目经验\", \"reason\": \"缺乏具体量化成果\", \"suggestion\": \"建议补充项目中的具体数据和成果\"},\n"
-        "  {\"question\": \"请描述一次压力下的决策\", \"reason\": \"应变能力表现一般\", \"suggestion\": \"建议举例说明如何在压力下做出有效决策\"}\n"
-        "],\n"
-        "\"suggestions\": [\n"
-        "  \"多用数据和案例支撑观点\",\n"
-        "  \"提升创新思维表达\",\n"
-        "  \"注意眼神交流和肢体语言\"\n"
-        "],\n"
-        "\"multimodal_analysis\": {\n"
-        "  \"text\": \"请详细分析上方问答内容，评价文本表达和内容质量。\",\n"
-        "  \"audio\": \"请详细分析下方 audio_analysis 字段内容，评价语音表现。\",\n"
-        "  \"video\": \"请详细分析下方 video_analysis 字段内容，评价视频表现。\",\n"
-        "  \"resume\": \"请详细分析下方 resume_text 字段内容，评价简历表现。\"\n"
-        "},\n"
-        "\"summary\": \"总体评价和建议\"\n"
-        "}\n"
-        "请严格只输出JSON，不要有多余解释。\n"
-        "面试数据如下：\n"
-        "【问答内容】：\n" + cleaned_interview_text + "\n"
-        "【语音分析】：" + audio_analysis + "\n"
-        "【视频分析】：" + video_analysis + "\n"
-        "【简历内容】：" + resume_text
-    )
-
-    messages = [{"role": "user", "content": prompt}]
+    turn_assessments = turn_assessments or []
+    if any(t.get("assessment") for t in turn_assessments):
+        # 逐题评分已在面试过程中完成，这里只需汇总
+        messages = build_aggregation_messages(turn_assessments, audio_analysis, video_analysis, resume_text)
+    else:
+        messages = build_full_messages(cleaned_interview_text, audio_analysis, video_analysis, resume_text)
     
     try:
-        client = SparkClient(api_password=SPARK_HTTP_API_PASSWORD, model_version=SPARK_MODEL_VERSION)
-        print(f"调用Spark API，prompt长度: {len(prompt)}")
+        client = SparkClient(api_password=SPARK_HTTP_API_PASSWORD, model_version=SPARK_MODEL_VERSION, api_url=SPARK_API_URL)
+        print(f"调用Spark API，动态部分长度: {len(messages[-1]['content'])}")
         # 调用Spark API（send_message方法已经内置了重试机制）
-        ai_response = client.send_message(messages)
+        ai_response = client.send_message(messages, endpoint="interview_evaluation")
         print(f"AI原始返回内容: {ai_response}")
+        if ai_response is None:
+            # 重试用尽仍无返回，走下面的降级报告
+            raise RuntimeError("Spark API 重试后仍无返回")
         
-        # 解析AI返回的JSON
-        try:
-            result = json.loads(ai_response)
-            return jsonify(result)
-        except Exception as e:
-            print(f"JSON解析失败: {e}")
-            # 尝试用正则提取大括号包裹的JSON
-            import re
-            match = re.search(r'\{[\s\S]*\}', ai_response)
-            if match:
-                try:
-                    extracted_json = match.group(0)
-                    print(f"提取的JSON: {extracted_json}")
-                    result = json.loads(extracted_json)
-                    return jsonify(result)
-                except Exception as e2:
-                    print(f"提取JSON解析也失败: {e2}")
-                    pass
-            return jsonify({'error': 'AI返回内容解析失败', 'raw': ai_response[:500]}), 500
-            
+        # 解析AI返回的JSON：先严格解析，失败时本地修复，再按报告格式校验规整
+        result, repaired = extract_json(ai_response)
+        report, missing = normalize_report(result)
+        if report is not None:
+            if repaired or missing:
+                print(f"AI返回内容已本地修复，修复格式: {repaired}，缺失字段: {missing}")
+            # 缺字段的报告不缓存，下次提交时重新生成
+            return report, 200, not missing
+        print(f"AI返回内容无法解析为评测报告，缺失字段: {missing}")
+        if any(t.get("assessment") for t in turn_assessments):
+            return merge_turn_assessments(turn_assessments, audio_analysis, video_analysis, resume_text), 200, False
+        return {'error': 'AI返回内容解析失败', 'raw': str(ai_response)[:500]}, 500, False
+
     except Exception as e:
         print(f"Spark API调用失败: {e}")
+        if any(t.get("assessment") for t in turn_assessments):
+            # 已有逐题评分时，直接在本地汇总出完整报告
+            return merge_turn_assessments(turn_assessments, audio_analysis, video_analysis, resume_text), 200, False
         # 当AI调用失败时，返回基于面试内容的简单评测
         try:
             # 分析面试内容，生成简单报告
@@ -223,7 +409,7 @@ def interview_evaluation():
                     },
                     "summary": "候选人未参与面试，无法进行有效评测。建议重新安排面试或检查系统设置。"
                 }
-            return jsonify(fallback_report)
+            return fallback_report, 200, False
         except Exception as fallback_error:
             print(f"生成备用报告也失败: {fallback_error}")
-            return jsonify({'error': f'AI服务调用失败: {str(e)}'}), 500
+            return {'error': f'AI服务调用失败: {str(e)}'}, 500, False
@@ -5,6 +5,33 @@ import time
 import threading
 from config import ASR_FINAL_RESULT_TIMEOUT 
 import re
+import metrics
+from tracing import tracer
+from prompt_templates import PromptTemplate, Section, register
+
+TURN_SECONDS = metrics.histogram("interview_turn_seconds", "process_human_input 处理一轮回答的耗时（含大模型和TTS）")
+TURNS = metrics.counter("interview_turns", "处理的回答轮数", ["result"])
+
+# 面试官 system prompt；多轮对话历史超出预算时丢弃最早的消息
+INTERVIEW_TEMPLATE = register(PromptTemplate(
+    "interview_question",
+    "你现在是一个专业的AI面试官，正在进行一场真实的面试。请严格按照以下要求：\n"
+    "1. 面试目标：全面考察候选人的专业知识水平、技能匹配度、语言表达能力、逻辑思维能力、创新能力、应变抗压能力。\n"
+    "2. 面试流程：每轮只问一个问题，不要进行中间评价，让面试更自然流畅。\n"
+    "3. 问题设计：根据候选人的回答和简历，动态生成下一个有针对性的问题，逐步深入考察各个维度。\n"
+    "4. 面试结束：当你认为已经充分考察了候选人的各项能力，或者已经问了足够多的问题时，主动说'面试结束'并礼貌告别。\n"
+    "5. 输出格式：只输出下一个问题，不要评价，不要一次性输出多个问题。\n"
+    "请记住：这是一场真实的面试，保持专业、自然、流畅的对话节奏。",
+    history_budget=6000,
+))
+
+ANSWER_TEMPLATE = register(PromptTemplate(
+    "process_answer",
+    "你是面试AI助手。请将用户的原始回答进行专业、流畅的整理，只输出整理后的面试回答，不要输出任何说明、处理过程或分析。"
+    "请严格基于用户原始回答，不得添加、虚构或编造任何未出现的信息。"
+    "输出格式示例：\n整理后的面试回答：xxx",
+    [Section("answer", "用户原始回答：\n", budget=2000)],
+))
 
 class InterviewLogic:
     def __init__(self, *,
@@ -38,15 +65,7 @@ class InterviewLogic:
         self.conversation_history = [] 
         self.audio_stream_should_open_event = audio_stream_should_open_event
         self.audio_stream_opened_event = audio_stream_opened_event
-        self.system_prompt = (
-    "你现在是一个专业的AI面试官，正在进行一场真实的面试。请严格按照以下要求：\n"
-    "1. 面试目标：全面考察候选人的专业知识水平、技能匹配度、语言表达能力、逻辑思维能力、创新能力、应变抗压能力。\n"
-    "2. 面试流程：每轮只问一个问题，不要进行中间评价，让面试更自然流畅。\n"
-    "3. 问题设计：根据候选人的回答和简历，动态生成下一个有针对性的问题，逐步深入考察各个维度。\n"
-    "4. 面试结束：当你认为已经充分考察了候选人的各项能力，或者已经问了足够多的问题时，主动说'面试结束'并礼貌告别。\n"
-    "5. 输出格式：只输出下一个问题，不要评价，不要一次性输出多个问题。\n"
-    "请记住：这是一场真实的面试，保持专业、自然、流畅的对话节奏。"
-)
+        self.system_prompt = INTERVIEW_TEMPLATE.system
         self.conversation_history.append({"role": "system", "content": self.system_prompt})
         logging.info("InterviewLogic 初始化完成。")
         self.last_question = ""  # 新增，消除Pylance报错
@@ -186,6 +205,15 @@ class InterviewLogic:
 
 
     def process_human_input(self, text_input):
+        start = time.perf_counter()
+        with tracer.span("interview.process_human_input") as span:
+            reply = self._process_human_input(text_input)
+            span.set_attribute("has_reply", bool(reply))
+        TURN_SECONDS.observe(time.perf_counter() - start)
+        TURNS.labels(result="reply" if reply else "empty").inc()
+        return reply
+
+    def _process_human_input(self, text_input):
         logging.info(f"进入process_human_input，收到文本: {text_input}")
         try:
             if not text_input or not text_input.strip():
@@ -196,13 +224,12 @@ class InterviewLogic:
             self.conversation_history.append({"role": "user", "content": self.current_answer})
 
             # 只用 system prompt + history，不再拼接固定问题
-            temp_messages_for_spark = [
-                {"role": "system", "content": self.system_prompt}
-            ] + [msg for msg in self.conversation_history if msg["role"] != "system"]
+            temp_messages_for_spark = INTERVIEW_TEMPLATE.render_chat(
+                [msg for msg in self.conversation_history if msg["role"] != "system"])
 
             logging.info(f"发送给Spark的消息: {temp_messages_for_spark}")
             try:
-                response = self.spark_client.send_message(temp_messages_for_spark)
+                response = self.spark_client.send_message(temp_messages_for_spark, endpoint="interview_question")
                 logging.info(f"Spark模型回复: {response}")
             except Exception as e:
                 logging.error(f"Spark模型调用异常: {e}", exc_info=True)
@@ -247,20 +274,17 @@ class InterviewLogic:
 
     def process_user_answer(self, user_text):
         """处理用户回答，整理成更清晰的内容"""
+        with tracer.span("interview.process_user_answer", chars=len(user_text or "")):
+            return self._process_user_answer(user_text)
+
+    def _process_user_answer(self, user_text):
         try:
             if not user_text or not user_text.strip():
                 return "未提供有效回答"
             
             # 使用AI整理用户的回答
-            prompt = (
-                "你是面试AI助手。请将用户的原始回答进行专业、流畅的整理，只输出整理后的面试回答，不要输出任何说明、处理过程或分析。"
-                "请严格基于用户原始回答，不得添加、虚构或编造任何未出现的信息。"
-                "输出格式示例：\n整理后的面试回答：xxx\n"
-                "用户原始回答：\n" + user_text.strip()
-            )
-            
-            messages = [{"role": "user", "content": prompt}]
-            processed_text = self.spark_client.send_message(messages)
+            messages = ANSWER_TEMPLATE.render(answer=user_text.strip())
+            processed_text = self.spark_client.send_message(messages, endpoint="process_answer")
             
             logging.info(f"用户原始回答: {user_text}")
             logging.info(f"AI整理后回答: {processed_text}")
@@ -282,6 +306,10 @@ class InterviewLogic:
         if not self.tts_client:
             logging.error("TTS 客户端未初始化，无法播放语音。")
             return
+        with tracer.span("interview.play_tts_response", chars=len(text)):
+            self._play_tts_and_wait(text)
+
+    def _play_tts_and_wait(self, text):
         logging.info(f"请求 TTS 合成文本: '{text}'")
         try:
             self.tts_client.synthesize_and_play(text)
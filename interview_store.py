@@ -0,0 +1,342 @@
+# interview_store.py - 面试数据持久化：SQLite（WAL）存储会话、问答、语音特征和表情时间线
+#
+# 原先这些数据放在进程全局变量里，重启即丢失，且全局列表随用户数无限增长。
+# 写入先进入队列，由单个写线程按批提交（一次事务写多条），请求线程不等待磁盘；
+# 最近活跃会话的数据缓存在内存中（LRU，按会话数量和每会话表情条数限制），冷数据从数据库读取。
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+import metrics
+
+STORAGE_BATCH_SIZE = metrics.histogram("storage_write_batch_size", "每次提交事务包含的写操作数",
+                                       buckets=(1, 5, 10, 25, 50, 100, 250, 500))
+STORAGE_COMMIT_SECONDS = metrics.histogram("storage_commit_seconds", "批量写入事务耗时")
+STORAGE_CACHE = metrics.counter("storage_cache_lookups", "会话缓存查询次数", ["result"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    ended_at REAL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    sid TEXT NOT NULL,
+    turn_index INTEGER NOT NULL,
+    question TEXT,
+    answer TEXT,
+    processed_answer TEXT,
+    created_at REAL NOT NULL,
+    audio_turn INTEGER,
+    transcript TEXT,
+    PRIMARY KEY (sid, turn_index)
+);
+CREATE TABLE IF NOT EXISTS audio_features (
+    sid TEXT NOT NULL,
+    round_index INTEGER NOT NULL,
+    features TEXT NOT NULL,
+    summary TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (sid, round_index)
+);
+CREATE TABLE IF NOT EXISTS emotions (
+    sid TEXT NOT NULL,
+    ts REAL NOT NULL,
+    emotion TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS emotions_sid_ts ON emotions (sid, ts);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_SQL_SESSION = "INSERT OR IGNORE INTO sessions (sid, created_at) VALUES (?, ?)"
+_SQL_END_SESSION = "UPDATE sessions SET ended_at = ? WHERE sid = ?"
+_SQL_TURN = ("INSERT OR REPLACE INTO turns (sid, turn_index, question, answer, processed_answer, created_at, "
+             "audio_turn) VALUES (?, ?, ?, ?, ?, ?, ?)")
+_SQL_TRANSCRIPT = "UPDATE turns SET transcript = ? WHERE sid = ? AND audio_turn = ?"
+_SQL_AUDIO = ("INSERT OR REPLACE INTO audio_features (sid, round_index, features, summary, created_at) "
+              "VALUES (?, ?, ?, ?, ?)")
+_SQL_EMOTION = "INSERT INTO emotions (sid, ts, emotion) VALUES (?, ?, ?)"
+_SQL_KV = "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)"
+
+# 旧数据库中缺少的列：(表, 列, 类型)，启动时补齐
+_MIGRATIONS = [
+    ("turns", "audio_turn", "INTEGER"),
+    ("turns", "transcript", "TEXT"),
+]
+
+
+class _SessionCache:
+    """一个会话在内存中的数据。emotions 只保留最近若干条，完整时间线在数据库里。"""
+
+    def __init__(self, turns, audio, emotions, max_emotions):
+        self.turns = turns
+        self.audio = audio
+        self.emotions = deque(emotions, maxlen=max_emotions)
+        self.emotion_count = len(emotions)
+
+
+class InterviewStore:
+    """
+    面试数据存储。写方法只把操作放入队列立即返回；读方法优先查内存缓存，
+    未命中时先等待队列中已有的写入落盘再查询数据库，保证能读到自己刚写入的数据。
+    shared=True 表示多个进程共用同一个数据库（多 worker 部署）：只缓存本进程 start_session 的会话，
+    其他会话和 kv 每次都查数据库，避免读到别的进程写入之前的旧缓存。
+    """
+
+    def __init__(self, path="data/interview.db", batch_size=100, flush_interval=0.5,
+                 cache_sessions=200, cache_emotions=500, shared=False):
+        self.path = path
+        self.shared = shared
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cache_sessions = cache_sessions
+        self.cache_emotions = cache_emotions
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._write_conn = self._connect()
+        self._write_conn.executescript(_SCHEMA)
+        self._migrate()
+        self._write_conn.commit()
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+
+        self._cache = OrderedDict()  # sid -> _SessionCache
+        self._kv = {}
+        self._cache_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="InterviewStoreWriter", daemon=True)
+        self._writer.start()
+        metrics.gauge("storage_pending_writes", "等待写入数据库的操作数").set_function(self._queue.qsize)
+        metrics.gauge("storage_cached_sessions", "内存中缓存的会话数").set_function(lambda: len(self._cache))
+        logging.info(f"面试数据存储已启动: {path}（批量 {batch_size}，缓存会话 {cache_sessions}）")
+
+    def _migrate(self):
+        for table, column, column_type in _MIGRATIONS:
+            columns = {row[1] for row in self._write_conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                try:
+                    self._write_conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError as e:
+                    # 多个 worker 同时启动时，其他进程可能已在检查之后加上了这一列
+                    if "duplicate column name" not in str(e):
+                        raise
+                    continue
+                logging.info(f"面试数据库已添加列 {table}.{column}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")  # 读不阻塞写，写不阻塞读
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下仅在检查点 fsync，进程崩溃不丢已提交数据
+        return conn
+
+    # ---------------- 写入 ----------------
+
+    def _put(self, sql, params):
+        self._queue.put((sql, params))
+
+    def _write_loop(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            # 攒够一批或等到刷新间隔再提交；遇到 flush 标记立即提交
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        ops = [op for op in batch if not isinstance(op, threading.Event)]
+        if ops:
+            start = time.perf_counter()
+            try:
+                with self._write_conn:
+                    # 相邻的同类语句合并为一次 executemany
+                    i = 0
+                    while i < len(ops):
+                        sql = ops[i][0]
+                        j = i
+                        while j < len(ops) and ops[j][0] == sql:
+                            j += 1
+                        self._write_conn.executemany(sql, [op[1] for op in ops[i:j]])
+                        i = j
+            except sqlite3.Error as e:
+                logging.error(f"面试数据批量写入失败（{len(ops)} 条）: {e}", exc_info=True)
+            STORAGE_COMMIT_SECONDS.observe(time.perf_counter() - start)
+            STORAGE_BATCH_SIZE.observe(len(ops))
+        for op in batch:
+            if isinstance(op, threading.Event):
+                op.set()
+
+    def flush(self, timeout=10):
+        """等待此前提交的写操作全部落盘。"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def start_session(self, sid):
+        self._put(_SQL_SESSION, (sid, time.time()))
+        with self._cache_lock:
+            # 新会话没有历史数据，直接放入空缓存，后续写入无需查库
+            if sid not in self._cache:
+                self._cache[sid] = _SessionCache([], [], [], self.cache_emotions)
+                self._evict()
+
+    def end_session(self, sid):
+        self._put(_SQL_END_SESSION, (time.time(), sid))
+        with self._cache_lock:
+            self._cache.pop(sid, None)
+
+    def add_turn(self, sid, question, answer, processed_answer=None, audio_turn=None):
+        """
+        记录一道题的问答，返回题号（从 1 开始）。
+        audio_turn 为本题回答在录音归档中的题号，录音文件转写完成后据此写回 transcript。
+        """
+        cached = self._session(sid)
+        with self._cache_lock:
+            turn = {"index": len(cached.turns) + 1, "question": question, "answer": answer,
+                    "processed_answer": processed_answer, "created_at": time.time(),
+                    "audio_turn": audio_turn, "transcript": None}
+            cached.turns.append(turn)
+        self._put(_SQL_TURN, (sid, turn["index"], question, answer, processed_answer, turn["created_at"],
+                              audio_turn))
+        return turn["index"]
+
+    def set_turn_transcript(self, sid, audio_turn, transcript):
+        """写入录音文件转写得到的高精度文本（按录音归档题号对应）。"""
+        cached = self._session(sid)
+        with self._cache_lock:
+            for turn in cached.turns:
+                if turn.get("audio_turn") == audio_turn:
+                    turn["transcript"] = transcript
+        self._put(_SQL_TRANSCRIPT, (transcript, sid, audio_turn))
+
+    def add_audio_features(self, sid, features, summary=None):
+        """记录一轮回答的语音特征和文字摘要，返回轮次（从 1 开始）。"""
+        cached = self._session(sid)
+        with self._cache_lock:
+            record = {"round": len(cached.audio) + 1, "features": features, "summary": summary,
+                      "created_at": time.time()}
+            cached.audio.append(record)
+        self._put(_SQL_AUDIO, (sid, record["round"], json.dumps(features, ensure_ascii=False, default=float),
+                               summary, record["created_at"]))
+        return record["round"]
+
+    def add_emotion(self, sid, emotion, ts=None):
+        ts = time.time() if ts is None else ts
+        cached = self._session(sid)
+        with self._cache_lock:
+            cached.emotions.append((ts, emotion))
+            cached.emotion_count += 1
+        self._put(_SQL_EMOTION, (sid, ts, emotion))
+
+    def set_value(self, key, value):
+        """保存一个小的 JSON 值（如用户信息），内存中同时保留一份。"""
+        with self._cache_lock:
+            self._kv[key] = value
+        self._put(_SQL_KV, (key, json.dumps(value, ensure_ascii=False)))
+
+    # ---------------- 读取 ----------------
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def _session(self, sid):
+        """取会话缓存；未命中时从数据库加载并按 LRU 淘汰最久未用的会话。"""
+        with self._cache_lock:
+            cached = self._cache.get(sid)
+            if cached is not None:
+                self._cache.move_to_end(sid)
+                STORAGE_CACHE.labels(result="hit").inc()
+                return cached
+        STORAGE_CACHE.labels(result="miss").inc()
+        self.flush()
+        turns = [{"index": r[0], "question": r[1], "answer": r[2], "processed_answer": r[3], "created_at": r[4],
+                  "audio_turn": r[5], "transcript": r[6]}
+                 for r in self._query("SELECT turn_index, question, answer, processed_answer, created_at, "
+                                      "audio_turn, transcript FROM turns WHERE sid = ? ORDER BY turn_index", (sid,))]
+        audio = [{"round": r[0], "features": json.loads(r[1]), "summary": r[2], "created_at": r[3]}
+                 for r in self._query("SELECT round_index, features, summary, created_at "
+                                      "FROM audio_features WHERE sid = ? ORDER BY round_index", (sid,))]
+        count = self._query("SELECT COUNT(*) FROM emotions WHERE sid = ?", (sid,))[0][0]
+        recent = self._query("SELECT ts, emotion FROM emotions WHERE sid = ? ORDER BY ts DESC LIMIT ?",
+                             (sid, self.cache_emotions))
+        loaded = _SessionCache(turns, audio, list(reversed(recent)), self.cache_emotions)
+        loaded.emotion_count = count
+        if self.shared:
+            return loaded  # 不属于本进程的会话，可能仍在别的进程中更新，不缓存
+        with self._cache_lock:
+            cached = self._cache.setdefault(sid, loaded)  # 并发加载时以先放入的为准
+            self._cache.move_to_end(sid)
+            self._evict()
+        return cached
+
+    def _evict(self):
+        """淘汰最久未用的会话，调用方持有 _cache_lock。"""
+        while len(self._cache) > self.cache_sessions:
+            self._cache.popitem(last=False)
+
+    def turns(self, sid):
+        cached = self._session(sid)
+        with self._cache_lock:
+            return [dict(t) for t in cached.turns]
+
+    def audio_features(self, sid):
+        """会话各轮的语音分析记录：[{"round", "features", "summary", "created_at"}]。"""
+        cached = self._session(sid)
+        with self._cache_lock:
+            return list(cached.audio)
+
+    def latest_audio_features(self, sid):
+        cached = self._session(sid)
+        with self._cache_lock:
+            return cached.audio[-1]["features"] if cached.audio else None
+
+    def emotions(self, sid, limit=None):
+        """表情时间线 [(时间戳, 表情)]，按时间顺序。limit 超出缓存范围时查数据库。"""
+        cached = self._session(sid)
+        with self._cache_lock:
+            if limit is not None and limit <= len(cached.emotions):
+                return list(cached.emotions)[-limit:]
+            if cached.emotion_count <= len(cached.emotions):
+                return list(cached.emotions)
+        self.flush()
+        rows = self._query("SELECT ts, emotion FROM emotions WHERE sid = ? ORDER BY ts", (sid,))
+        return rows if limit is None else rows[-limit:]
+
+    def get_value(self, key, default=None):
+        if self.shared:
+            self.flush()  # 先让本进程的写入落盘，再读其他进程可能更新过的值
+        else:
+            with self._cache_lock:
+                if key in self._kv:
+                    return self._kv[key]
+        rows = self._query("SELECT value FROM kv WHERE key = ?", (key,))
+        if not rows:
+            return default
+        value = json.loads(rows[0][0])
+        if self.shared:
+            return value
+        with self._cache_lock:
+            return self._kv.setdefault(key, value)
+
+    def close(self):
+        self.flush()
+        self._write_conn.close()
+        self._read_conn.close()
@@ -0,0 +1,314 @@
+# llm_json.py - 大模型输出中的 JSON 提取：支持分块输入，容忍常见格式缺陷并尽量修复
+#
+# 大模型经常返回“几乎是 JSON”的内容：外面包着说明文字或 ```json 代码块、
+# 末尾多逗号、中文冒号逗号、单引号、未加引号的键、字符串里裸换行或未转义的引号、
+# Python 的 True/None，或者输出被截断。这里先按严格 JSON 解析，失败时逐字符修复后再解析，
+# 避免为了格式问题再调用一次大模型。
+import json
+import re
+
+_NUMBER_RE = re.compile(r'^-?(0|[1-9]\d*)?(\.\d+)?([eE][+-]?\d+)?$')
+# 数字或字面量后面紧跟“键:”，说明中间缺了逗号，如 {"a": 1 b: 2}
+_MISSING_COMMA_KEY_RE = re.compile(r'\s+[A-Za-z_\u4e00-\u9fff][\w\u4e00-\u9fff]*\s*[:：]')
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null",
+             "NaN": "null", "undefined": "null"}
+_OPEN_QUOTES = {'"': '"', "'": "'", "“": "”", "‘": "’"}
+_CLOSERS = {"{": "}", "[": "]"}
+# 双引号后面是当前位置合法的结构字符时才视为字符串结束，否则视为内容里未转义的引号。
+# 换行或另一个引号说明两个值之间缺逗号，如 ["a" "b"]；键后面只能是冒号（含中文冒号）
+_AFTER_KEY = set(":：")
+_AFTER_OBJECT_VALUE = set(",}\n\r\"")
+_AFTER_ARRAY_VALUE = set(",]\n\r\"")
+_ESCAPES = set('"\\/bfnrt')
+_HEX = set("0123456789abcdefABCDEF")
+
+
+def _number(word):
+    """word 是数字时返回合法的 JSON 数字文本（补上 .5 这类省略的整数位），否则返回 None。"""
+    if not _NUMBER_RE.match(word) or not any(c.isdigit() for c in word.split("e")[0].split("E")[0]):
+        return None
+    if word.startswith("."):
+        return "0" + word
+    if word.startswith("-."):
+        return "-0" + word[1:]
+    return word
+
+
+def _find_start(text, pos=0):
+    """返回第一个 { 或 [ 的位置，没有时返回 -1。"""
+    for i in range(pos, len(text)):
+        if text[i] in "{[":
+            return i
+    return -1
+
+
+def _next_significant(text, pos):
+    while pos < len(text) and text[pos] in " \t":
+        pos += 1
+    return text[pos] if pos < len(text) else ""
+
+
+def _read_string(text, i, closing, after):
+    """
+    从 text[i]（起始引号之后）读取字符串内容，返回 (JSON 转义后的内容, 结束位置, 是否正常闭合)。
+    双引号字符串中出现的引号，若后面紧跟的字符不在 after（当前位置合法的结构字符）中，
+    视为内容里未转义的引号；JSON 不认识的转义（如 C:\\path 里的 \\p）按字面的反斜杠处理。
+    """
+    buf = []
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == "\\" and i + 1 < n:
+            nxt = text[i + 1]
+            if nxt in _ESCAPES or (nxt == "u" and n >= i + 6 and set(text[i + 2:i + 6]) <= _HEX):
+                buf.append(text[i:i + 2])
+                i += 2
+            elif nxt == "'":
+                buf.append("'")
+                i += 2
+            else:
+                buf.append("\\\\")
+                i += 1
+            continue
+        if c == closing:
+            nxt = _next_significant(text, i + 1)
+            if closing != '"' or nxt == "" or nxt in after:
+                return "".join(buf), i + 1, True
+            buf.append('\\"')
+        elif c == '"':
+            buf.append('\\"')
+        elif c == "\n":
+            buf.append("\\n")
+        elif c == "\r":
+            pass
+        elif c == "\t":
+            buf.append("\\t")
+        else:
+            buf.append(c)
+        i += 1
+    return "".join(buf), n, False
+
+
+def repair_json(text):
+    """
+    把“近似 JSON”修复为合法 JSON 文本。只处理从第一个 { 或 [ 开始的第一个值，
+    其后的多余内容忽略；输入被截断时补齐未闭合的字符串和括号。找不到 JSON 时返回 None。
+    """
+    start = _find_start(text)
+    if start < 0:
+        return None
+    tokens = []
+    stack = []
+    expect_key = False
+    key_token = None  # 已输出但还没有冒号的键在 tokens 中的位置，截断时需要去掉
+    i = start
+    n = len(text)
+
+    def drop_dangling():
+        # 去掉结尾多余的逗号、没有值的“键:”和没有冒号的键
+        nonlocal key_token
+        while tokens:
+            if tokens[-1] == ",":
+                tokens.pop()
+            elif tokens[-1] == ":":
+                tokens.pop()
+                if tokens and tokens[-1] not in ("{", "[", ","):
+                    tokens.pop()
+            elif key_token is not None and key_token == len(tokens) - 1:
+                tokens.pop()
+                key_token = None
+            else:
+                break
+
+    while i < n:
+        ch = text[i]
+        if ch in _OPEN_QUOTES:
+            # 对象中不在冒号后面的字符串是键（包括值后面缺逗号直接跟的下一个键）
+            is_key = bool(stack) and stack[-1] == "{" and tokens[-1] != ":"
+            if is_key:
+                after = _AFTER_KEY
+            else:
+                after = _AFTER_OBJECT_VALUE if stack and stack[-1] == "{" else _AFTER_ARRAY_VALUE
+            content, i, _ = _read_string(text, i + 1, _OPEN_QUOTES[ch], after)
+            tokens.append('"' + content + '"')
+            key_token = len(tokens) - 1 if is_key else None
+            continue
+        if ch in "{[":
+            stack.append(ch)
+            tokens.append(ch)
+            expect_key = ch == "{"
+            key_token = None
+            i += 1
+            continue
+        if ch in "}]":
+            drop_dangling()
+            if stack:
+                tokens.append(_CLOSERS[stack.pop()])
+            i += 1
+            if not stack:
+                break
+            expect_key = False
+            continue
+        if ch in ",，":
+            if tokens and tokens[-1] == ":":
+                drop_dangling()  # "键": 后面缺值
+            if tokens and tokens[-1] not in ("{", "[", ","):
+                tokens.append(",")
+            expect_key = bool(stack) and stack[-1] == "{"
+            i += 1
+            continue
+        if ch in ":：":
+            tokens.append(":")
+            expect_key = False
+            key_token = None
+            i += 1
+            continue
+        if ch.isspace():
+            i += 1
+            continue
+        if ch == "/" and text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end + 1
+            continue
+        if ch == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if ch == "`":
+            i += 1
+            continue
+        # 裸词：字面量、数字、未加引号的键或字符串
+        stops = ":：,，}]\n" if expect_key else ",，}]\n\""
+        j = i
+        while j < n and text[j] not in stops:
+            j += 1
+        key_follows = False
+        if not expect_key:
+            # 值后面紧跟未加引号的键时截断在键前，由最后的补逗号处理
+            m = _MISSING_COMMA_KEY_RE.search(text, i, j)
+            if m and (_number(text[i:m.start()].strip()) or text[i:m.start()].strip() in _LITERALS):
+                j = m.start()
+                key_follows = bool(stack) and stack[-1] == "{"
+        word = text[i:j].strip()
+        i = j
+        if not word:
+            continue
+        if expect_key:
+            tokens.append(json.dumps(word.strip("'\""), ensure_ascii=False))
+            key_token = len(tokens) - 1
+        elif word in _LITERALS:
+            tokens.append(_LITERALS[word])
+        elif _number(word):
+            tokens.append(_number(word))
+        elif all(_number(p) or p in _LITERALS for p in word.split()):
+            # 空格分隔、缺逗号的多个数字，如 [80 75 90]
+            tokens.extend(_LITERALS.get(p) or _number(p) for p in word.split())
+        else:
+            tokens.append(json.dumps(word, ensure_ascii=False))
+        if key_follows:
+            expect_key = True
+
+    # 截断：补齐未闭合的容器
+    drop_dangling()
+    while stack:
+        tokens.append(_CLOSERS[stack.pop()])
+        if stack:
+            drop_dangling()
+
+    # 相邻两个值之间缺逗号（如换行分隔的数组元素）时补上
+    out = []
+    for tok in tokens:
+        if out and out[-1] not in ("{", "[", ",", ":") and tok not in ("}", "]", ",", ":"):
+            out.append(",")
+        out.append(tok)
+    return "".join(out)
+
+
+class StreamingJSONParser:
+    """
+    增量 JSON 提取器。feed() 可以逐块喂入大模型的流式输出，
+    跳过 JSON 前的说明文字，跟踪括号深度和字符串状态，第一个顶层对象闭合时即判定完成，
+    之后的内容忽略。result() 对完整对象严格解析，失败或未完成（截断）时走修复。
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._start = -1
+        self._scan = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.complete = False
+
+    def feed(self, chunk):
+        """喂入一段文本，返回 JSON 是否已完整。"""
+        if self.complete or not chunk:
+            return self.complete
+        self._text += chunk
+        text = self._text
+        i = self._scan
+        if self._start < 0:
+            self._start = _find_start(text, i)
+            if self._start < 0:
+                self._scan = len(text)
+                return False
+            i = self._start
+        depth, in_string, escape = self._depth, self._in_string, self._escape
+        while i < len(text):
+            c = text[i]
+            if in_string:
+                if escape:
+                    escape = False
+                elif c == "\\":
+                    escape = True
+                elif c == '"':
+                    in_string = False
+            elif c == '"':
+                in_string = True
+            elif c in "{[":
+                depth += 1
+            elif c in "}]":
+                depth -= 1
+                if depth == 0:
+                    self.complete = True
+                    self._text = text[:i + 1]
+                    i += 1
+                    break
+            i += 1
+        self._scan = i
+        self._depth, self._in_string, self._escape = depth, in_string, escape
+        return self.complete
+
+    @property
+    def text(self):
+        """从第一个 { 或 [ 起截取的原始文本（完成后不含尾部多余内容）。"""
+        return self._text[self._start:] if self._start >= 0 else ""
+
+    def result(self):
+        """
+        返回 (解析结果, 是否经过修复)。没有找到 JSON 或修复后仍无法解析时结果为 None。
+        流未结束时调用，可以得到当前已输出部分的尽力解析结果。
+        """
+        raw = self.text
+        if not raw:
+            return None, False
+        if self.complete:
+            try:
+                return json.loads(raw), False
+            except ValueError:
+                pass
+        repaired = repair_json(raw)
+        if repaired is None:
+            return None, True
+        try:
+            return json.loads(repaired), True
+        except ValueError:
+            return None, True
+
+
+def extract_json(text):
+    """从一段完整的大模型回复中提取 JSON，返回 (结果, 是否经过修复)。"""
+    parser = StreamingJSONParser()
+    parser.feed(text or "")
+    return parser.result()
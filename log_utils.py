@@ -0,0 +1,154 @@
+# log_utils.py - 结构化事件日志：按调用点限流/采样、延迟格式化、异步队列落盘
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+_listener = None
+_json_events = False
+
+
+class StructuredMessage:
+    """
+    结构化日志消息。只保存事件名和字段，真正转成字符串推迟到 Handler 格式化时，
+    日志级别未开启或被限流时不会产生任何格式化开销。
+    注意：字段按引用保存，传入可变对象时记录的是落盘那一刻的内容。
+    """
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        if _json_events:
+            return json.dumps({"event": self.event, **self.fields}, ensure_ascii=False, default=str)
+        parts = [self.event]
+        for key, value in self.fields.items():
+            parts.append(f"{key}={_format_value(value)}")
+        return " ".join(parts)
+
+
+def _format_value(value):
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+class _CallSite:
+    """单个调用点的令牌桶限流 + 随机采样状态。"""
+    __slots__ = ("rate", "sample", "capacity", "tokens", "last", "suppressed", "lock")
+
+    def __init__(self, rate, sample):
+        self.rate = rate
+        self.sample = sample
+        # 桶容量至少为 1，rate < 1 时第一条也能放行
+        self.capacity = max(1.0, rate) if rate is not None else 0
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """返回 (是否放行, 自上次放行以来被丢弃的条数)。"""
+        with self.lock:
+            if self.sample is not None and random.random() >= self.sample:
+                self.suppressed += 1
+                return False, 0
+            if self.rate is not None:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens < 1:
+                    self.suppressed += 1
+                    return False, 0
+                self.tokens -= 1
+            suppressed, self.suppressed = self.suppressed, 0
+            return True, suppressed
+
+
+_call_sites = {}
+_call_sites_lock = threading.Lock()
+
+
+def _get_call_site(event, rate, sample):
+    site = _call_sites.get(event)
+    if site is None:
+        with _call_sites_lock:
+            site = _call_sites.setdefault(event, _CallSite(rate, sample))
+    return site
+
+
+def log_event(event, level=logging.INFO, *, logger=None, rate=None, sample=None, **fields):
+    """
+    记录一条结构化事件。
+    event: 事件名，同时作为限流/采样的调用点标识，如 "audio_stream.frame"。
+    rate: 每秒最多记录的条数（令牌桶），None 表示不限流。
+    sample: 采样比例 (0~1]，None 表示不采样。
+    被限流或采样丢弃的条数会以 suppressed 字段附加在下一条放行的记录上。
+    返回本条是否被记录。
+    """
+    logger = logger or logging.getLogger()
+    if not logger.isEnabledFor(level):
+        return False
+    if rate is not None or sample is not None:
+        allowed, suppressed = _get_call_site(event, rate, sample).allow()
+        if not allowed:
+            return False
+        if suppressed:
+            fields["suppressed"] = suppressed
+    logger.log(level, StructuredMessage(event, fields), stacklevel=2)
+    return True
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    进程内队列不需要可序列化，直接把原始 LogRecord 放入队列，
+    消息格式化和 I/O 全部在监听线程中完成，不占用音频等业务线程。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level="INFO", fmt="%(asctime)s - %(levelname)s - %(message)s",
+                  async_io=True, json_events=False):
+    """
+    配置根日志。async_io=True 时通过队列交给后台线程写出，日志 I/O 不会阻塞调用线程。
+    重复调用会替换之前的配置。
+    """
+    global _listener, _json_events
+    _json_events = json_events
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, level) if isinstance(level, str) else level)
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    if async_io:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(_InProcessQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        root.addHandler(stream_handler)
+
+
+def shutdown_logging():
+    """停止后台写日志线程，写完队列中剩余的记录。"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
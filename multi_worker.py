@@ -0,0 +1,139 @@
+# multi_worker.py - 多进程部署：启动多个 app_server worker，经 Socket.IO 消息队列互通，前面用粘性路由分发
+#
+# 单个 app_server 进程受一个 GIL 限制，且 ASR/面试流程等对象是进程内全局的。多 worker 部署时：
+#   - 每个 worker 是独立的 app_server 进程，监听 base_port + i；
+#   - Socket.IO 的 emit 经消息队列（Redis）广播，后台线程给连接在其他 worker 上的客户端推送也能送达；
+#   - 会话数据（问答、语音分析、表情、用户信息）在共享的 SQLite 中，录音归档按 worker 分目录；
+#   - 进行中的音频帧、ASR 连接等仍在进程内，所以同一客户端的 HTTP 和 WebSocket 请求必须落到同一个 worker，
+#     由前端反向代理按客户端 IP 粘性路由（见 --nginx 生成的配置）。
+#
+# 用法：
+#   python multi_worker.py --workers 4 --base-port 5001 --message-queue redis://127.0.0.1:6379/0
+#   python multi_worker.py --workers 4 --base-port 5001 --nginx > /etc/nginx/conf.d/interview.conf
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+NGINX_TEMPLATE = """# 由 multi_worker.py 生成：按客户端 IP 粘性路由到 {workers} 个 app_server worker
+upstream interview_workers {{
+    ip_hash;
+{servers}
+}}
+
+server {{
+    listen {listen_port};
+
+    location / {{
+        proxy_pass http://interview_workers;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_read_timeout 3600s;
+        client_max_body_size 20m;
+    }}
+}}
+"""
+
+
+def nginx_config(workers, base_port, listen_port=5000):
+    servers = "\n".join(f"    server 127.0.0.1:{base_port + i};" for i in range(workers))
+    return NGINX_TEMPLATE.format(workers=workers, servers=servers, listen_port=listen_port)
+
+
+class WorkerSupervisor:
+    """启动并看护 worker 进程：异常退出的 worker 按退避间隔重启，收到终止信号时一起退出。"""
+
+    def __init__(self, workers, base_port, message_queue, host="127.0.0.1", restart_delay=2.0):
+        self.workers = workers
+        self.base_port = base_port
+        self.message_queue = message_queue
+        self.host = host
+        self.restart_delay = restart_delay
+        self.procs = {}  # worker 编号 -> Popen
+        self.started_at = {}  # worker 编号 -> 启动时间
+        self.stopping = False
+
+    def _spawn(self, index):
+        env = dict(os.environ,
+                   WORKER_ID=str(index),
+                   SERVER_HOST=self.host,
+                   SERVER_PORT=str(self.base_port + index),
+                   SOCKETIO_MESSAGE_QUEUE=self.message_queue)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_server.py")
+        self.procs[index] = subprocess.Popen([sys.executable, script], env=env, cwd=os.path.dirname(script))
+        self.started_at[index] = time.monotonic()
+        logging.info(f"worker {index} 已启动: pid={self.procs[index].pid}，端口 {self.base_port + index}")
+
+    def run(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        failures = {index: 0 for index in range(self.workers)}
+        restart_at = {}  # 等待重启的 worker 编号 -> 重启时间；各自计时，一个 worker 退避不耽误其他 worker
+        while not self.stopping:
+            time.sleep(0.5)
+            now = time.monotonic()
+            for index, proc in list(self.procs.items()):
+                if index in restart_at or self.stopping:
+                    continue
+                code = proc.poll()
+                if code is None:
+                    continue
+                if now - self.started_at[index] > 60:
+                    failures[index] = 0  # 稳定运行过一段时间，重新计算退避
+                failures[index] += 1
+                delay = min(self.restart_delay * 2 ** (failures[index] - 1), 60)
+                restart_at[index] = now + delay
+                logging.error(f"worker {index} 退出（返回码 {code}），{delay:.0f}s 后重启")
+            for index, deadline in list(restart_at.items()):
+                if now >= deadline and not self.stopping:
+                    del restart_at[index]
+                    self._spawn(index)
+
+    def stop(self, *_):
+        self.stopping = True
+        for proc in self.procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for index, proc in self.procs.items():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                logging.warning(f"worker {index} 未在 10s 内退出，强制结束")
+                proc.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以多个 worker 进程运行 app_server")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--base-port", type=int, default=5001, help="worker i 监听 base-port + i")
+    parser.add_argument("--host", default="127.0.0.1", help="worker 监听地址（由反向代理对外提供服务）")
+    parser.add_argument("--message-queue", default=os.environ.get("SOCKETIO_MESSAGE_QUEUE", "redis://127.0.0.1:6379/0"),
+                        help="Socket.IO 消息队列，如 redis://127.0.0.1:6379/0；测试可用 memory://（仅单进程有效）")
+    parser.add_argument("--nginx", action="store_true", help="只输出粘性路由的 nginx 配置")
+    parser.add_argument("--listen-port", type=int, default=5000, help="nginx 对外端口（前端连接的端口）")
+    args = parser.parse_args(argv)
+
+    if args.nginx:
+        print(nginx_config(args.workers, args.base_port, args.listen_port))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - multi_worker - %(levelname)s - %(message)s")
+    if args.message_queue.startswith("memory://") and args.workers > 1:
+        logging.warning("memory:// 消息队列只在单个进程内有效，多个 worker 之间的 emit 不会互通")
+    supervisor = WorkerSupervisor(args.workers, args.base_port, args.message_queue, host=args.host)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    logging.info(f"启动 {args.workers} 个 worker，端口 {args.base_port}-{args.base_port + args.workers - 1}，"
+                 f"消息队列 {args.message_queue}；请在前面配置粘性路由（python multi_worker.py --nginx）")
+    supervisor.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
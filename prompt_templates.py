@@ -0,0 +1,156 @@
+# prompt_templates.py - 大模型 prompt 模板注册表：静态部分预编译为固定前缀，动态部分按段限制 token 预算
+#
+# 各处 prompt 原先每次请求都重新拼接，其中大段固定说明（如评测报告的 JSON 格式）每次原样重发。
+# 模板把固定说明放在 system 消息里，内容在进程内只生成一次且逐字节不变，
+# 服务端可以对相同前缀做 prompt 缓存；每次请求只拼接动态段，并按段截断到预算内。
+import logging
+import re
+
+import metrics
+from config import PROMPT_SECTION_BUDGETS
+
+PROMPT_TOKENS = metrics.histogram("prompt_tokens", "prompt 估算 token 数", ["template", "part"],
+                                  buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000))
+PROMPT_TRUNCATIONS = metrics.counter("prompt_truncations", "prompt 动态段因超出预算被截断的次数",
+                                     ["template", "section"])
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]')
+TRUNCATION_MARK = "\n……（内容过长，已截断）……\n"
+
+_registry = {}
+
+
+def count_tokens(text):
+    """
+    估算 token 数：中文字符及全角标点按 1 个计，其余字符按 4 个 1 个计。
+    星火没有公开的本地分词器，这个估算只用于预算控制和监控。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_budget(text, budget, keep="head"):
+    """
+    把 text 截断到约 budget 个 token。keep 为 head 保留开头，tail 保留结尾，
+    both 保留开头和结尾各一半（中间替换为截断标记）。返回 (文本, 是否截断)。
+    """
+    tokens = count_tokens(text)
+    if budget is None or tokens <= budget:
+        return text, False
+    budget = max(budget - count_tokens(TRUNCATION_MARK), 1)
+    # 估算是按字符线性的，按比例取字符数，超出时再收缩一次
+    chars = int(len(text) * budget / tokens)
+    for _ in range(2):
+        if keep == "tail":
+            cut = text[len(text) - chars:]
+            result = TRUNCATION_MARK.lstrip("\n") + cut
+        elif keep == "both":
+            half = chars // 2
+            cut = text[:half] + text[len(text) - half:]
+            result = text[:half] + TRUNCATION_MARK + text[len(text) - half:]
+        else:
+            cut = text[:chars]
+            result = cut + TRUNCATION_MARK.rstrip("\n")
+        actual = count_tokens(cut)
+        if actual <= budget:
+            break
+        chars = int(chars * budget / actual)
+    return result, True
+
+
+class Section:
+    """模板中的一个动态段：label 为固定标题，budget 为 token 预算（None 不限制）。"""
+
+    def __init__(self, name, label, budget=None, keep="head", default="无"):
+        self.name = name
+        self.label = label
+        self.budget = budget
+        self.keep = keep
+        self.default = default
+
+
+class PromptTemplate:
+    """
+    system 为固定说明，创建时即生成 system 消息并计算 token 数；
+    sections 按顺序拼成 user 消息，每段 "标题 + 内容"，内容超出预算时截断。
+    同一模板的所有请求 system 消息完全相同，不同模板若以相同文字开头也能共享前缀缓存。
+    """
+
+    def __init__(self, name, system, sections=(), preamble="", history_budget=None):
+        self.name = name
+        self.system = system
+        self.sections = list(sections)
+        self.preamble = preamble
+        self.history_budget = history_budget
+        self.system_message = {"role": "system", "content": system}
+        self.system_tokens = count_tokens(system)
+        for section in self.sections:
+            override = PROMPT_SECTION_BUDGETS.get(f"{name}.{section.name}")
+            if override is not None:
+                section.budget = override
+
+    def render_user(self, **values):
+        """只拼接动态部分，返回 user 消息内容。"""
+        parts = [self.preamble] if self.preamble else []
+        for section in self.sections:
+            value = values.get(section.name)
+            text = section.default if value is None or value == "" else str(value)
+            text, truncated = truncate_to_budget(text, section.budget, section.keep)
+            if truncated:
+                PROMPT_TRUNCATIONS.labels(template=self.name, section=section.name).inc()
+                logging.info(f"prompt 模板 {self.name} 的 {section.name} 段超出预算 {section.budget} tokens，已截断")
+            parts.append(section.label + text)
+        return "\n".join(parts)
+
+    def render(self, **values):
+        """返回 [system 消息, user 消息]。"""
+        user = self.render_user(**values)
+        self._observe(count_tokens(user))
+        return [self.system_message, {"role": "user", "content": user}]
+
+    def render_chat(self, history):
+        """
+        多轮对话：system 消息加上历史消息。超出 history_budget 时从最早的消息开始丢弃，
+        丢弃后 system 之后的第一条保证是 user 消息（不留下半轮对话）；最后一条消息总是保留。
+        """
+        kept = []
+        total = 0
+        truncated = False
+        for msg in reversed(history):
+            tokens = count_tokens(msg.get("content", ""))
+            if kept and self.history_budget is not None and total + tokens > self.history_budget:
+                PROMPT_TRUNCATIONS.labels(template=self.name, section="history").inc()
+                truncated = True
+                break
+            kept.append(msg)
+            total += tokens
+        kept.reverse()
+        # 截断落在一轮中间时，开头会剩下半轮的 assistant 消息，一并丢弃
+        while truncated and len(kept) > 1 and kept[0].get("role") != "user":
+            total -= count_tokens(kept.pop(0).get("content", ""))
+        self._observe(total)
+        return [self.system_message] + kept
+
+    def _observe(self, dynamic_tokens):
+        PROMPT_TOKENS.labels(template=self.name, part="static").observe(self.system_tokens)
+        PROMPT_TOKENS.labels(template=self.name, part="dynamic").observe(dynamic_tokens)
+
+
+def register(template):
+    """注册模板并返回它；同名模板后注册的覆盖先注册的。"""
+    _registry[template.name] = template
+    return template
+
+
+def get(name):
+    return _registry[name]
+
+
+def templates():
+    """已注册模板的概况：名称、静态部分 token 数、各段预算。"""
+    return {name: {"system_tokens": t.system_tokens,
+                   "sections": {s.name: s.budget for s in t.sections},
+                   "history_budget": t.history_budget}
+            for name, t in _registry.items()}
@@ -1,23 +1,114 @@
 import React, { useEffect, useRef } from 'react';
 import { getSocket } from '../utils/socket';
 
+const SAMPLE_RATE = 16000;
+const OPUS_FLUSH_MS = 200; // Opus 包攒够 200ms 再发送，减少 Socket.IO 事件数
+
+// 浏览器支持 WebCodecs 时优先使用 Opus，否则回退到原始 PCM
+function preferredCodecs() {
+  return typeof window.AudioEncoder !== 'undefined' ? ['opus', 'pcm'] : ['pcm'];
+}
+
+// 每个包前加 2 字节大端长度，与后端 audio_codec.split_packets 对应
+function packPackets(packets) {
+  const total = packets.reduce((n, p) => n + 2 + p.length, 0);
+  const out = new Uint8Array(total);
+  let offset = 0;
+  for (const p of packets) {
+    out[offset] = (p.length >> 8) & 0xff;
+    out[offset + 1] = p.length & 0xff;
+    out.set(p, offset + 2);
+    offset += 2 + p.length;
+  }
+  return out;
+}
+
 export default function AudioRecorder({ canAnswer }) {
   const audioRef = useRef(null);
+  // 当前连接协商好的编码；每次（重新）连接后服务端都是新会话，收到回执前只发 PCM
+  const codecRef = useRef('pcm');
 
+  // 与后端协商本会话的音频编码，断线重连后重新协商
   useEffect(() => {
-    let audioContext, source, processor, stream;
-    
+    const socket = getSocket();
+    if (!socket) return;
+    const onConnect = () => {
+      codecRef.current = 'pcm';
+      socket.emit('audio_config', { codecs: preferredCodecs() });
+    };
+    const onDisconnect = () => {
+      codecRef.current = 'pcm';
+    };
+    const onAck = data => {
+      codecRef.current = (data && data.codec) || 'pcm';
+      console.log('【前端音频】协商编码:', codecRef.current);
+    };
+    socket.on('connect', onConnect);
+    socket.on('disconnect', onDisconnect);
+    socket.on('audio_config_ack', onAck);
+    if (socket.connected) onConnect();
+    return () => {
+      socket.off('connect', onConnect);
+      socket.off('disconnect', onDisconnect);
+      socket.off('audio_config_ack', onAck);
+    };
+  }, []);
+
+  useEffect(() => {
+    let audioContext, source, processor, stream, encoder, flushTimer;
+    let pending = [];
+    let timestamp = 0;
+    let pcmUntil = 0; // 此时间戳（微秒）之前的音频已按 PCM 发送，对应的编码包丢弃
+
     if (canAnswer) {
       console.log('开始录音...');
       navigator.mediaDevices.getUserMedia({ audio: true }).then(s => {
         stream = s;
-        audioContext = new (window.AudioContext || window.webkitAudioContext)({ sampleRate: 16000 });
+        audioContext = new (window.AudioContext || window.webkitAudioContext)({ sampleRate: SAMPLE_RATE });
         source = audioContext.createMediaStreamSource(stream);
         processor = audioContext.createScriptProcessor(4096, 1, 1);
         source.connect(processor);
         processor.connect(audioContext.destination);
+
+        // 浏览器支持 Opus 时一直编码，但只有当前连接协商为 opus 后才发送编码包
+        if (preferredCodecs()[0] === 'opus') {
+          encoder = new window.AudioEncoder({
+            output: chunk => {
+              if (chunk.timestamp < pcmUntil) return;
+              const buf = new Uint8Array(chunk.byteLength);
+              chunk.copyTo(buf);
+              pending.push(buf);
+            },
+            error: err => console.error('Opus 编码出错', err),
+          });
+          encoder.configure({ codec: 'opus', sampleRate: SAMPLE_RATE, numberOfChannels: 1, bitrate: 24000 });
+          flushTimer = setInterval(() => {
+            if (pending.length === 0) return;
+            if (codecRef.current !== 'opus') {
+              pending = []; // 断线前未发出的编码包，新连接协商好之前丢弃
+              return;
+            }
+            const packed = packPackets(pending);
+            pending = [];
+            getSocket().emit('audio_stream', packed);
+          }, OPUS_FLUSH_MS);
+        }
+
         processor.onaudioprocess = (e) => {
           const input = e.inputBuffer.getChannelData(0);
+          if (encoder && encoder.state === 'configured') {
+            encoder.encode(new window.AudioData({
+              format: 'f32',
+              sampleRate: SAMPLE_RATE,
+              numberOfFrames: input.length,
+              numberOfChannels: 1,
+              timestamp,
+              data: new Float32Array(input),
+            }));
+            timestamp += Math.round(input.length * 1e6 / SAMPLE_RATE);
+            if (codecRef.current === 'opus') return;
+            pcmUntil = timestamp;
+          }
           let buf = new Int16Array(input.length);
           for (let i = 0; i < input.length; i++) {
             let s = Math.max(-1, Math.min(1, input[i]));
@@ -25,7 +116,6 @@ export default function AudioRecorder({ canAnswer }) {
           }
           // 转换为 bytes 类型发送
           const audioData = new Uint8Array(buf.buffer);
-          console.log('【前端音频】发送音频帧，长度:', audioData.length, '字节');
           getSocket().emit('audio_stream', audioData);
         };
       }).catch(err => {
@@ -34,8 +124,16 @@ export default function AudioRecorder({ canAnswer }) {
     } else {
       console.log('停止录音...');
     }
-    
+
     return () => {
+      if (flushTimer) clearInterval(flushTimer);
+      if (encoder && encoder.state !== 'closed') {
+        encoder.flush().then(() => {
+          if (pending.length > 0 && codecRef.current === 'opus') getSocket().emit('audio_stream', packPackets(pending));
+          pending = [];
+          encoder.close();
+        }).catch(() => {});
+      }
       if (processor) processor.disconnect();
       if (source) source.disconnect();
       if (audioContext) audioContext.close();
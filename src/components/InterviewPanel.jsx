@@ -17,6 +17,9 @@ const NAVS = [
   { key: 'user', label: '个人中心', icon: <UserOutlined /> },
 ];
 
+const EVALUATION_POLL_MS = 2000; // 评测任务轮询间隔
+const EVALUATION_TIMEOUT_MS = 6 * 60 * 1000; // 最长等待评测结果的时间
+
 export default function InterviewPanel() {
   const [question, setQuestion] = useState('');
   const [userAnswer, setUserAnswer] = useState('');
@@ -317,7 +320,8 @@ export default function InterviewPanel() {
     // 拉取所有轮次语音分析
     let audioAnalysisText = '';
     try {
-      const audioRes = await fetch('/api/get_audio_analysis');
+      const currentSocket = getSocket();
+      const audioRes = await fetch(`/api/get_audio_analysis?sid=${encodeURIComponent(currentSocket ? currentSocket.id : '')}`);
       const audioData = await audioRes.json();
       audioAnalysisText = (audioData.audio_analysis || []).map((txt, idx) => `第${idx+1}轮：${txt}`).join('\n');
     } catch (e) {
@@ -326,6 +330,7 @@ export default function InterviewPanel() {
     // 统计情绪分布
     const videoSummary = summarizeEmotions(videoEmotions);
     try {
+      const socket = getSocket();
       const res = await fetch('/api/interview/result', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
@@ -334,10 +339,14 @@ export default function InterviewPanel() {
           video_analysis: videoSummary,
           resume_text: resumeText,
           audio_analysis: audioAnalysisText,
+          sid: socket ? socket.id : undefined,
         }),
       });
-      const data = await res.json();
-      setReportResult(data);
+      const job = await res.json();
+      const finished = job.status === 'done' || job.status === 'error'
+        ? job
+        : await waitForEvaluation(job.job_id, socket);
+      setReportResult(finished.result || { error: '生成评测报告失败' });
       setShowReportBtn(false);
     } catch (e) {
       setReportResult({ error: '生成评测报告失败' });
@@ -345,6 +354,38 @@ export default function InterviewPanel() {
     setReportLoading(false);
   };
 
+  // 等待后台评测任务完成：优先接收 Socket.IO 推送，同时定时轮询兜底
+  function waitForEvaluation(jobId, socket) {
+    return new Promise((resolve, reject) => {
+      let timer = null;
+      const deadline = Date.now() + EVALUATION_TIMEOUT_MS;
+      const finish = (job) => {
+        if (timer) clearTimeout(timer);
+        if (socket) socket.off('evaluation_result', onPush);
+        resolve(job);
+      };
+      const onPush = (job) => {
+        if (job && job.job_id === jobId) finish(job);
+      };
+      const poll = async () => {
+        try {
+          const res = await fetch(`/api/interview/result/${jobId}`);
+          const job = await res.json();
+          if (job.status === 'done' || job.status === 'error') return finish(job);
+        } catch (e) {
+          // 网络抖动时继续轮询
+        }
+        if (Date.now() > deadline) {
+          if (socket) socket.off('evaluation_result', onPush);
+          return reject(new Error('评测超时'));
+        }
+        timer = setTimeout(poll, EVALUATION_POLL_MS);
+      };
+      if (socket) socket.on('evaluation_result', onPush);
+      timer = setTimeout(poll, EVALUATION_POLL_MS);
+    });
+  }
+
   function getRadarOption(scores) {
     const indicators = [
       { name: '专业知识水平', max: 100 },
@@ -1,4 +1,5 @@
 import React, { useRef, useEffect, useState } from 'react';
+import { getSocket } from '../utils/socket';
 
 export default function VideoPreview({ onEmotionResult }) {
   const videoRef = useRef(null);
@@ -38,10 +39,12 @@ export default function VideoPreview({ onEmotionResult }) {
           const ctx = canvasRef.current.getContext('2d', { willReadFrequently: true });
           ctx.drawImage(videoRef.current, 0, 0, 320, 240);
           const dataUrl = canvasRef.current.toDataURL('image/jpeg');
+          const socket = getSocket();
           fetch('/api/face_emotion', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ image: dataUrl })
+            // 带上会话 ID，后端记入该会话的表情时间线
+            body: JSON.stringify({ image: dataUrl, sid: socket ? socket.id : undefined })
           })
             .then(res => res.json())
             .then(data => {
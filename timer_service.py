@@ -0,0 +1,98 @@
+# timer_service.py - 共享的定时任务调度服务
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class DeadlineScheduler:
+    """
+    基于最小堆的定时调度器，所有会话共用一个后台线程。
+    每个任务用 key 标识，重复 schedule 同一个 key 会覆盖之前的截止时间（旧堆项惰性丢弃），
+    因此“每收到一次中间结果就顺延截止时间”只是一次堆插入，不会创建新线程。
+    回调在调度线程中执行，应尽量简短；耗时操作请自行转交其他线程。
+    """
+
+    def __init__(self, name="DeadlineScheduler"):
+        self.name = name
+        self._heap = []
+        self._entries = {}  # key -> (deadline, seq, callback)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, key, delay, callback):
+        """在 delay 秒后执行 callback；key 已存在时改为新的截止时间。"""
+        deadline = time.monotonic() + delay
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[key] = (deadline, seq, callback)
+            heapq.heappush(self._heap, (deadline, seq, key))
+            # 只有新任务成为最早的截止时间时才需要唤醒调度线程
+            if self._heap[0][1] == seq:
+                self._cond.notify()
+
+    def cancel(self, key):
+        """取消 key 对应的任务，返回是否存在。"""
+        with self._cond:
+            return self._entries.pop(key, None) is not None
+
+    def is_scheduled(self, key):
+        with self._cond:
+            return key in self._entries
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._entries)
+
+    def shutdown(self, timeout=2):
+        with self._cond:
+            self._stopped = True
+            self._entries.clear()
+            self._heap.clear()
+            self._cond.notify()
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                callback = None
+                while callback is None:
+                    if self._stopped:
+                        return
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, seq, key = self._heap[0]
+                    entry = self._entries.get(key)
+                    if entry is None or entry[1] != seq:
+                        # 已取消或已被重新调度的旧堆项
+                        heapq.heappop(self._heap)
+                        continue
+                    wait = deadline - time.monotonic()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                    heapq.heappop(self._heap)
+                    del self._entries[key]
+                    callback = entry[2]
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"{self.name} 定时任务 {key} 执行异常: {e}", exc_info=True)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """返回进程内共享的调度器（首次调用时启动）。"""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = DeadlineScheduler()
+        return _default_scheduler
@@ -0,0 +1,324 @@
+# tracing.py - 轻量级单轮面试链路追踪（span/trace 上下文），导出 JSON 或 OTLP/JSON 文件
+import contextvars
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    一个计时区间。trace_id 相同的 span 组成一棵树（一轮回答的瀑布图），
+    parent_id 为空的是根 span。时间统一用 time.time_ns()，方便直接写入 OTLP。
+    """
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id",
+                 "start_ns", "end_ns", "attributes", "events", "status", "_children")
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = "ok"
+        self._children = []
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        """记录一个时间点（如 TTS 首包到达），可以在任意线程调用。"""
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def set_error(self, error):
+        self.status = "error"
+        self.attributes["error"] = str(error)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._on_span_end(self)
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时返回的空 span，调用方无需判断。"""
+    name = trace_id = span_id = parent_id = None
+    duration_ms = 0.0
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def set_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()]
+
+
+def _to_otlp(spans, service_name):
+    """按 OTLP/JSON（ExportTraceServiceRequest）格式组织一条 trace。"""
+    otlp_spans = []
+    for span in spans:
+        item = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes(span.attributes),
+            "events": [{"name": e["name"], "timeUnixNano": str(e["time_ns"]),
+                        "attributes": _otlp_attributes(e["attributes"])} for e in span.events],
+            "status": {"code": 2 if span.status == "error" else 1},
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        otlp_spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+class Tracer:
+    """
+    进程内追踪器。根 span 结束时，把整条 trace 作为一行追加到导出文件：
+    fmt="otlp" 时为 OTLP/JSON（可直接被 otel-collector 的 file receiver 或 Jaeger 导入），
+    fmt="json" 时为简化的 {"trace_id", "spans": [...]} 结构。
+    """
+
+    def __init__(self, export_path=None, fmt="otlp", service_name="ai-interview", enabled=True):
+        self.export_path = export_path
+        self.fmt = fmt
+        self.service_name = service_name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()  # 只保护导出文件的追加写，写文件时不占用 _lock
+        self._pending = {}  # trace_id -> [已结束的 span]
+        self._open_traces = set()  # 根 span 尚未结束的 trace_id
+        self._turns = {}  # 会话 key -> 进行中的根 span
+
+    # ---------- span 创建 ----------
+
+    def start_span(self, name, parent=None, **attributes):
+        """创建 span，不改变当前上下文。parent 为空时取当前上下文中的 span，仍为空则新建 trace。"""
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = _current_span.get()
+        if parent is None or parent is NOOP_SPAN:
+            trace_id = secrets.token_hex(16)
+            with self._lock:
+                self._open_traces.add(trace_id)
+            return Span(self, name, trace_id, attributes=attributes)
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        """with tracer.span("spark.send_message"): ... 期间该 span 为当前上下文。"""
+        span = self.start_span(name, parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    @contextmanager
+    def activate(self, span):
+        """在当前线程中把已有的 span 设为上下文（用于跨线程、跨 Socket.IO 事件传递）。"""
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    # ---------- 按会话管理的“一轮回答” ----------
+
+    def start_turn(self, key, **attributes):
+        """
+        开始一轮回答的根 span（end_answer 时调用）。同一个 key 上未结束的轮次会先结束。
+        一轮回答跨越多个 Socket.IO 事件（end_answer → user_answer），因此根 span 按 key 暂存。
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        with self._lock:
+            previous = self._turns.pop(key, None)
+        if previous is not None:
+            previous.set_attribute("abandoned", True)
+            previous.end()
+        span = self.start_span("interview.turn", parent=NOOP_SPAN, **attributes)
+        with self._lock:
+            self._turns[key] = span
+        return span
+
+    def current_turn(self, key):
+        with self._lock:
+            return self._turns.get(key, NOOP_SPAN)
+
+    def end_turn(self, key, **attributes):
+        with self._lock:
+            span = self._turns.pop(key, None)
+        if span is not None:
+            for k, v in attributes.items():
+                span.set_attribute(k, v)
+            span.end()
+
+    # ---------- 导出 ----------
+
+    def _on_span_end(self, span):
+        with self._lock:
+            if span.parent_id is None:
+                self._open_traces.discard(span.trace_id)
+                spans = self._pending.pop(span.trace_id, []) + [span]
+            elif span.trace_id in self._open_traces:
+                self._pending.setdefault(span.trace_id, []).append(span)
+                return
+            else:
+                # 根 span 结束即视为整轮结束；之后才结束的子 span（如异步线程）单独成行导出
+                spans = [span]
+        self._export(spans)
+
+    def _export(self, spans):
+        if not self.export_path:
+            return
+        if self.fmt == "otlp":
+            record = _to_otlp(spans, self.service_name)
+        else:
+            record = {"trace_id": spans[0].trace_id, "spans": [s.to_dict() for s in spans]}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        try:
+            directory = os.path.dirname(self.export_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._export_lock:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logging.error(f"写入追踪文件失败: {e}")
+
+
+def current_span():
+    """返回当前上下文中的 span，没有时返回 NOOP_SPAN。"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def _load_tracer():
+    try:
+        from config import TRACE_ENABLED, TRACE_EXPORT_PATH, TRACE_EXPORT_FORMAT
+    except ImportError:
+        TRACE_ENABLED, TRACE_EXPORT_PATH, TRACE_EXPORT_FORMAT = True, "traces/turns.jsonl", "otlp"
+    return Tracer(export_path=TRACE_EXPORT_PATH, fmt=TRACE_EXPORT_FORMAT, enabled=TRACE_ENABLED)
+
+
+# 进程内共享的追踪器
+tracer = _load_tracer()
+
+
+# ---------- 离线分析：python tracing.py traces/turns.jsonl ----------
+
+def _iter_spans(path):
+    """兼容两种导出格式，逐条产出 (trace_id, name, parent_id, duration_ms)。"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "resourceSpans" in record:
+                for rs in record["resourceSpans"]:
+                    for ss in rs.get("scopeSpans", []):
+                        for s in ss.get("spans", []):
+                            duration = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+                            yield s["traceId"], s["name"], s.get("parentSpanId"), duration
+            else:
+                for s in record.get("spans", []):
+                    yield s["trace_id"], s["name"], s.get("parent_id"), s["duration_ms"]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def summarize(path):
+    """按 span 名称统计 p50/p90/p99 耗时，返回 {name: {...}}。"""
+    durations = {}
+    for _, name, _, duration in _iter_spans(path):
+        durations.setdefault(name, []).append(duration)
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50_ms": _percentile(values, 0.5),
+            "p90_ms": _percentile(values, 0.9),
+            "p99_ms": _percentile(values, 0.99),
+            "max_ms": values[-1],
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    trace_path = sys.argv[1] if len(sys.argv) > 1 else tracer.export_path
+    result = summarize(trace_path)
+    print(f"{'span':40s} {'count':>6s} {'p50(ms)':>10s} {'p90(ms)':>10s} {'p99(ms)':>10s} {'max(ms)':>10s}")
+    for span_name, stats in sorted(result.items(), key=lambda kv: -kv[1]["p99_ms"]):
+        print(f"{span_name:40s} {stats['count']:6d} {stats['p50_ms']:10.1f} {stats['p90_ms']:10.1f} "
+              f"{stats['p99_ms']:10.1f} {stats['max_ms']:10.1f}")
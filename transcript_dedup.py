@@ -0,0 +1,121 @@
+# transcript_dedup.py - 面试记录去重：被其他行包含的行视为重复，只保留最长的完整版本
+#
+# ASR 中间结果会让同一句话以多个前缀/片段的形式出现在面试记录里。
+# 原实现对每一行都与已保留的所有行做子串比较，复杂度 O(n²·m)；
+# 这里先用哈希去掉完全相同的行，再对全部行建 Aho–Corasick 自动机，
+# 每行扫描一遍即可得到“哪些行被别的行包含”，整体近似线性。
+
+
+class _AhoCorasick:
+    """
+    多模式串自动机。节点用整数编号，goto 为 dict 列表，fail 为失配链接。
+    terminal[v] 为以节点 v 结尾的模式编号（没有则为 -1）。
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.terminal = [-1]
+        self.pattern_node = []
+        for idx, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.terminal.append(-1)
+                node = nxt
+            self.terminal[node] = idx
+            self.pattern_node.append(node)
+        self.order = self._build_fail_links()
+
+    def _build_fail_links(self):
+        """按 BFS 顺序计算失配链接，返回 BFS 顺序（父节点总在子节点之前）。"""
+        goto, fail = self.goto, self.fail
+        order = []
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            order.append(node)
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0) if node else 0
+                fail[child] = target if target != child else 0
+                queue.append(child)
+        return order
+
+    def scan(self, text):
+        """逐字符推进，依次产出每个位置所在的节点。"""
+        goto, fail = self.goto, self.fail
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            yield node
+
+
+def dedup_lines(lines):
+    """
+    对若干行去重：去掉首尾空白和空行；被其他行包含（子串）的行丢弃，只保留最长的完整版本。
+    保留下来的行排在它所包含的各行中最早出现的位置，与逐行“较长的替换较短的”的结果一致。
+    返回去重后的行列表。
+    """
+    # 1. 哈希去掉完全相同的行，记录首次出现的位置
+    first_index = {}
+    for line in lines:
+        line = line.strip()
+        if line and line not in first_index:
+            first_index[line] = len(first_index)
+    unique = list(first_index)
+    if len(unique) <= 1:
+        return unique
+
+    ac = _AhoCorasick(unique)
+    n_nodes = len(ac.goto)
+    fail, terminal, pattern_node = ac.fail, ac.terminal, ac.pattern_node
+
+    # chain_min[v]：v 的后缀链上（含 v）所有模式的最小编号，用于确定保留行的位置
+    big = len(unique)
+    chain_min = [big] * n_nodes
+    for node in ac.order:
+        own = terminal[node] if terminal[node] >= 0 else big
+        chain_min[node] = min(own, chain_min[fail[node]])
+
+    # 2. 逐行扫描。某位置停在节点 s，则 s 后缀链上的所有模式都出现在这一行中。
+    #    只有扫描到行尾且停在该行自身节点时，这次命中是“自己包含自己”，改为标记其失配节点。
+    hit = [False] * n_nodes
+    position = list(range(len(unique)))
+    for idx, line in enumerate(unique):
+        own_node = pattern_node[idx]
+        last = len(line) - 1
+        best = idx
+        for i, node in enumerate(ac.scan(line)):
+            if i == last and node == own_node:
+                hit[fail[node]] = True
+            else:
+                hit[node] = True
+            if chain_min[node] < best:
+                best = chain_min[node]
+        position[idx] = best
+
+    # 3. 标记沿失配链接向根传播（深节点先处理），被标记的模式节点即被某行包含
+    for node in reversed(ac.order):
+        if hit[node]:
+            hit[fail[node]] = True
+
+    kept = [idx for idx in range(len(unique)) if not hit[pattern_node[idx]]]
+    kept.sort(key=lambda idx: (position[idx], idx))
+    return [unique[idx] for idx in kept]
+
+
+def remove_duplicates(text):
+    """按行去重面试文本，保留最长的完整版本。"""
+    return '\n'.join(dedup_lines(text.split('\n')))
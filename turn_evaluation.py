@@ -0,0 +1,122 @@
+# turn_evaluation.py - 面试过程中逐题后台评分，面试结束时只需汇总
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import metrics
+from llm_json import extract_json
+from prompt_templates import PromptTemplate, Section, register
+
+# 评测报告的六个能力维度，顺序与雷达图一致
+DIMENSIONS = ["专业知识水平", "技能匹配度", "语言表达能力", "逻辑思维能力", "创新能力", "应变抗压能力"]
+
+TURN_EVAL_SECONDS = metrics.histogram("turn_evaluation_seconds", "单题评分耗时", ["outcome"])
+
+
+TURN_TEMPLATE = register(PromptTemplate(
+    "turn_evaluation",
+    "你是面试评测专家。请只针对用户给出的这一道题的回答评分，"
+    "六个维度各 0-100 分，本题无法体现的维度填 null。\n"
+    "请严格只输出如下JSON，不要有多余解释：\n"
+    "{\"scores\": {" + ", ".join(f"\"{d}\": 80" for d in DIMENSIONS) + "},\n"
+    "\"strength\": \"本题回答的亮点\", \"issue\": \"本题回答的主要问题\", "
+    "\"suggestion\": \"针对本题的改进建议\", \"comment\": \"一句话点评\"}",
+    [Section("question", "【问题】：", budget=300),
+     Section("answer", "【回答】：", budget=1500, keep="both"),
+     Section("audio", "【语音特征】：")],
+))
+
+
+def build_turn_messages(question, answer, audio_features=None):
+    """单题评分请求：只包含本题问答和本轮语音特征，远小于整场面试的 prompt。"""
+    audio_text = "无"
+    if audio_features:
+        audio_text = (f"响度 {audio_features.get('loudness_db', 0):.1f} dB，"
+                      f"时长 {audio_features.get('duration_seconds', 0):.1f} 秒，"
+                      f"音高 {audio_features.get('average_pitch_hz', 0):.0f} Hz，"
+                      f"情绪 {audio_features.get('estimated_emotional_tone', '未知')}")
+    return TURN_TEMPLATE.render(question=question, answer=answer, audio=audio_text)
+
+
+def parse_turn_reply(reply):
+    """解析单题评分结果，失败返回 None。"""
+    if not reply:
+        return None
+    result, _ = extract_json(reply)
+    if not isinstance(result, dict):
+        return None
+    scores = {}
+    for dim in DIMENSIONS:
+        value = (result.get("scores") or {}).get(dim)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            scores[dim] = max(0, min(100, int(round(value))))
+    result["scores"] = scores
+    return result
+
+
+class TurnEvaluator:
+    """
+    每道题回答后提交一次后台评分，按会话保存结果。
+    面试结束时 collect() 取出各题评分（可等待仍在进行中的评分），交给最终报告汇总。
+    """
+
+    def __init__(self, spark_client, workers=2, audio_wait=10):
+        self.spark_client = spark_client
+        self.audio_wait = audio_wait
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="TurnEvaluator")
+        self._sessions = {}  # sid -> [{"index", "question", "answer", "future"}]
+        self._lock = threading.Lock()
+
+    def submit(self, sid, question, answer, audio_features=None):
+        """
+        提交一道题的评分，返回题号（从 1 开始）。
+        audio_features 可以是语音分析的 Future，评分前最多等待 audio_wait 秒，超时按无语音特征评分。
+        """
+        with self._lock:
+            # 在锁内创建 future 再登记，collect() 看到的每道题都已有 future，不会漏等刚提交的题
+            turns = self._sessions.setdefault(sid, [])
+            index = len(turns) + 1
+            future = self._executor.submit(self._evaluate, index, question, answer, audio_features)
+            turns.append({"index": index, "question": question, "answer": answer, "future": future})
+        logging.info(f"会话 {sid} 第{index}题已提交后台评分")
+        return index
+
+    def _evaluate(self, index, question, answer, audio_features):
+        if isinstance(audio_features, Future):
+            try:
+                audio_features = audio_features.result(timeout=self.audio_wait)
+            except Exception as e:
+                logging.warning(f"第{index}题语音分析未就绪，按无语音特征评分: {e!r}")
+                audio_features = None
+        start = time.perf_counter()
+        reply = self.spark_client.send_message(build_turn_messages(question, answer, audio_features),
+                                               endpoint="turn_evaluation")
+        result = parse_turn_reply(reply)
+        TURN_EVAL_SECONDS.labels(outcome="ok" if result else "error").observe(time.perf_counter() - start)
+        if result is None:
+            logging.warning(f"第{index}题评分结果解析失败: {str(reply)[:200]}")
+        return result
+
+    def collect(self, sid, timeout=20):
+        """
+        返回会话各题的评分列表（按题号）。最多等待 timeout 秒让进行中的评分完成，
+        超时或失败的题目 assessment 为 None，由最终报告回退到原始问答。
+        """
+        with self._lock:
+            turns = list(self._sessions.get(sid, []))
+        if turns:
+            wait([t["future"] for t in turns], timeout=timeout)
+        collected = []
+        for t in turns:
+            future = t["future"]
+            assessment = None
+            if future.done() and not future.exception():
+                assessment = future.result()
+            collected.append({"index": t["index"], "question": t["question"], "answer": t["answer"],
+                              "assessment": assessment})
+        return collected
+
+    def clear(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
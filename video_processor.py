@@ -2,25 +2,196 @@ import cv2
 import time
 import logging
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import threading
 from datetime import datetime
 
+from frame_bus import FrameBus
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+
+# ---------------- 录制后端 ----------------
+# 统一接口：open(路径, 帧率, (宽, 高)) -> write(BGR 帧) -> close()。
+# mp4v（OpenCV 自带）码率高、压缩差；ffmpeg / PyAV 使用 H.264 或 VP9 的低 CPU 预设，
+# 同等画质下文件更小、编码更省 CPU。
+
+# 各编码的 CPU 友好参数：x264 veryfast + CRF；VP9 realtime + 最快 cpu-used + 多线程行编码
+CODEC_OPTIONS = {
+    "h264": {"encoder": "libx264", "crf": 28, "options": {"preset": "veryfast"}},
+    "vp9": {"encoder": "libvpx-vp9", "crf": 40, "options": {"deadline": "realtime", "cpu-used": "8", "row-mt": "1", "b": "0"}},
+}
+
+
+class OpenCVRecorder:
+    """cv2.VideoWriter + mp4v，不依赖外部程序，作为兜底。"""
+    name = "opencv"
+
+    def __init__(self, codec=None, crf=None):
+        self.writer = None
+
+    def open(self, path, fps, resolution):
+        # FourCC 是视频编解码器的4字符代码。'mp4v' 是 MPEG-4 编码。
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.writer = cv2.VideoWriter(path, fourcc, fps, resolution)
+        if not self.writer.isOpened():
+            raise IOError(f"无法创建视频写入器或打开视频文件: {path}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        if self.writer:
+            self.writer.release()
+            self.writer = None
+
+
+class FFmpegRecorder:
+    """把原始 BGR 帧通过管道写给 ffmpeg 子进程编码，编码在独立进程中进行，不占 Python 的 GIL。"""
+    name = "ffmpeg"
+
+    def __init__(self, codec="h264", crf=None):
+        self.codec = codec
+        self.crf = crf
+        self.process = None
+        self.errors = None  # ffmpeg 的错误输出写到临时文件，不占管道缓冲，编码失败时读取末尾
+
+    @staticmethod
+    def available():
+        return shutil.which("ffmpeg") is not None
+
+    def _error_tail(self):
+        self.errors.seek(0)
+        return self.errors.read().decode(errors='ignore')[-500:]
+
+    def open(self, path, fps, resolution):
+        spec = CODEC_OPTIONS[self.codec]
+        cmd = ["ffmpeg", "-loglevel", "error", "-y",
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{resolution[0]}x{resolution[1]}",
+               "-r", f"{fps:.3f}", "-i", "-", "-an",
+               "-c:v", spec["encoder"], "-crf", str(self.crf if self.crf is not None else spec["crf"])]
+        for key, value in spec["options"].items():
+            cmd += [f"-{key}", value]
+        cmd += ["-pix_fmt", "yuv420p", path]
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=self.errors)
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(memoryview(frame))  # 连续数组直接写入管道，不经过 tobytes 复制
+        except BrokenPipeError:
+            raise IOError(f"ffmpeg 编码进程已退出: {self._error_tail()}")
+
+    def close(self):
+        if self.process:
+            self.process.stdin.close()
+            if self.process.wait(timeout=30) != 0:
+                logging.error(f"ffmpeg 编码失败: {self._error_tail()}")
+            self.process = None
+            self.errors.close()
+            self.errors = None
+
+
+class PyAVRecorder:
+    """PyAV（libav 的 Python 绑定）进程内编码，没有 ffmpeg 可执行文件时使用。"""
+    name = "pyav"
+
+    def __init__(self, codec="h264", crf=None):
+        self.codec = codec
+        self.crf = crf
+        self.container = None
+        self.stream = None
+
+    @staticmethod
+    def available():
+        try:
+            import av  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def open(self, path, fps, resolution):
+        import av
+        from fractions import Fraction
+        spec = CODEC_OPTIONS[self.codec]
+        self.container = av.open(path, mode="w")
+        self.stream = self.container.add_stream(spec["encoder"], rate=Fraction(fps).limit_denominator(1001))
+        self.stream.width, self.stream.height = resolution
+        self.stream.pix_fmt = "yuv420p"
+        options = dict(spec["options"])
+        options["crf"] = str(self.crf if self.crf is not None else spec["crf"])
+        self.stream.options = options
+
+    def write(self, frame):
+        import av
+        for packet in self.stream.encode(av.VideoFrame.from_ndarray(frame, format="bgr24")):
+            self.container.mux(packet)
+
+    def close(self):
+        if self.container:
+            for packet in self.stream.encode():  # 刷出编码器里缓存的帧
+                self.container.mux(packet)
+            self.container.close()
+            self.container = None
+
+
+RECORDERS = {"ffmpeg": FFmpegRecorder, "pyav": PyAVRecorder, "opencv": OpenCVRecorder}
+
+
+def create_recorder(encoder="auto", codec="h264", crf=None):
+    """
+    按名称创建录制后端。encoder 为 auto 时依次尝试 ffmpeg、PyAV，都不可用时退回 OpenCV mp4v。
+    """
+    if encoder == "auto":
+        for name in ("ffmpeg", "pyav"):
+            if RECORDERS[name].available():
+                return RECORDERS[name](codec, crf)
+        logging.warning("未找到 ffmpeg 或 PyAV，使用 OpenCV mp4v 录制（码率和 CPU 占用较高）")
+        return OpenCVRecorder()
+    if encoder not in RECORDERS:
+        raise ValueError(f"未知的录制后端: {encoder}，可选: auto, {', '.join(RECORDERS)}")
+    return RECORDERS[encoder](codec, crf)
+
+
+def capture_api(backend="auto"):
+    """
+    摄像头采集后端：Windows 用 DirectShow，Linux 用 V4L2，macOS 用 AVFoundation，其他平台用 OpenCV 默认。
+    也可以直接指定 "dshow" / "v4l2" / "avfoundation" / "any"。
+    """
+    if backend == "auto":
+        backend = {"win32": "dshow", "linux": "v4l2", "darwin": "avfoundation"}.get(sys.platform, "any")
+    return {"dshow": cv2.CAP_DSHOW, "v4l2": cv2.CAP_V4L2, "avfoundation": cv2.CAP_AVFOUNDATION,
+            "any": cv2.CAP_ANY}[backend]
+
+
 class VideoProcessor:
-    def __init__(self, camera_index=0, output_dir="video_records", fps=30, resolution=(640, 480)):
+    def __init__(self, camera_index=0, output_dir="video_records", fps=30, resolution=(640, 480),
+                 capture_backend="auto", encoder="auto", codec="h264", crf=None, queue_size=60):
         self.camera_index = camera_index
         self.output_dir = output_dir
         self.fps = fps
         self.resolution = resolution
+        self.capture_backend = capture_backend
+        self.encoder = encoder  # auto / ffmpeg / pyav / opencv
+        self.codec = codec  # h264 / vp9（opencv 后端固定 mp4v）
+        self.crf = crf  # None 时用 CODEC_OPTIONS 中的默认值
         self.cap = None  # 摄像头对象
-        self.video_writer = None  # 视频写入对象
+        self.video_writer = None  # 录制后端对象
         self.is_recording = False
         self.recording_thread = None
-        self.frames_buffer = []  # 缓存帧，用于写入视频文件
-        self.lock = threading.Lock() # 用于保护 frames_buffer 的锁
+        # 录制队列上限：编码跟不上时丢弃最旧的帧，内存占用固定，不会无限堆积
+        self.queue_size = queue_size
+        self.dropped_frames = 0
         self.thread_stop_event = threading.Event() # 用于通知写入线程停止
+        # 帧总线：采集线程把帧读进共享缓冲池后发布，录制、表情分析、预览等各自订阅，
+        # 按自己的帧率和分辨率取帧；总线同时保留单槽最新帧，旧帧直接丢弃
+        self.bus = FrameBus(max_free=queue_size + 8)
+        self.capture_thread = None
+        self.capture_stop_event = threading.Event()
 
         os.makedirs(self.output_dir, exist_ok=True)
 
@@ -33,8 +204,12 @@ class VideoProcessor:
             logging.info("摄像头已开启。")
             return True
 
-        # 使用 CAP_DSHOW 提高 Windows 兼容性
-        self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)
+        # 按平台选择采集后端（Windows 上 CAP_DSHOW 兼容性更好，Linux 上用 V4L2），失败时退回默认后端
+        api = capture_api(self.capture_backend)
+        self.cap = cv2.VideoCapture(self.camera_index, api)
+        if not self.cap.isOpened() and api != cv2.CAP_ANY:
+            logging.warning(f"采集后端 {self.capture_backend} 打开摄像头失败，改用 OpenCV 默认后端。")
+            self.cap = cv2.VideoCapture(self.camera_index)
         if not self.cap.isOpened():
             logging.error(f"无法打开摄像头 (索引: {self.camera_index})。请检查摄像头是否连接或被占用。")
             self.cap = None
@@ -51,15 +226,108 @@ class VideoProcessor:
         actual_fps = self.cap.get(cv2.CAP_PROP_FPS)
         logging.info(f"摄像头 {self.camera_index} 已开启，实际分辨率: ({actual_width}, {actual_height}), 实际帧率: {actual_fps:.2f} FPS。")
         self.resolution = (actual_width, actual_height) # 更新为实际分辨率
-        self.fps = actual_fps # 更新为实际帧率
+        if actual_fps > 0:
+            self.fps = actual_fps # 更新为实际帧率（部分驱动返回 0，此时保留设定值）
 
         return True
 
+    def start_capture(self):
+        """
+        启动后台采集线程，之后由该线程连续读取摄像头，调用方不再在自己的线程里阻塞 cap.read()。
+        帧发布到 self.bus：录制线程订阅全部帧；其他消费者用 subscribe / iter_frames / get_latest_frame 取帧。
+        返回 True 如果采集线程在运行。
+        """
+        if self.capture_thread and self.capture_thread.is_alive():
+            return True
+        if not self.cap or not self.cap.isOpened():
+            logging.error("摄像头未开启，无法启动采集线程。")
+            return False
+        self.capture_stop_event.clear()
+        self.capture_thread = threading.Thread(target=self._capture_loop, name="VideoCapture", daemon=True)
+        self.capture_thread.start()
+        logging.info("摄像头采集线程已启动。")
+        return True
+
+    def _capture_loop(self):
+        """
+        内部方法：采集线程主循环。cap.read() 本身按摄像头帧率阻塞，不再额外 sleep。
+        每帧直接读入缓冲池中的数组，稳定后不再分配新内存。
+        """
+        failures = 0
+        shape = (self.resolution[1], self.resolution[0], 3)
+        while not self.capture_stop_event.is_set():
+            buffer = self.bus.acquire_buffer(shape)
+            ret, frame = self.cap.read(buffer)
+            if frame is not buffer:
+                self.bus.pool.give_back(buffer) # 实际尺寸与设定不同，OpenCV 另行分配了数组
+            if not ret:
+                failures += 1
+                if failures == 30:
+                    logging.warning("连续 30 次无法读取摄像头帧。")
+                time.sleep(0.01)
+                continue
+            failures = 0
+            self.bus.publish(frame)
+        logging.info(f"摄像头采集线程已停止，共采集 {self.bus.published} 帧，"
+                     f"缓冲池分配 {self.bus.pool.allocated} 个数组。")
+
+    def stop_capture(self):
+        """
+        停止后台采集线程。
+        """
+        if self.capture_thread and self.capture_thread.is_alive():
+            self.capture_stop_event.set()
+            self.capture_thread.join(timeout=2)
+        self.capture_thread = None
+        self.bus.close() # 关闭全部订阅，等待新帧的消费者随之结束
+
+    def is_capturing(self):
+        return self.capture_thread is not None and self.capture_thread.is_alive()
+
+    def subscribe(self, name, max_fps=None, resolution=None, queue_size=1):
+        """
+        订阅采集到的帧，返回 frame_bus.Subscription。max_fps 限制投递帧率，resolution=(宽, 高)
+        为需要的分辨率（同一分辨率的缩放只做一次，订阅者之间共享）。取到的 FrameView 用完需 release()。
+        """
+        return self.bus.subscribe(name, max_fps=max_fps, resolution=resolution, queue_size=queue_size)
+
+    def get_latest_frame(self):
+        """
+        返回 (序号, 帧)，不等待；还没有帧时返回 (0, None)。返回的是副本，调用方可以随意修改。
+        """
+        return self.wait_for_frame(0, timeout=0)
+
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        """
+        等待序号大于 after_seq 的帧，返回 (序号, 帧副本)；超时或采集已停止时返回 (after_seq, None)。
+        返回的序号与 after_seq 之差减一即为此消费者跳过的旧帧数。
+        """
+        view = self.bus.latest(after_seq, timeout)
+        if view is None:
+            return after_seq, None
+        with view:
+            return view.seq, view.image.copy()
+
+    def iter_frames(self, max_fps=None, resolution=None):
+        """
+        按消费者自己的速率和分辨率迭代 (序号, 帧)：邮箱只保留最新一帧，两次之间的旧帧跳过而不排队。
+        帧不复制，只在本次迭代内有效，需要保留时先 copy()。采集线程停止后迭代结束。
+        """
+        sub = self.subscribe("iter_frames", max_fps=max_fps, resolution=resolution)
+        try:
+            for view in sub:
+                yield view.seq, view.image
+        finally:
+            sub.close()
+
     def capture_frame(self):
         """
         从摄像头捕获一帧。
         返回捕获到的帧 (numpy.ndarray) 或 None。
+        采集线程运行时直接返回最新帧，不阻塞。
         """
+        if self.is_capturing():
+            return self.get_latest_frame()[1]
         if self.cap and self.cap.isOpened():
             ret, frame = self.cap.read()
             if ret:
@@ -73,52 +341,51 @@ class VideoProcessor:
 
     def add_frame_to_buffer(self, frame):
         """
-        将捕获到的帧添加到缓冲区。
+        将捕获到的帧发布到帧总线（录制线程从总线取帧）。调用后该帧归总线所有，不要再修改。
+        采集线程运行时帧由它自动发布，无需再调用。
         """
-        with self.lock:
-            self.frames_buffer.append(frame)
+        self.bus.publish(frame)
 
-    def _write_frames_to_video(self, filename):
+    def _write_frames_to_video(self, filename, sub):
         """
-        内部方法：负责将缓冲区中的帧写入视频文件。
+        内部方法：负责将订阅到的帧写入视频文件。
         在新线程中运行。
         """
         file_path = os.path.join(self.output_dir, filename)
-        
-        # 定义视频编码器和 VideoWriter
-        # FourCC 是视频编解码器的4字符代码。'mp4v' 是 MPEG-4 编码。
-        # 对于 Windows，可以尝试 DIVX, XVID, MJPG, H264 等
-        # 对于跨平台兼容性，MP4V 或 H264 是不错的选择
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v') 
-        
+
         try:
-            self.video_writer = cv2.VideoWriter(file_path, fourcc, self.fps, self.resolution)
-            if not self.video_writer.isOpened():
-                logging.error(f"无法创建视频写入器或打开视频文件: {file_path}")
-                self.is_recording = False
-                self.thread_stop_event.set() # 写入失败，停止线程
-                return
-
-            logging.info(f"开始写入视频文件: {file_path}, 分辨率: {self.resolution}, 帧率: {self.fps}")
-
-            while not self.thread_stop_event.is_set() or len(self.frames_buffer) > 0:
-                with self.lock:
-                    if self.frames_buffer:
-                        frame = self.frames_buffer.pop(0)
-                        self.video_writer.write(frame)
-                    else:
-                        # 如果没有帧可写，并且还没有收到停止信号，则等待一小段时间
-                        # 这避免了在线程停止信号到达前，缓冲区恰好为空的情况
-                        if not self.thread_stop_event.is_set():
-                            time.sleep(0.01) # 短暂休眠，避免忙等待
-                
-            logging.info(f"视频写入线程停止，文件 {file_path} 已完成。")
+            self.video_writer = create_recorder(self.encoder, self.codec, self.crf)
+            self.video_writer.open(file_path, self.fps, self.resolution)
+        except Exception as e:
+            logging.error(f"无法创建视频写入器或打开视频文件: {file_path}: {e}")
+            sub.close()
+            self.video_writer = None
+            self.is_recording = False
+            self.thread_stop_event.set() # 写入失败，停止线程
+            return
+
+        try:
+            logging.info(f"开始写入视频文件: {file_path}, 分辨率: {self.resolution}, 帧率: {self.fps}, "
+                         f"后端: {self.video_writer.name}")
+            while not self.thread_stop_event.is_set() or sub.pending():
+                view = sub.get(timeout=0.1) # 没有帧时阻塞等待，不忙等
+                if view is None:
+                    if sub.closed:
+                        break # 采集已停止
+                    continue
+                with view:
+                    self.video_writer.write(view.image) # 订阅分辨率即录制分辨率，每帧尺寸一致
+            self.dropped_frames = sub.dropped
+
+            logging.info(f"视频写入线程停止，文件 {file_path} 已完成，丢弃 {self.dropped_frames} 帧。")
 
         except Exception as e:
             logging.critical(f"视频写入线程发生严重错误: {e}", exc_info=True)
         finally:
+            sub.close()
             if self.video_writer:
-                self.video_writer.release()
+                self.video_writer.close()
+                self.video_writer = None
                 logging.info("视频写入器已释放。")
             self.is_recording = False # 确保状态更新
             self.thread_stop_event.set() # 确保停止事件被设置
@@ -136,13 +403,13 @@ class VideoProcessor:
             logging.error("摄像头未开启或无法访问，无法开始录制。")
             return None
 
-        # 清空缓冲区
-        with self.lock:
-            self.frames_buffer = []
-        
+        # 在线程启动前订阅，保证开始录制之后的帧都能收到
+        sub = self.subscribe("recorder", resolution=self.resolution, queue_size=self.queue_size)
+        self.dropped_frames = 0
+
         self.thread_stop_event.clear() # 清除停止事件，准备开始新录制
         self.is_recording = True
-        self.recording_thread = threading.Thread(target=self._write_frames_to_video, args=(filename,))
+        self.recording_thread = threading.Thread(target=self._write_frames_to_video, args=(filename, sub))
         self.recording_thread.daemon = True # 设置为守护线程，主程序退出时自动终止
         self.recording_thread.start()
         logging.info(f"视频录制已启动到文件: {os.path.join(self.output_dir, filename)}")
@@ -168,6 +435,7 @@ class VideoProcessor:
         """
         停止摄像头捕获。
         """
+        self.stop_capture() # 先停采集线程，避免在 cap.read() 过程中释放摄像头
         if self.cap and self.cap.isOpened():
             self.cap.release()
             logging.info("摄像头已停止并释放。")
@@ -186,27 +454,37 @@ class VideoProcessor:
 
 # --- 示例使用 (仅用于测试 video_processor.py 自身的功能) -- 杨怡修改
 if __name__ == "__main__":
-    cam_idx = 0
-    processor = VideoProcessor(camera_index=cam_idx, resolution=(640, 480), fps=30) # 调整分辨率和帧率
+    from config import (CAMERA_INDEX, VIDEO_RESOLUTION, VIDEO_FPS, VIDEO_OUTPUT_DIR, VIDEO_CAPTURE_BACKEND,
+                        VIDEO_ENCODER, VIDEO_CODEC, VIDEO_QUEUE_SIZE)
+    processor = VideoProcessor(
+        camera_index=CAMERA_INDEX,
+        output_dir=VIDEO_OUTPUT_DIR,
+        fps=VIDEO_FPS,
+        resolution=VIDEO_RESOLUTION,
+        capture_backend=VIDEO_CAPTURE_BACKEND,
+        encoder=VIDEO_ENCODER,
+        codec=VIDEO_CODEC,
+        queue_size=VIDEO_QUEUE_SIZE
+    )
 
     video_file_path = None
     try:
         processor.start_camera()
+        processor.start_capture() # 后台采集，录制帧由采集线程直接送入录制队列
         video_file_path = processor.start_recording(filename="my_interview_test.mp4")
 
         start_time = time.time()
         duration = 10 # 录制 10 秒
 
         print(f"开始录制 {duration} 秒视频...")
-        while time.time() - start_time < duration:
-            frame = processor.capture_frame()
-            if frame is not None:
-                processor.add_frame_to_buffer(frame)
-                # 可选：实时显示帧
-                cv2.imshow('Live Camera Test', frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-            time.sleep(1 / processor.fps) # 根据实际帧率控制循环时间
+        # 预览只是一个消费者，按 15 FPS 取最新帧，显示慢了也不会拖慢采集和录制
+        for seq, frame in processor.iter_frames(max_fps=15):
+            if time.time() - start_time >= duration:
+                break
+            # 可选：实时显示帧
+            cv2.imshow('Live Camera Test', frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
 
     except Exception as e:
         logging.error(f"测试过程中发生错误: {e}", exc_info=True)
@@ -0,0 +1,405 @@
+# vision_worker.py - 视觉推理（DeepFace 表情识别等）放到独立进程，帧经共享内存环形槽位传递
+#
+# DeepFace/OpenCV 推理是 CPU 密集的 Python 代码，放在 Flask-SocketIO 进程里会和音频转发争抢 GIL。
+# VisionPool 在 Web 进程中：
+#   - 创建一块 multiprocessing.shared_memory，切成 slots 个固定大小的槽位；
+#   - 提交时把帧复制进空闲槽位，只经连接发送 (请求号, 任务, 槽位, 形状, dtype)，不 pickle 数组；
+#   - 工作进程按槽位直接映射成 numpy 数组推理，返回小字典结果，槽位随即归还；
+#   - 槽位用尽时提交方等待（背压），超时拒绝，不会无限排队。
+# 工作进程用 `python -m vision_worker` 启动并通过带 authkey 的本机连接回连，
+# 不用 multiprocessing.Process：spawn 方式会在子进程中重新执行 app_server 的模块级代码。
+import argparse
+import itertools
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import metrics
+
+VISION_SECONDS = metrics.histogram("vision_worker_seconds", "视觉推理请求从提交到返回结果的耗时", ["task"])
+VISION_INFLIGHT = metrics.gauge("vision_worker_inflight", "已提交、尚未返回结果的视觉推理请求数")
+VISION_REJECTED = metrics.counter("vision_worker_rejected", "共享内存槽位用尽而被拒绝的请求数")
+VISION_RESTARTS = metrics.counter("vision_worker_restarts", "视觉工作进程异常退出后重启的次数")
+
+_AUTHKEY_ENV = "VISION_WORKER_AUTHKEY"
+
+
+def analyze_emotion(img):
+    """
+    DeepFace 表情识别，返回 {"emotion": 主表情, "scores": {表情: 百分比}}。
+    工作进程和不启用工作进程时的 Web 进程共用这一实现。
+    """
+    from deepface import DeepFace
+    result = DeepFace.analyze(img, actions=['emotion'], enforce_detection=False)
+    if isinstance(result, list):
+        result = result[0] if result and isinstance(result[0], dict) else {}
+    if not isinstance(result, dict):
+        result = {}
+    scores = {k: round(float(v), 1) for k, v in (result.get("emotion") or {}).items()}
+    return {"emotion": result.get("dominant_emotion", "unknown"), "scores": scores}
+
+
+TASKS = {"emotion": analyze_emotion}
+
+
+class _Worker:
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = None
+        self.inflight = 0
+        self.stuck_slots = []  # 超时请求占用的槽位，进程退出后才归还（进程可能仍在读）
+        self.send_lock = threading.Lock()
+        self.ready = False
+
+
+class VisionPool:
+    """
+    视觉推理进程池。analyze(img, task) 阻塞等待结果，submit(img, task) 返回 Future。
+    工作进程退出时，其未完成的请求以异常结束，并按退避间隔重启一个新进程。
+    请求超过提交时的 timeout 仍未返回时视为进程卡住：请求以超时结束，进程被杀掉后重启，
+    它占用的槽位等进程退出后才归还。
+    启动后 startup_timeout 秒内没有连回（或连回前就退出）算一次启动失败；
+    连续 max_start_failures 次未能就绪就不再重启，所有进程都停止后提交直接失败。
+    """
+
+    def __init__(self, workers=2, slots=8, slot_bytes=1280 * 720 * 3, restart_delay=2.0,
+                 startup_timeout=60.0, max_start_failures=5):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.restart_delay = restart_delay
+        self.startup_timeout = startup_timeout
+        self.max_start_failures = max_start_failures
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self._free = list(range(slots))
+        self._slot_cond = threading.Condition()
+        self._pending = {}  # 请求号 -> (future, 槽位, 任务, 提交时间, worker, 截止时间)
+        self._lock = threading.Lock()  # 保护 _pending、worker.inflight 和下面的进程状态
+        self._ids = itertools.count(1)
+        self._workers = []
+        self._workers_cond = threading.Condition()
+        self._procs = []
+        self._starting = {}  # 已启动、尚未连回的进程：pid -> (Popen, 启动时间)
+        self._respawning = 0  # 等待退避后重启的进程数
+        self._failures = 0  # 连续异常退出次数（决定重启间隔），有请求推理成功后清零
+        self._start_failures = 0  # 连续未就绪就退出的次数，有进程就绪后清零
+        self._broken = False  # 已放弃重启且没有存活的进程
+        self._closing = False
+        self._authkey = secrets.token_bytes(16)
+        self._listener = Listener(("127.0.0.1", 0), authkey=self._authkey)
+        threading.Thread(target=self._accept_loop, name="VisionPoolAccept", daemon=True).start()
+        for _ in range(workers):
+            self._spawn()
+        threading.Thread(target=self._watchdog_loop, name="VisionPoolWatchdog", daemon=True).start()
+        VISION_INFLIGHT.set_function(lambda: len(self._pending))
+        logging.info(f"视觉推理进程池启动: {workers} 个进程，共享内存 {slots} 个槽位 × {slot_bytes} 字节")
+
+    # ---------------- 进程管理 ----------------
+
+    def _spawn(self):
+        host, port = self._listener.address
+        env = dict(os.environ, **{_AUTHKEY_ENV: self._authkey.hex()})
+        cmd = [sys.executable, "-m", "vision_worker", "--address", f"{host}:{port}", "--shm", self.shm.name,
+               "--slot-bytes", str(self.slot_bytes)]
+        popen = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        with self._lock:
+            self._procs = [p for p in self._procs if p.poll() is None]
+            self._procs.append(popen)
+            self._starting[popen.pid] = (popen, time.monotonic())
+
+    def _watchdog_loop(self):
+        """
+        检查尚未连回的进程：已退出或超过 startup_timeout 仍未连回的，算一次启动失败。
+        检查超过截止时间的请求：以超时结束，并杀掉卡住的进程（由读取线程归还槽位并重启）。
+        """
+        while not self._closing:
+            time.sleep(1.0)
+            now = time.monotonic()
+            with self._lock:
+                starting = list(self._starting.items())
+            for pid, (popen, started) in starting:
+                if popen.poll() is not None:
+                    self._startup_failed(pid, f"连回前已退出（返回码 {popen.returncode}）")
+                elif now - started > self.startup_timeout:
+                    popen.kill()
+                    self._startup_failed(pid, f"{self.startup_timeout:.0f}s 内未连回")
+            self._expire(now)
+
+    def _expire(self, now):
+        with self._lock:
+            expired = [(req_id, entry) for req_id, entry in self._pending.items() if entry[5] < now]
+            for req_id, (future, slot, task, start, worker, deadline) in expired:
+                del self._pending[req_id]
+                worker.inflight -= 1
+                worker.stuck_slots.append(slot)
+        for req_id, (future, slot, task, start, worker, deadline) in expired:
+            VISION_SECONDS.labels(task=task).observe(time.perf_counter() - start)
+            future.set_exception(TimeoutError("视觉推理超时"))
+        for worker in {entry[4] for _, entry in expired}:
+            self._kill(worker)
+
+    def _kill(self, worker):
+        """不再给卡住的进程分配请求并杀掉它，连接断开后读取线程负责清理和重启。"""
+        with self._workers_cond:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        popen = self._popen(worker.pid)
+        if popen is not None and popen.poll() is None:
+            logging.error(f"视觉工作进程 {worker.pid} 请求超时未返回，杀掉后重启。")
+            popen.kill()
+
+    def _popen(self, pid):
+        with self._lock:
+            return next((p for p in self._procs if p.pid == pid), None)
+
+    def _startup_failed(self, pid, reason):
+        with self._lock:
+            if self._starting.pop(pid, None) is None:
+                return  # 已经连回，由读取线程处理
+            self._start_failures += 1
+        logging.error(f"视觉工作进程 {pid} 启动失败: {reason}")
+        self._restart()
+
+    def _restart(self):
+        """进程退出后按退避间隔重启；连续启动失败达到上限时不再重启。"""
+        if self._closing:
+            return
+        with self._lock:
+            self._failures += 1
+            give_up = self._start_failures >= self.max_start_failures
+            delay = min(self.restart_delay * 2 ** (self._failures - 1), 60)
+            if give_up:
+                alive = any(p.poll() is None for p in self._procs)
+                broken = not alive and not self._respawning
+            else:
+                self._respawning += 1
+        if give_up:
+            logging.error(f"视觉工作进程连续 {self._start_failures} 次未能启动，不再重启。")
+            if broken:
+                with self._workers_cond:
+                    self._broken = True
+                    self._workers_cond.notify_all()
+            return
+        VISION_RESTARTS.inc()
+        logging.error(f"{delay:.1f}s 后重启视觉工作进程。")
+        timer = threading.Timer(delay, self._respawn)
+        timer.daemon = True
+        timer.start()
+
+    def _respawn(self):
+        with self._lock:
+            self._respawning -= 1
+        if not self._closing:
+            self._spawn()
+
+    def _accept_loop(self):
+        while not self._closing:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if not self._closing:
+                    logging.error(f"视觉工作进程连接失败: {e}")
+                continue
+            worker = _Worker(conn)
+            threading.Thread(target=self._read_loop, args=(worker,), name="VisionPoolReader", daemon=True).start()
+
+    def _read_loop(self, worker):
+        """接收一个工作进程的结果；连接断开说明进程退出，结束其未完成的请求并重启。"""
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            if isinstance(message, tuple) and message[0] == "hello":
+                worker.pid = message[1]
+                with self._lock:
+                    self._starting.pop(worker.pid, None)
+                continue
+            if message == "ready":
+                worker.ready = True
+                with self._lock:
+                    self._start_failures = 0
+                with self._workers_cond:
+                    self._workers.append(worker)
+                    self._workers_cond.notify_all()
+                logging.info("视觉工作进程已就绪。")
+                continue
+            req_id, result, error = message
+            if error is None:
+                self._failures = 0
+            self._finish(req_id, result, error)
+        with self._workers_cond:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        # 等进程真正退出后再归还它的槽位，避免新请求写入它仍在读取的内存
+        popen = self._popen(worker.pid)
+        if popen is not None:
+            try:
+                popen.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                popen.kill()
+                popen.wait()
+        with self._lock:
+            lost = [req_id for req_id, entry in self._pending.items() if entry[4] is worker]
+            stuck, worker.stuck_slots = worker.stuck_slots, []
+            if worker.pid is not None and not worker.ready:
+                self._start_failures += 1
+        for req_id in lost:
+            self._finish(req_id, None, "视觉工作进程已退出")
+        for slot in stuck:
+            self._release_slot(slot)
+        # 还没报告 pid 的进程仍在 _starting 中，由看门狗发现退出并重启，这里不重复处理
+        if not self._closing and worker.pid is not None:
+            logging.error(f"视觉工作进程异常退出，{len(lost)} 个请求失败。")
+            self._restart()
+
+    # ---------------- 提交与结果 ----------------
+
+    def _acquire_slot(self, timeout):
+        with self._slot_cond:
+            if not self._slot_cond.wait_for(lambda: self._free, timeout):
+                return None
+            return self._free.pop()
+
+    def _release_slot(self, slot):
+        with self._slot_cond:
+            self._free.append(slot)
+            self._slot_cond.notify()
+
+    def _pick_worker(self, timeout):
+        """选未完成请求最少的就绪进程；启动阶段（模型加载中）最多等待 timeout 秒。"""
+        with self._workers_cond:
+            if not self._workers_cond.wait_for(lambda: self._workers or self._broken, timeout) or not self._workers:
+                return None
+            return min(self._workers, key=lambda w: w.inflight)
+
+    def submit(self, img, task="emotion", timeout=5.0):
+        """
+        把帧复制进共享内存槽位并交给工作进程，返回 Future（结果为任务返回的字典）。
+        timeout 同时限制等待槽位和推理本身：发出后 timeout 秒仍未返回，请求以超时结束。
+        """
+        future = Future()
+        if img.nbytes > self.slot_bytes:
+            future.set_exception(ValueError(f"图像 {img.shape} 超过槽位大小 {self.slot_bytes} 字节"))
+            return future
+        deadline = time.monotonic() + timeout
+        worker = self._pick_worker(timeout)
+        if worker is None:
+            future.set_exception(TimeoutError("没有就绪的视觉工作进程"))
+            return future
+        slot = self._acquire_slot(max(0.0, deadline - time.monotonic()))
+        if slot is None:
+            VISION_REJECTED.inc()
+            future.set_exception(TimeoutError("视觉推理繁忙：共享内存槽位已用尽"))
+            return future
+        view = np.ndarray(img.shape, dtype=img.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = img
+        del view
+        req_id = next(self._ids)
+        with self._lock:
+            self._pending[req_id] = (future, slot, task, time.perf_counter(), worker, time.monotonic() + timeout)
+            worker.inflight += 1
+        try:
+            with worker.send_lock:
+                worker.conn.send((req_id, task, slot, img.shape, img.dtype.str))
+        except (OSError, ValueError) as e:
+            self._finish(req_id, None, f"发送到视觉工作进程失败: {e}")
+        return future
+
+    def analyze(self, img, task="emotion", timeout=5.0):
+        """提交并等待结果；超时或推理失败时抛出异常。"""
+        return self.submit(img, task, timeout).result(timeout=timeout)
+
+    def _finish(self, req_id, result, error):
+        with self._lock:
+            entry = self._pending.pop(req_id, None)
+            if entry is None:
+                return
+            future, slot, task, start, worker, deadline = entry
+            worker.inflight -= 1
+        self._release_slot(slot)
+        VISION_SECONDS.labels(task=task).observe(time.perf_counter() - start)
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def close(self):
+        self._closing = True
+        with self._workers_cond:
+            workers = list(self._workers)
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except OSError:
+                pass
+        for proc in self._procs:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self._listener.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+# ---------------- 工作进程 ----------------
+
+def _attach_shm(name):
+    """连接已有的共享内存。不交给本进程的 resource_tracker 管理，否则本进程退出时会把它删除。"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def worker_main(address, shm_name, slot_bytes):
+    shm = _attach_shm(shm_name)
+    conn = Client(address, authkey=bytes.fromhex(os.environ[_AUTHKEY_ENV]))
+    conn.send(("hello", os.getpid()))  # 让 Web 进程把连接和启动的进程对应起来
+    # 先加载模型再报告就绪，避免第一个请求承担模型加载时间
+    try:
+        analyze_emotion(np.zeros((48, 48, 3), dtype=np.uint8))
+    except Exception as e:
+        logging.warning(f"视觉工作进程预热失败: {e}")
+    conn.send("ready")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break  # Web 进程已退出
+        if message is None:
+            break
+        req_id, task, slot, shape, dtype = message
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=slot * slot_bytes)
+        try:
+            result, error = TASKS[task](image), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        del image  # 释放对共享内存的引用，之后 shm.close() 才能成功
+        conn.send((req_id, result, error))
+    conn.close()
+    shm.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="视觉推理工作进程（由 VisionPool 启动）")
+    parser.add_argument("--address", required=True, help="Web 进程监听地址 host:port")
+    parser.add_argument("--shm", required=True, help="共享内存名称")
+    parser.add_argument("--slot-bytes", type=int, required=True)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - vision_worker - %(levelname)s - %(message)s")
+    host, port = args.address.rsplit(":", 1)
+    worker_main((host, int(port)), args.shm, args.slot_bytes)
@@ -3,7 +3,14 @@ import librosa
 import numpy as np
 import logging
 import os
+import threading
 import struct # 导入 struct 模块用于处理字节数据
+from collections import deque
+import time
+import metrics
+
+ANALYZE_SECONDS = metrics.histogram("voice_analyze_seconds", "analyze_audio_features 单轮音频分析耗时")
+VAD_BYTES = metrics.counter("vad_audio_bytes", "VAD 输入及放行给 ASR 的音频字节数", ["stage"])
 
 # 注意：这里移除 logging.basicConfig，由 app.py 统一配置
 
@@ -60,6 +67,13 @@ class VoiceAnalyzer:
         快速分析WAV音频文件的语音特征。
         优化版本：只计算核心特征，避免耗时的音高检测。
         """
+        start = time.perf_counter()
+        try:
+            return self._analyze_audio_features(audio_path)
+        finally:
+            ANALYZE_SECONDS.observe(time.perf_counter() - start)
+
+    def _analyze_audio_features(self, audio_path):
         if not os.path.exists(audio_path):
             logging.error(f"音频文件不存在: {audio_path}")
             print(f"【语音分析】错误：音频文件不存在: {audio_path}")
@@ -71,7 +85,30 @@ class VoiceAnalyzer:
             # 快速加载音频文件（不重采样）
             y, sr = librosa.load(audio_path, sr=None)  # 保持原始采样率
             print(f"【语音分析】音频加载成功，采样率: {sr}, 长度: {len(y)} 样本")
+        except Exception as e:
+            logging.error(f"加载音频文件失败: {e}", exc_info=True)
+            print(f"【语音分析】加载音频文件异常: {e}")
+            return None
+        return self._analyze_waveform(y, sr)
 
+    def analyze_audio_samples(self, samples, sample_rate=None):
+        """
+        直接分析 int16 PCM 样本（如录音归档 mmap 读出的数组），不经过 WAV 文件。
+        结果与 analyze_audio_features 相同。
+        """
+        start = time.perf_counter()
+        try:
+            if samples is None or len(samples) == 0:
+                print("【语音分析】错误：没有可分析的音频样本")
+                return None
+            # 与 librosa.load 一致，归一化到 [-1, 1) 的 float32
+            y = np.asarray(samples, dtype=np.float32) / 32768.0
+            return self._analyze_waveform(y, sample_rate or self.sample_rate)
+        finally:
+            ANALYZE_SECONDS.observe(time.perf_counter() - start)
+
+    def _analyze_waveform(self, y, sr):
+        try:
             # 1. 快速计算响度 (RMS)
             # 直接计算，不使用librosa.feature.rms()避免额外开销
             rms = np.sqrt(np.mean(y**2))
@@ -224,6 +261,145 @@ class VoiceAnalyzer:
             return False
 
 
+class VoiceActivityDetector:
+    """
+    流式语音活动检测（VAD），放在 ASR 转发之前，只放行有效语音帧。
+    每个音频块按 frame_ms 切帧后向量化计算三类特征：
+      - 短时能量 (dBFS)，阈值随噪声底自适应；
+      - 过零率，用于保留能量较低的清辅音；
+      - 频谱平坦度，区分语音（谐波结构，平坦度低）与宽带噪声。
+    判定结果再经过起始确认（onset）、预录（preroll）与拖尾保持（hangover）的状态机，
+    从而裁掉首尾静音，并在语音结束时给出明确的 speech_ended 信号。
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20,
+                 energy_threshold_db=-50.0, energy_margin_db=10.0,
+                 flatness_threshold=0.5, zcr_range=(0.02, 0.35),
+                 onset_frames=3, hangover_ms=600, preroll_ms=200):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.frame_bytes = self.frame_size * 2  # int16
+        self.energy_threshold_db = energy_threshold_db
+        self.energy_margin_db = energy_margin_db
+        self.flatness_threshold = flatness_threshold
+        self.zcr_low, self.zcr_high = zcr_range
+        self.onset_frames = onset_frames
+        self.hangover_frames = max(1, int(hangover_ms / frame_ms))
+        self.preroll_frames = max(1, int(preroll_ms / frame_ms))
+        # 频谱平坦度只看 100-4000Hz 语音主频段，避免直流和高频噪声干扰
+        freqs = np.fft.rfftfreq(self.frame_size, 1.0 / sample_rate)
+        self._band_mask = (freqs >= 100) & (freqs <= 4000)
+        self._window = np.hanning(self.frame_size)
+        self.noise_floor_db = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """开始新一轮回答时重置检测状态（噪声底保留，环境一般不变）。"""
+        with self.lock:
+            self._remainder = b''
+            self._preroll = deque(maxlen=self.preroll_frames)
+            self._onset_count = 0
+            self._hangover = 0
+            self.in_speech = False
+
+    def classify_frames(self, samples):
+        """
+        对整段 int16 样本按帧判定是否为语音，返回 (is_speech, energy_db) 两个布尔/浮点数组。
+        samples 长度需为 frame_size 的整数倍。
+        """
+        frames = samples.reshape(-1, self.frame_size).astype(np.float64) / 32768.0
+        if frames.shape[0] == 0:
+            return np.zeros(0, dtype=bool), np.zeros(0)
+
+        # 1. 短时能量
+        energy = np.mean(frames ** 2, axis=1)
+        energy_db = 10 * np.log10(energy + 1e-12)
+
+        # 2. 过零率
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_size - 1)
+
+        # 3. 频谱平坦度 = 几何均值 / 算术均值
+        power = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2
+        power = power[:, self._band_mask] + 1e-12
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+        threshold_db = self.energy_threshold_db
+        if self.noise_floor_db is not None:
+            threshold_db = max(threshold_db, self.noise_floor_db + self.energy_margin_db)
+
+        loud = energy_db > threshold_db
+        voiced = flatness < self.flatness_threshold
+        fricative = (zcr > self.zcr_low) & (zcr < self.zcr_high)
+        return loud & (voiced | fricative), energy_db
+
+    def process(self, chunk):
+        """
+        处理一个原始 PCM 字节块。
+        返回 dict：
+          audio          - 需要转发给 ASR 的字节（已裁剪首尾静音，含预录和拖尾）
+          speech_started - 本块内检测到语音开始
+          speech_ended   - 本块内拖尾结束，可认为一句话说完
+          in_speech      - 处理完本块后是否仍处于语音段
+        """
+        result = {'audio': b'', 'speech_started': False, 'speech_ended': False, 'in_speech': False}
+        if not chunk:
+            result['in_speech'] = self.in_speech
+            return result
+
+        with self.lock:
+            data = self._remainder + chunk
+            usable = len(data) - len(data) % self.frame_bytes
+            self._remainder = data[usable:]
+            if usable == 0:
+                result['in_speech'] = self.in_speech
+                return result
+
+            samples = np.frombuffer(data[:usable], dtype=np.int16)
+            is_speech, energy_db = self.classify_frames(samples)
+
+            out = []
+            fb = self.frame_bytes
+            for i, speech in enumerate(is_speech):
+                frame = data[i * fb:(i + 1) * fb]
+                if self.in_speech:
+                    out.append(frame)
+                    if speech:
+                        self._hangover = self.hangover_frames
+                    else:
+                        self._hangover -= 1
+                        if self._hangover <= 0:
+                            self.in_speech = False
+                            self._onset_count = 0
+                            self._preroll.clear()
+                            result['speech_ended'] = True
+                else:
+                    self._preroll.append(frame)
+                    self._onset_count = self._onset_count + 1 if speech else 0
+                    if self._onset_count >= self.onset_frames:
+                        self.in_speech = True
+                        self._hangover = self.hangover_frames
+                        out.extend(self._preroll)
+                        self._preroll.clear()
+                        result['speech_started'] = True
+
+            # 用非语音帧更新噪声底（指数平滑）
+            silent = energy_db[~is_speech]
+            if silent.size:
+                level = float(np.median(silent))
+                if self.noise_floor_db is None:
+                    self.noise_floor_db = level
+                else:
+                    self.noise_floor_db = 0.9 * self.noise_floor_db + 0.1 * level
+
+            result['audio'] = b''.join(out)
+            result['in_speech'] = self.in_speech
+            VAD_BYTES.labels(stage="forwarded").inc(len(result['audio']))
+            VAD_BYTES.labels(stage="input").inc(usable)
+            return result
+
+
 # --- 示例使用 (仅用于测试 voice_analyzer.py 自身的功能) ---
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -0,0 +1,280 @@
+# voice_worker.py - 每轮回答的语音特征分析放到独立进程，按会话保序、总量有界
+#
+# end_answer 原来在 Socket.IO 处理函数里同步做整段 FFT 分析，转写文本要等分析完才发出。现在：
+#   - 录音照常先写入归档，只把 (段文件路径, 偏移, 长度) 发给工作进程，工作进程自己 mmap 读取，不复制样本；
+#   - 同一会话的分析串行执行，上一轮的回调完成后才开始下一轮，store 中的轮次与题号一致；不同会话并行；
+#   - 排队加执行中的请求达到 max_pending 时 submit 最多等待 timeout 秒，仍无空位则拒绝（背压）。
+# 工作进程与 vision_worker 一样用 `python -m voice_worker` 启动（原因见 vision_worker），
+# 经标准输入/输出逐行传 JSON；分析过程中的 print 输出重定向到 stderr。
+import argparse
+import json
+import logging
+import mmap
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+
+VOICE_SECONDS = metrics.histogram("voice_worker_seconds", "语音分析请求从提交到返回结果的耗时（含排队）")
+VOICE_PENDING = metrics.gauge("voice_worker_pending", "已提交、尚未完成的语音分析请求数")
+VOICE_REJECTED = metrics.counter("voice_worker_rejected", "排队已满而被拒绝的语音分析请求数")
+VOICE_RESTARTS = metrics.counter("voice_worker_restarts", "语音分析进程异常退出后重启的次数")
+
+
+def analyze_location(analyzer, path, offset, length):
+    """映射归档段文件，分析 [offset, offset + length) 字节的 int16 样本。"""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        samples = np.frombuffer(mapped, dtype=np.int16, count=length // 2, offset=offset)
+        try:
+            return analyzer.analyze_audio_samples(samples)
+        finally:
+            del samples  # 释放对映射的引用，之后 close() 才能成功
+    finally:
+        mapped.close()
+
+
+class _Job:
+    __slots__ = ("sid", "location", "callback", "future", "submitted")
+
+    def __init__(self, sid, location, callback):
+        self.sid = sid
+        self.location = location
+        self.callback = callback
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+class _Proc:
+    def __init__(self, popen):
+        self.popen = popen
+        self.job = None
+        self.ready = False
+
+
+class VoiceAnalysisPool:
+    """
+    语音分析进程池。submit(sid, location, callback) 立即返回 Future（结果为特征字典，分析失败时为 None），
+    callback(features, error) 在结果线程中按会话提交顺序调用。wait(sid) 等待某会话的分析全部完成。
+    工作进程退出后按退避间隔重启；连续 max_start_failures 次没能启动就不再重启，
+    所有进程都停止后排队中的请求以失败结束，之后的 submit 直接拒绝。
+    """
+
+    def __init__(self, workers=2, max_pending=32, sample_rate=16000, restart_delay=1.0, max_start_failures=5):
+        self.max_pending = max_pending
+        self.sample_rate = sample_rate
+        self.restart_delay = restart_delay
+        self.max_start_failures = max_start_failures
+        self._cond = threading.Condition()
+        self._sessions = {}  # sid -> deque[_Job]，队首为正在分析或等待回调的一轮
+        self._ready = deque()  # 有待分析请求、且没有进行中请求的会话，按到达顺序轮转
+        self._idle = []  # 空闲的工作进程
+        self._procs = []
+        self._pending = 0
+        self._closing = False
+        self._failures = 0  # 连续异常退出次数（决定重启间隔），有请求分析成功后清零
+        self._start_failures = 0  # 连续未就绪就退出的次数，有进程就绪后清零
+        self._broken = False  # 已放弃重启且没有存活的进程
+        self._respawning = 0  # 等待退避后重启的进程数
+        for _ in range(workers):
+            self._spawn()
+        VOICE_PENDING.set_function(lambda: self._pending)
+        logging.info(f"语音分析进程池启动: {workers} 个进程，最多 {max_pending} 个请求排队")
+
+    # ---------------- 进程管理 ----------------
+
+    def _spawn(self):
+        cmd = [sys.executable, "-m", "voice_worker", "--sample-rate", str(self.sample_rate)]
+        popen = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        proc = _Proc(popen)
+        with self._cond:
+            self._procs.append(proc)
+        threading.Thread(target=self._read_loop, args=(proc,), name="VoiceAnalysisReader", daemon=True).start()
+
+    def _read_loop(self, proc):
+        """接收一个工作进程的结果；输出结束说明进程退出，结束其进行中的请求并重启。"""
+        for line in proc.popen.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get("ready"):
+                with self._cond:
+                    proc.ready = True
+                    self._start_failures = 0
+                    self._idle.append(proc)
+                    self._dispatch()
+                logging.info("语音分析进程已就绪。")
+                continue
+            if not message.get("error"):
+                self._failures = 0
+            self._complete(proc, message.get("features"), message.get("error"))
+        proc.popen.wait()
+        with self._cond:
+            if proc in self._idle:
+                self._idle.remove(proc)
+            self._procs.remove(proc)
+            self._failures += 1
+            if not proc.ready:
+                self._start_failures += 1
+            give_up = self._start_failures >= self.max_start_failures
+            delay = min(self.restart_delay * 2 ** (self._failures - 1), 60)
+            if not give_up:
+                self._respawning += 1
+        if proc.job is not None:
+            self._complete(proc, None, f"语音分析进程已退出（返回码 {proc.popen.returncode}）", idle=False)
+        if self._closing:
+            return
+        if give_up:
+            logging.error(f"语音分析进程连续 {self._start_failures} 次未能启动，不再重启。")
+            self._check_broken()
+            return
+        logging.error(f"语音分析进程异常退出（返回码 {proc.popen.returncode}），{delay:.0f}s 后重启。")
+        VOICE_RESTARTS.inc()
+        time.sleep(delay)
+        with self._cond:
+            self._respawning -= 1
+        if not self._closing:
+            self._spawn()
+
+    def _check_broken(self):
+        """没有存活的进程时，结束所有排队中的请求（按会话内顺序回调），之后的 submit 直接拒绝。"""
+        with self._cond:
+            if self._procs or self._respawning:
+                return
+            self._broken = True
+            jobs = [job for queued in self._sessions.values() for job in queued]
+            self._sessions.clear()
+            self._ready.clear()
+            self._pending -= len(jobs)
+            self._cond.notify_all()
+        for job in jobs:
+            if job.callback is not None:
+                try:
+                    job.callback(None, "语音分析进程不可用")
+                except Exception as e:
+                    logging.error(f"语音分析回调异常: {e}", exc_info=True)
+            job.future.set_result(None)
+
+    # ---------------- 提交与调度 ----------------
+
+    def submit(self, sid, location, callback=None, timeout=1.0):
+        """
+        提交一轮分析。location 为 AudioArchive.turn_location() 的 (路径, 偏移, 长度)。
+        排队已满时最多等待 timeout 秒，仍无空位返回 None。
+        """
+        job = _Job(sid, location, callback)
+        with self._cond:
+            has_room = self._cond.wait_for(
+                lambda: self._pending < self.max_pending or self._closing or self._broken, timeout)
+            if not has_room or self._closing or self._broken:
+                VOICE_REJECTED.inc()
+                return None
+            self._pending += 1
+            jobs = self._sessions.setdefault(sid, deque())
+            jobs.append(job)
+            if len(jobs) == 1:
+                self._ready.append(sid)
+            self._dispatch()
+        return job.future
+
+    def _dispatch(self):
+        """调用方持有锁。把就绪会话的队首请求交给空闲进程。"""
+        while self._idle and self._ready:
+            job = self._sessions[self._ready.popleft()][0]
+            proc = self._idle.pop()
+            proc.job = job
+            path, offset, length = job.location
+            try:
+                proc.popen.stdin.write(json.dumps({"path": path, "offset": offset, "length": length}) + "\n")
+                proc.popen.stdin.flush()
+            except (OSError, ValueError):
+                # 进程已退出，由它的结果线程结束这个请求
+                pass
+
+    def _complete(self, proc, features, error, idle=True):
+        job, proc.job = proc.job, None
+        if job is None:
+            return
+        if idle:
+            with self._cond:
+                self._idle.append(proc)
+                self._dispatch()
+        VOICE_SECONDS.observe(time.perf_counter() - job.submitted)
+        if error:
+            logging.error(f"会话 {job.sid} 语音分析失败: {error}")
+        if job.callback is not None:
+            try:
+                job.callback(features, error)
+            except Exception as e:
+                logging.error(f"语音分析回调异常: {e}", exc_info=True)
+        job.future.set_result(features)
+        # 回调完成后才放行同一会话的下一轮，保证按提交顺序
+        with self._cond:
+            jobs = self._sessions[job.sid]
+            jobs.popleft()
+            if jobs:
+                self._ready.append(job.sid)
+            else:
+                del self._sessions[job.sid]
+            self._pending -= 1
+            self._cond.notify_all()
+            self._dispatch()
+
+    def wait(self, sid, timeout=None):
+        """等待会话已提交的分析全部完成，返回是否在 timeout 秒内完成。"""
+        with self._cond:
+            return self._cond.wait_for(lambda: sid not in self._sessions, timeout)
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            procs = list(self._procs)
+        for proc in procs:
+            try:
+                proc.popen.stdin.close()
+            except OSError:
+                pass
+        for proc in procs:
+            try:
+                proc.popen.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.popen.kill()
+
+
+# ---------------- 工作进程 ----------------
+
+def worker_main(sample_rate):
+    # 标准输出留给结果，分析代码里的 print 改写到 stderr
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    from voice_analyzer import VoiceAnalyzer
+    analyzer = VoiceAnalyzer(sample_rate=sample_rate)
+    out.write(json.dumps({"ready": True}) + "\n")
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            features, error = analyze_location(analyzer, request["path"], request["offset"], request["length"]), None
+            if features is None:
+                error = "音频分析失败"
+        except Exception as e:
+            features, error = None, f"{type(e).__name__}: {e}"
+        out.write(json.dumps({"features": features, "error": error}) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="语音分析工作进程（由 VoiceAnalysisPool 启动）")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - voice_worker - %(levelname)s - %(message)s")
+    worker_main(args.sample_rate)
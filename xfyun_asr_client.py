@@ -15,6 +15,14 @@ import threading
 import numpy as np
 import email.utils
 
+from timer_service import get_scheduler
+from log_utils import log_event
+import metrics
+
+ASR_CONNECT_SECONDS = metrics.histogram("asr_connect_seconds", "ASR WebSocket 建连耗时", ["outcome"])
+ASR_MESSAGES = metrics.counter("asr_messages", "收到的 ASR 服务端消息数", ["status"])
+ASR_AUDIO_BYTES = metrics.counter("asr_audio_sent_bytes", "发送给 ASR 的音频字节数")
+
 # 从 config.py 导入凭证
 from config import XFYUN_ASR_APPID, XFYUN_ASR_API_SECRET, XFYUN_ASR_API_KEY, ASR_FINAL_RESULT_TIMEOUT
 
@@ -23,6 +31,82 @@ ASR_HOST = "iat-api.xfyun.cn"
 ASR_PATH = "/v2/iat"
 ASR_URL = f"wss://{ASR_HOST}{ASR_PATH}"
 
+class WpgsTranscript:
+    """
+    讯飞 wpgs（动态修正）识别结果的增量拼装。
+    每条结果带句序号 sn；pgs="apd" 表示追加，pgs="rpl" 表示用本句替换 rg=[起, 止] 范围内的旧结果。
+    当前会话的结果按 sn 存放在数组中，拼接后的字符串做缓存：纯追加只做一次字符串拼接，
+    只有替换时才重新拼接。一次识别会话结束（或重新开始）时，会话文本并入已确认部分，
+    这样跨多个 VAD 分段的长回答不会丢失前面的句子。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """清空全部内容（新一轮回答开始时调用）。"""
+        self._committed_text = ""
+        self._segments = []
+        self._session_text = ""
+        self._session_dirty = False
+        self._text = None
+
+    def begin_session(self):
+        """新的识别会话开始：上一会话未确认的文本先并入已确认部分，sn 重新从头计数。"""
+        self.commit_session()
+
+    def commit_session(self):
+        """当前会话结束，将其文本并入已确认部分。"""
+        session_text = self.session_text
+        if session_text:
+            self._committed_text += session_text
+        self._segments = []
+        self._session_text = ""
+        self._session_dirty = False
+        self._text = None
+
+    def apply(self, result):
+        """应用一条识别结果（data.result），返回本条结果的文本。"""
+        # 每个词只取第一个候选
+        text = "".join(w["cw"][0].get("w", "") for w in result.get("ws", []) if w.get("cw"))
+        segments = self._segments
+        sn = result.get("sn")
+        if sn is None:
+            sn = len(segments)
+
+        if result.get("pgs") == "rpl":
+            rg = result.get("rg") or [sn, sn]
+            for i in range(max(rg[0], 0), min(rg[1], len(segments) - 1) + 1):
+                segments[i] = ""
+            self._session_dirty = True
+
+        if sn == len(segments) and not self._session_dirty:
+            # 最常见的情况：在末尾追加新句，只做增量拼接
+            segments.append(text)
+            self._session_text += text
+        else:
+            if sn >= len(segments):
+                segments.extend([""] * (sn + 1 - len(segments)))
+            segments[sn] = text
+            self._session_dirty = True
+        self._text = None
+        return text
+
+    @property
+    def session_text(self):
+        """当前识别会话的文本。"""
+        if self._session_dirty:
+            self._session_text = "".join(self._segments)
+            self._session_dirty = False
+        return self._session_text
+
+    @property
+    def text(self):
+        """全部累积文本（已确认部分 + 当前会话）。"""
+        if self._text is None:
+            self._text = self._committed_text + self.session_text
+        return self._text
+
 class XfyunASRClient:
     def __init__(self, app_id, api_key, api_secret, url=ASR_URL, host=ASR_HOST, path=ASR_PATH):
         self.app_id = app_id
@@ -41,6 +125,7 @@ class XfyunASRClient:
         self.invalid_result_received = False  # 新增：标记是否收到无效结果
         self.last_valid_result = ""  # 新增：保存最后一次有效的中间结果
         self.accumulated_result = ""  # 新增：跨停顿累积识别内容
+        self.transcript = WpgsTranscript()  # wpgs 增量拼装，accumulated_result 由它生成
 
         self.result_lock = threading.Lock()
         self.interim_result_callback = None # 中间结果回调
@@ -55,8 +140,9 @@ class XfyunASRClient:
         self.last_interim_update = time.time()
         self.interim_update_interval = 0.3  # 300ms更新一次中间结果
         self.auto_finalize_timeout = 3.0  # 3秒无新内容自动结束
-        self.auto_finalize_timer = None
-        self.auto_finalize_thread = None
+        # 自动结束截止时间交给进程共享的调度器，不再为每个中间结果新建 Timer 线程
+        self.scheduler = get_scheduler()
+        self._auto_finalize_key = ("asr_auto_finalize", id(self))
 
         logging.info("ASR 客户端初始化完成。")
 
@@ -92,15 +178,11 @@ class XfyunASRClient:
         """
         处理从WebSocket接收到的消息。
         """
-        logging.info(f"收到ASR服务端消息: {message}")
-        logging.debug(f"ASR消息长度: {len(message)}, 消息类型: {type(message)}")
+        log_event('asr.message', logging.DEBUG, rate=5, raw=message)
         
         try:
             json_message = json.loads(message) # 统一解析一次
 
-            # 调试信息，先打开观察消息结构
-            logging.debug(f"Received ASR raw message: {json_message}")
-
             code = json_message.get("code")
             sid = json_message.get("sid")
             
@@ -125,17 +207,18 @@ class XfyunASRClient:
             if "data" in json_message:
                 data = json_message["data"]
                 status = data.get("status")
+                ASR_MESSAGES.labels(status=str(status)).inc()
                 
-                # 提取识别文本
-                result_text = ""
-                if "result" in data and "ws" in data["result"]:
-                    for w in data["result"]["ws"]:
-                        if "cw" in w:
-                            for cw_item in w["cw"]:
-                                result_text += cw_item.get("w", "")
-                
-                # 调试信息：显示原始识别结果
-                logging.debug(f"ASR status={status}, result_text='{result_text}', SID={sid}")
+                with self.result_lock:
+                    # 按 wpgs 语义增量更新，result_text 为当前识别会话的完整文本
+                    if status == 0:
+                        self.transcript.begin_session()
+                    if data.get("result"):
+                        self.transcript.apply(data["result"])
+                    result_text = self.transcript.session_text
+                    self.accumulated_result = self.transcript.text
+
+                log_event('asr.result', logging.DEBUG, rate=5, status=status, sid=sid, text=result_text)
 
                 with self.result_lock:
                     if status == 0:  # 语音识别开始 (VAD 状态)
@@ -154,9 +237,8 @@ class XfyunASRClient:
                         if result_text and result_text.strip():
                             current_time = time.time()
                             
-                            # 更新结果
+                            # 更新结果（accumulated_result 已由 transcript 维护）
                             self.temp_result = result_text
-                            self.accumulated_result = result_text
                             self.last_valid_result = result_text
                             self.last_result_time = current_time
                             
@@ -166,14 +248,12 @@ class XfyunASRClient:
                             # 检查是否需要发送中间结果更新
                             if current_time - self.last_interim_update >= self.interim_update_interval:
                                 self.last_interim_update = current_time
-                                logging.debug(f"更新中间结果: {self.temp_result}")
                                 
                                 # 如果有中间结果回调，调用它
                                 if self.interim_result_callback:
                                     interim_dict = {"action": "partial", "text": self.accumulated_result, "sid": sid}
                                     self.interim_result_callback(interim_dict, self)
-                        
-                        logging.debug(f"ASR 中间结果: {self.temp_result}, SID: {sid}")
+
                     elif status == 2:  # 最终结果
                         # 最终结果处理逻辑
                         if result_text and result_text.strip():
@@ -181,11 +261,8 @@ class XfyunASRClient:
                             self.final_result = result_text
                             logging.info(f"使用最终结果: {self.final_result}")
                         else:
-                            # 如果最终结果为空，使用累积的中间结果
-                            if self.accumulated_result and self.accumulated_result.strip():
-                                self.final_result = self.accumulated_result
-                                logging.info(f"使用累积中间结果作为最终结果: {self.final_result}")
-                            elif self.temp_result and self.temp_result.strip():
+                            # 如果最终结果为空，使用当前中间结果
+                            if self.temp_result and self.temp_result.strip():
                                 self.final_result = self.temp_result
                                 logging.info(f"使用当前中间结果作为最终结果: {self.final_result}")
                             else:
@@ -210,6 +287,7 @@ class XfyunASRClient:
                         logging.info(f"ASR客户端：final_result_received_event已设置，等待ASR结果处理线程处理")
                         self.is_receiving_final_result = False # 最终结果处理完毕
                         self.session_active.clear() # 标记会话结束
+                        self.transcript.commit_session() # 本会话文本并入累积结果，下个会话 sn 重新计数
 
                         # 如果有最终结果回调，调用它
                         if self.callback:
@@ -262,6 +340,7 @@ class XfyunASRClient:
             logging.info("ASR 客户端已连接。")
             return True
 
+        connect_start = time.perf_counter()
         try:
             auth_url = self._create_auth_url()
             self.ws = websocket.WebSocketApp(auth_url,
@@ -276,6 +355,7 @@ class XfyunASRClient:
             for _ in range(30): # 最多等待 3 秒
                 if self.is_connected:
                     logging.info("ASR client connected successfully.")
+                    ASR_CONNECT_SECONDS.labels(outcome="ok").observe(time.perf_counter() - connect_start)
                     return True
                 time.sleep(0.1)
             else:
@@ -283,6 +363,7 @@ class XfyunASRClient:
                 raise RuntimeError("ASR client failed to connect within timeout.")
         except Exception as e:
             logging.error(f"ASR连接异常: {e}", exc_info=True)
+            ASR_CONNECT_SECONDS.labels(outcome="error").observe(time.perf_counter() - connect_start)
             raise  # 直接抛出异常
 
     def send_end_frame(self):
@@ -291,10 +372,11 @@ class XfyunASRClient:
         """
         self.send_audio(b'', status=2)
 
-    def send_audio(self, audio_data, status=1):
+    def send_audio(self, audio_data, status=1, encoding="raw"):
         """
         发送音频数据到 ASR 服务器。
         status: 0-开始，1-音频中，2-结束
+        encoding: "raw" 为 16k PCM；"speex-wb" 为前端直通的压缩帧（每帧前 1 字节长度）
         """
         if not self.is_connected:
             logging.warning("ASR 客户端未连接，尝试重新连接...", exc_info=True)
@@ -315,7 +397,8 @@ class XfyunASRClient:
                     self.final_result = ""
                     self.temp_result = ""
                     self.last_valid_result = ""  # 重置最后一次有效结果
-                    self.accumulated_result = "" # 重置累积结果
+                    # 累积结果不在这里清空：同一回答可能跨多个识别会话，由 start_accumulate 统一重置
+                    self.transcript.begin_session()
                 self.final_result_received_event.clear() # 清除之前的事件状态
                 self.session_active.set() # 标记会话开始
                 self.is_receiving_final_result = True # 标记正在等待最终结果
@@ -338,33 +421,24 @@ class XfyunASRClient:
                 "data": {
                     "status": status,
                     "format": "audio/L16;rate=16000",
-                    "encoding": "raw",
+                    "encoding": encoding,
                     "audio": base64.b64encode(audio_data).decode('utf-8')
                 }
             }
-            # 增强日志：每帧发送时打印帧长度、status、时间戳
-            logging.debug(f"ASR发送音频帧: 长度={len(audio_data)}, status={status}, 时间={time.strftime('%H:%M:%S', time.localtime())}")
-            
-            # 添加调试信息：检查WebSocket连接状态
-            if self.ws and hasattr(self.ws, 'sock') and self.ws.sock:
-                if hasattr(self.ws.sock, 'connected') and self.ws.sock.connected:
-                    logging.debug(f"ASR WebSocket连接状态正常，准备发送数据")
-                else:
-                    logging.warning(f"ASR WebSocket连接状态异常: connected={getattr(self.ws.sock, 'connected', 'unknown')}", exc_info=True)
-            else:
-                logging.warning(f"ASR WebSocket对象异常: ws={self.ws}, sock={getattr(self.ws, 'sock', None)}", exc_info=True)
+            payload = json.dumps(data)
+            ASR_AUDIO_BYTES.inc(len(audio_data))
+            log_event('asr.send_audio', logging.DEBUG, rate=2, bytes=len(audio_data), status=status, payload_bytes=len(payload))
             
             # 检查WebSocket连接状态并发送数据
             if self.ws and hasattr(self.ws, 'sock') and self.ws.sock and self.ws.sock.connected:
-                self.ws.send(json.dumps(data))
-                logging.debug(f"ASR数据发送成功，status={status}, 数据长度={len(json.dumps(data))}")
+                self.ws.send(payload)
             else:
                 logging.warning("ASR WebSocket连接已断开，无法发送音频数据。", exc_info=True)
                 self.is_connected = False
                 try:
                     self.connect()
                     if self.is_connected and self.ws and hasattr(self.ws, 'sock') and self.ws.sock and self.ws.sock.connected:
-                        self.ws.send(json.dumps(data))
+                        self.ws.send(payload)
                         logging.info("ASR重连成功，音频数据已发送")
                     else:
                         logging.error("ASR重连失败，无法发送音频数据", exc_info=True)
@@ -406,6 +480,7 @@ class XfyunASRClient:
 
     def start_accumulate(self):
         with self.result_lock:
+            self.transcript.reset()
             self.accumulated_result = ""
 
     def get_accumulated_result(self):
@@ -444,9 +519,8 @@ class XfyunASRClient:
         """
         关闭WebSocket连接。
         """
-        # 取消定时器
-        if hasattr(self, 'auto_finalize_timer') and self.auto_finalize_timer:
-            self.auto_finalize_timer.cancel()
+        # 取消自动结束任务
+        self.scheduler.cancel(self._auto_finalize_key)
         
         logging.info("Closing ASR WebSocket...")
         if self.ws and hasattr(self.ws, 'sock') and self.ws.sock and self.ws.sock.connected:
@@ -457,13 +531,8 @@ class XfyunASRClient:
         logging.info("ASR client closed.")
 
     def _reset_auto_finalize_timer(self):
-        """重置自动结束定时器"""
-        if hasattr(self, 'auto_finalize_timer') and self.auto_finalize_timer:
-            self.auto_finalize_timer.cancel()
-        
-        self.auto_finalize_timer = threading.Timer(self.auto_finalize_timeout, self._auto_finalize)
-        self.auto_finalize_timer.daemon = True
-        self.auto_finalize_timer.start()
+        """重置自动结束截止时间（共享调度器中顺延，不创建线程）"""
+        self.scheduler.schedule(self._auto_finalize_key, self.auto_finalize_timeout, self._auto_finalize)
 
     def _auto_finalize(self):
         """自动结束当前识别会话"""
@@ -480,18 +549,6 @@ class XfyunASRClient:
                 self.callback(final_dict, self)
 
     def _start_auto_finalize_monitor(self):
-        """启动自动结束监控线程"""
-        def monitor():
-            while self.session_active.is_set():
-                current_time = time.time()
-                if current_time - self.last_result_time > self.auto_finalize_timeout:
-                    if self.accumulated_result.strip():
-                        self._auto_finalize()
-                    break
-                time.sleep(0.5)  # 每500ms检查一次
-        
-        if hasattr(self, 'auto_finalize_thread') and self.auto_finalize_thread and self.auto_finalize_thread.is_alive():
-            return
-        
-        self.auto_finalize_thread = threading.Thread(target=monitor, daemon=True)
-        self.auto_finalize_thread.start()
\ No newline at end of file
+        """确保自动结束任务已登记（兼容旧调用，不再启动轮询线程）"""
+        if not self.scheduler.is_scheduled(self._auto_finalize_key):
+            self._reset_auto_finalize_timer()
@@ -0,0 +1,264 @@
+# xfyun_lfasr_client.py - 讯飞录音文件转写（LFASR v2）客户端：上传整段录音、查询转写结果
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import metrics
+from timer_service import DeadlineScheduler
+
+LFASR_REQUESTS = metrics.counter("lfasr_requests", "录音文件转写接口调用次数", ["api", "outcome"])
+LFASR_POLLS = metrics.counter("lfasr_polls", "转写订单轮询次数", ["result"])
+LFASR_PENDING = metrics.gauge("lfasr_pending_orders", "等待转写完成的订单数")
+
+# orderInfo.status 取值
+STATUS_CREATED = 0
+STATUS_PROCESSING = 3
+STATUS_DONE = 4
+STATUS_FAILED = -1
+
+
+class LfasrError(Exception):
+    """转写接口返回失败或订单转写失败。"""
+
+
+class LfasrTimeout(LfasrError):
+    """订单在限定时间内没有转写完成。"""
+
+
+class XfyunFileASRClient:
+    """
+    录音文件转写客户端。每次请求单独计算 ts 和 signa（签名有时效，不能在长时间轮询中复用），
+    通过 requests.Session 复用连接。
+    """
+
+    def __init__(self, appid, secret_key,
+                 upload_url="https://raasr.xfyun.cn/v2/api/upload",
+                 get_result_url="https://raasr.xfyun.cn/v2/api/getResult",
+                 session=None, timeout=30):
+        self.appid = appid
+        self.secret_key = secret_key
+        self.upload_url = upload_url
+        self.get_result_url = get_result_url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def get_signa(self, ts):
+        base_string = self.appid + str(ts)
+        md5 = hashlib.md5()
+        md5.update(base_string.encode('utf-8'))
+        md5_str = md5.hexdigest()
+        signa = hmac.new(self.secret_key.encode('utf-8'), md5_str.encode('utf-8'), digestmod='sha1').digest()
+        signa = base64.b64encode(signa).decode('utf-8')
+        return signa
+
+    def _signed_params(self, **params):
+        ts = int(time.time())
+        params.update(appId=self.appid, ts=ts, signa=self.get_signa(ts))
+        return params
+
+    @staticmethod
+    def _check(api, res):
+        if res.get("code") != "000000":
+            LFASR_REQUESTS.labels(api=api, outcome="error").inc()
+            raise LfasrError(f"{api} 失败: code={res.get('code')} {res.get('descInfo')}")
+        LFASR_REQUESTS.labels(api=api, outcome="ok").inc()
+        return res.get("content") or {}
+
+    def upload_audio(self, file_path, language="cn", duration_ms=None, retries=0):
+        """
+        上传录音文件，返回 (orderId, 预计转写耗时秒数)。文件以流的方式发送，不整体读入内存。
+        失败时抛出 LfasrError 或 requests 异常。
+        """
+        with open(file_path, "rb") as f:
+            return self.upload_stream(f, os.path.basename(file_path), os.path.getsize(file_path),
+                                      language=language, duration_ms=duration_ms, retries=retries)
+
+    def upload_stream(self, stream, file_name, file_size, language="cn", duration_ms=None, retries=0,
+                      retry_interval=2.0):
+        """
+        上传可 seek 的文件对象（如 AudioArchive.open_wav() 的返回值），返回 (orderId, 预计转写耗时秒数)。
+        网络异常时 seek(0) 重新发送，最多重试 retries 次，间隔按 retry_interval 指数退避；
+        接口返回的业务错误（LfasrError）不重试。
+        """
+        for attempt in range(retries + 1):
+            stream.seek(0)
+            # 每次尝试重新签名，重试间隔较长时旧签名可能已失效
+            params = self._signed_params(fileName=file_name, fileSize=file_size,
+                                         duration=int(duration_ms or 1), language=language)
+            try:
+                response = self.session.post(self.upload_url, params=params, data=stream, timeout=self.timeout,
+                                             headers={"Content-Type": "application/octet-stream"})
+                break
+            except requests.RequestException as e:
+                LFASR_REQUESTS.labels(api="upload", outcome="retry" if attempt < retries else "error").inc()
+                if attempt >= retries:
+                    raise
+                delay = retry_interval * 2 ** attempt
+                logging.warning(f"录音文件 {file_name} 上传中断（第{attempt + 1}次），{delay:.0f}s 后重传: {e}")
+                time.sleep(delay)
+        content = self._check("upload", response.json())
+        order_id = content.get("orderId")
+        if not order_id:
+            raise LfasrError(f"upload 返回缺少 orderId: {content}")
+        estimate = (content.get("taskEstimateTime") or 0) / 1000.0
+        logging.info(f"录音文件已上传: {file_name}（{file_size} 字节），orderId={order_id}，预计 {estimate:.0f}s")
+        return order_id, estimate
+
+    def query(self, order_id):
+        """
+        查询一次转写状态，不等待。返回 dict：
+        status（见 STATUS_*）、estimate（剩余预计秒数）、sentences（完成时的分句列表）。
+        """
+        params = self._signed_params(orderId=order_id, resultType="transfer")
+        response = self.session.post(self.get_result_url, params=params, timeout=self.timeout)
+        content = self._check("getResult", response.json())
+        info = content.get("orderInfo") or {}
+        status = info.get("status", STATUS_PROCESSING)
+        result = {"order_id": order_id, "status": status,
+                  "estimate": (content.get("taskEstimateTime") or 0) / 1000.0, "sentences": []}
+        if status == STATUS_DONE:
+            result["sentences"] = parse_order_result(content.get("orderResult"))
+        elif status == STATUS_FAILED:
+            raise LfasrError(f"订单 {order_id} 转写失败: failType={info.get('failType')}")
+        return result
+
+    def get_result(self, order_id, estimate=0.0, timeout=1800, min_interval=2.0, max_interval=30.0):
+        """
+        阻塞等待转写完成，返回分句列表；超时返回 None。
+        轮询间隔自适应：按服务端预计耗时的一半开始，之后每次放大 1.5 倍，限制在 [min_interval, max_interval]。
+        """
+        deadline = time.monotonic() + timeout
+        interval = min(max(estimate / 2, min_interval), max_interval)
+        while time.monotonic() + interval < deadline:
+            time.sleep(interval)
+            result = self.query(order_id)
+            if result["status"] == STATUS_DONE:
+                return result["sentences"]
+            interval = next_poll_interval(interval, result["estimate"], min_interval, max_interval)
+        logging.warning(f"订单 {order_id} 转写超时（{timeout}s）")
+        return None
+
+
+def next_poll_interval(interval, estimate, min_interval, max_interval):
+    """下一次轮询间隔：服务端给出剩余预计时间时按其一半，否则在上次基础上放大 1.5 倍。"""
+    if estimate > 0:
+        return min(max(estimate / 2, min_interval), max_interval)
+    return min(max(interval * 1.5, min_interval), max_interval)
+
+
+def parse_order_result(order_result):
+    """
+    解析 orderResult（JSON 字符串）为分句列表：[{"begin_ms", "end_ms", "text"}]，按开始时间排序。
+    """
+    if not order_result:
+        return []
+    data = json.loads(order_result) if isinstance(order_result, str) else order_result
+    sentences = []
+    for item in data.get("lattice") or []:
+        best = item.get("json_1best")
+        best = json.loads(best) if isinstance(best, str) else (best or {})
+        st = best.get("st") or {}
+        words = []
+        for rt in st.get("rt") or []:
+            for ws in rt.get("ws") or []:
+                for cw in (ws.get("cw") or [])[:1]:
+                    words.append(cw.get("w", ""))
+        text = "".join(words).strip()
+        if text:
+            sentences.append({"begin_ms": int(st.get("bg", 0)), "end_ms": int(st.get("ed", 0)), "text": text})
+    sentences.sort(key=lambda s: s["begin_ms"])
+    return sentences
+
+
+class LfasrPoller:
+    """
+    转写订单轮询服务。所有订单按下一次轮询时间放在同一个最小堆里（timer_service.DeadlineScheduler），
+    由一个线程依次查询：到期的订单查询一次，未完成则按自适应间隔重新入堆。
+    几百个进行中的订单也只占一个线程和连接池里的少量连接，调用方不再阻塞等待。
+    callback(order_id, sentences, error) 在轮询线程中调用，应尽快返回：
+    完成时 sentences 为分句列表、error 为 None；失败时 sentences 为 None、error 为异常对象（超时为 LfasrTimeout）。
+    """
+
+    def __init__(self, client, min_interval=2.0, max_interval=30.0, timeout=1800, max_errors=5, scheduler=None):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.max_errors = max_errors
+        # 独立的调度线程：轮询是网络请求，不能占用共享调度器里 ASR 截止时间等短回调的线程
+        self.scheduler = scheduler or DeadlineScheduler(name="LfasrPoller")
+        self._orders = {}
+        self._lock = threading.Lock()
+        LFASR_PENDING.set_function(self.pending_count)
+
+    def watch(self, order_id, callback, estimate=0.0):
+        """开始跟踪订单，首次查询时间按服务端预计耗时的一半。"""
+        interval = min(max(estimate / 2, self.min_interval), self.max_interval)
+        with self._lock:
+            self._orders[order_id] = {"callback": callback, "interval": interval, "errors": 0,
+                                      "deadline": time.monotonic() + self.timeout}
+        self._schedule(order_id, interval)
+
+    def cancel(self, order_id):
+        with self._lock:
+            self._orders.pop(order_id, None)
+        self.scheduler.cancel(("lfasr", order_id))
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._orders)
+
+    def _schedule(self, order_id, delay):
+        self.scheduler.schedule(("lfasr", order_id), delay, lambda: self._poll(order_id))
+
+    def _finish(self, order_id, sentences, error):
+        with self._lock:
+            order = self._orders.pop(order_id, None)
+        if order is None:
+            return
+        try:
+            order["callback"](order_id, sentences, error)
+        except Exception as e:
+            logging.error(f"订单 {order_id} 完成回调异常: {e}", exc_info=True)
+
+    def _poll(self, order_id):
+        with self._lock:
+            order = self._orders.get(order_id)
+        if order is None:
+            return
+        try:
+            result = self.client.query(order_id)  # 每次查询重新签名
+        except LfasrError as e:
+            LFASR_POLLS.labels(result="failed").inc()
+            self._finish(order_id, None, e)
+            return
+        except Exception as e:
+            # 网络异常：退避后重试，连续失败过多才放弃
+            LFASR_POLLS.labels(result="error").inc()
+            order["errors"] += 1
+            if order["errors"] >= self.max_errors:
+                self._finish(order_id, None, LfasrError(f"查询连续失败 {order['errors']} 次: {e}"))
+                return
+            order["interval"] = min(order["interval"] * 2, self.max_interval)
+            logging.warning(f"订单 {order_id} 查询异常（第{order['errors']}次），{order['interval']:.0f}s 后重试: {e}")
+            self._schedule(order_id, order["interval"])
+            return
+        order["errors"] = 0
+        if result["status"] == STATUS_DONE:
+            LFASR_POLLS.labels(result="done").inc()
+            self._finish(order_id, result["sentences"], None)
+            return
+        LFASR_POLLS.labels(result="pending").inc()
+        if time.monotonic() >= order["deadline"]:
+            self._finish(order_id, None, LfasrTimeout(f"订单 {order_id} 转写超时（{self.timeout}s）"))
+            return
+        order["interval"] = next_poll_interval(order["interval"], result["estimate"],
+                                               self.min_interval, self.max_interval)
+        self._schedule(order_id, order["interval"])
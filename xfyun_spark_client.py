@@ -2,6 +2,16 @@
 import requests
 import json
 import logging
+import time
+from log_utils import log_event
+import metrics
+from tracing import tracer, current_span
+
+SPARK_CALL_SECONDS = metrics.histogram(
+    "spark_call_seconds", "星火 send_message 端到端耗时（含重试）", ["endpoint", "outcome"])
+SPARK_HTTP_SECONDS = metrics.histogram(
+    "spark_http_request_seconds", "星火单次 HTTP 请求耗时", ["endpoint", "status"])
+SPARK_RETRIES = metrics.counter("spark_retries", "星火请求重试次数", ["endpoint"])
 
 try:
     from config import SPARK_HTTP_API_PASSWORD, SPARK_MODEL_VERSION
@@ -17,15 +27,30 @@ class SparkClient:
     """
     讯飞星火大模型HTTP API客户端，仅支持APIpassword认证
     """
-    def __init__(self, api_password, model_version="x1"):
+    def __init__(self, api_password, model_version="x1",
+                 api_url="https://spark-api-open.xf-yun.com/v2/chat/completions"):
         self.api_password = api_password
         self.model_version = model_version
-        self.api_url = "https://spark-api-open.xf-yun.com/v2/chat/completions"
+        self.api_url = api_url
         logging.info(f"星火大模型客户端初始化完成，模型版本: {model_version}")
         self.messages = []
 
-    def send_message(self, messages, max_retries=3):
-        logging.error(f"进入Spark send_message，收到消息: {messages}")
+    def send_message(self, messages, max_retries=3, endpoint="chat"):
+        """
+        发送对话消息并返回模型回复文本，失败返回 None。
+        endpoint 只用于指标打点，标识调用方（如 interview_question、interview_evaluation）。
+        """
+        start = time.perf_counter()
+        with tracer.span("spark.send_message", endpoint=endpoint) as span:
+            content = self._send_message(messages, max_retries, endpoint)
+            outcome = "ok" if content else "error"
+            span.set_attribute("outcome", outcome)
+        SPARK_CALL_SECONDS.labels(endpoint=endpoint, outcome=outcome).observe(time.perf_counter() - start)
+        return content
+
+    def _send_message(self, messages, max_retries, endpoint):
+        log_event('spark.request', logging.INFO, messages=len(messages),
+                  chars=sum(len(m.get("content", "")) for m in messages))
         if not self.api_password:
             logging.error("API密码不能为空。请检查 config.py。")
             return None
@@ -44,9 +69,13 @@ class SparkClient:
                 }
 
                 logging.debug(f"使用Bearer Token认证，第{attempt+1}次尝试")
-                logging.warning(f"发送到星火大模型的请求: {json.dumps(payload, ensure_ascii=False)}")
+                log_event('spark.payload', logging.DEBUG, attempt=attempt + 1, payload=payload)
                 
+                if attempt > 0:
+                    SPARK_RETRIES.labels(endpoint=endpoint).inc()
+                    current_span().add_event("retry", attempt=attempt + 1)
                 # 添加重试和更长的超时时间
+                request_start = time.perf_counter()
                 response = requests.post(
                      self.api_url,
                      headers=headers,
@@ -54,16 +83,18 @@ class SparkClient:
                      timeout=90,  # 进一步增加超时时间
                      verify=True   # 确保SSL验证
                  )
-                logging.debug(f"星火大模型原始响应: {response.text}")
+                SPARK_HTTP_SECONDS.labels(endpoint=endpoint, status=str(response.status_code)).observe(
+                    time.perf_counter() - request_start)
+                log_event('spark.response', logging.DEBUG, status=response.status_code, bytes=len(response.content))
                 
                 if response.status_code == 200:
                     result = response.json()
-                    logging.debug(f"星火大模型响应: {json.dumps(result, ensure_ascii=False)}")
+                    log_event('spark.response_body', logging.DEBUG, body=result)
                     if "choices" in result and len(result["choices"]) > 0:
                         choice = result["choices"][0]
                         if "message" in choice and "content" in choice["message"]:
                             content = choice["message"]["content"]
-                            logging.info(f"Spark send_message返回: {content}")
+                            log_event('spark.reply', logging.INFO, chars=len(content))
                             return content
                         else:
                             logging.error(f"星火大模型响应格式错误，缺少message或content字段: {choice}")
@@ -76,7 +107,6 @@ class SparkClient:
                     logging.error(f"原始响应文本: {response.text}")
                     if attempt < max_retries - 1:
                         logging.info(f"等待2秒后重试...")
-                        import time
                         time.sleep(2)
                         continue
                     return None
@@ -85,7 +115,6 @@ class SparkClient:
                 logging.error(f"请求超时 (第{attempt+1}次): {e}")
                 if attempt < max_retries - 1:
                     logging.info(f"等待3秒后重试...")
-                    import time
                     time.sleep(3)
                     continue
                 return None
@@ -93,7 +122,6 @@ class SparkClient:
                 logging.error(f"网络请求异常 (第{attempt+1}次): {e}")
                 if attempt < max_retries - 1:
                     logging.info(f"等待2秒后重试...")
-                    import time
                     time.sleep(2)
                     continue
                 return None
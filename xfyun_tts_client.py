@@ -16,6 +16,12 @@ import traceback
 import wave
 import os
 from dateutil.tz import tzlocal
+from log_utils import log_event
+import metrics
+from tracing import tracer, NOOP_SPAN
+
+TTS_FIRST_BYTE_SECONDS = metrics.histogram("tts_first_byte_seconds", "TTS 请求发送到收到首个音频块的耗时")
+TTS_SYNTHESIZE_SECONDS = metrics.histogram("tts_synthesize_seconds", "synthesize_and_play 合成并播放的总耗时", ["outcome"])
 
 # 注意：这里移除 logging.basicConfig，由 app.py 统一配置
 
@@ -73,6 +79,8 @@ class XfyunTTSClient:
         self.play_stop_event = threading.Event() # 用于停止播放线程
         self.audio_stream_closed = threading.Event() # 新增：标记音频流是否真正关闭
         self.playback_finished_event = threading.Event()
+        self._request_sent_at = None  # 最近一次合成请求的发送时间，用于统计首包耗时
+        self._trace_span = NOOP_SPAN  # 当前合成请求所属的 span，供回调线程记录事件
 
         # 保存传递进来的锁
         self.tts_current_playing_lock = tts_current_playing_lock if tts_current_playing_lock is not None else threading.Lock()
@@ -143,6 +151,11 @@ class XfyunTTSClient:
 
             if data:
                 if data.get("audio"):
+                    if self._request_sent_at is not None:
+                        TTS_FIRST_BYTE_SECONDS.observe(time.perf_counter() - self._request_sent_at)
+                        self._request_sent_at = None
+                        # WebSocket 回调线程没有调用方的上下文，用保存下来的 span 记录首包时间
+                        self._trace_span.add_event("tts.first_audio")
                     audio_data = base64.b64decode(data["audio"])
                     with self.audio_buffer_lock:
                         self.audio_buffer.append(audio_data)
@@ -257,7 +270,7 @@ class XfyunTTSClient:
                     break
                 try:
                     self.stream.write(chunk)
-                    logging.info(f"TTS播放线程：写入音频块 {len(chunk)} bytes")
+                    log_event('tts.play_chunk', logging.DEBUG, rate=1, bytes=len(chunk))
                 except Exception as e:
                     logging.error(f"TTS音频播放错误: {e}")
                     break
@@ -287,6 +300,18 @@ class XfyunTTSClient:
         合成并播放文本，返回播放是否成功。
         支持长文本分段合成和智能重连。
         """
+        start = time.perf_counter()
+        with tracer.span("tts.synthesize", chars=len(text)) as span:
+            self._trace_span = span
+            try:
+                success = self._synthesize_and_play(text)
+            finally:
+                self._trace_span = NOOP_SPAN
+            span.set_attribute("outcome", "ok" if success else "error")
+        TTS_SYNTHESIZE_SECONDS.labels(outcome="ok" if success else "error").observe(time.perf_counter() - start)
+        return success
+
+    def _synthesize_and_play(self, text):
         logging.info(f"开始合成文本: '{text}'")
         self.is_speaking.set()
         self.audio_stream_closed.clear()
@@ -339,11 +364,13 @@ class XfyunTTSClient:
                 
                 # 发送请求
                 try:
+                    self._request_sent_at = time.perf_counter()
                     self.ws.send(json.dumps(request_data))
                     logging.info(f"TTS 文本合成请求已发送 (第{i+1}段)。")
                 except websocket._exceptions.WebSocketConnectionClosedException:
                     logging.error("TTS WebSocket连接已关闭，尝试重连...")
                     if self.connect():
+                        self._request_sent_at = time.perf_counter()
                         self.ws.send(json.dumps(request_data))
                         logging.info(f"TTS重连后文本合成请求已发送 (第{i+1}段)。")
                     else: